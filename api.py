@@ -6,22 +6,136 @@
 	docs url: https://oldschool.runescape.wiki/w/RuneScape:Real-time_Prices#Latest_price_(all_items)
 '''
 
+import asyncio
 import requests
+from urllib3.util import make_headers
 from pathlib import Path
 from datetime import datetime, timedelta, timezone
-import json
 import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from itemindex import indexForMapping
+from namesearch import nameIndexForMapping
+from ratelimit import sharedLimiter
+from snapshotstore import FileSnapshotStore, serializerFor
+from columnar import LATEST_COLUMNS, AVERAGE_COLUMNS, SnapshotArrays, openColumnar, writeColumnar
+from history import HistoryStore
+from sqlitestore import SqliteSnapshotStore
+
+# every snapshot we keep on disk
+#   route   - api route it is fetched from
+#   pathAttr / attr - Geapi attributes holding the file path and the parsed snapshot
+#   key     - key the payload is stored under in the snapshot file
+#   ttl     - seconds before the snapshot is considered stale (upper bound when bucketed)
+#   bucket  - width of the server side averaging bucket, None for continuously updated data
+#   columns - fields written to the mmap-able columnar copy (columnar.py), None for no copy
+#   label   - used for the request log line
+SNAPSHOTS = {
+	"mapping": {
+		"route": "/mapping", "pathAttr": "mappingCachePath", "attr": "itemMapping",
+		"key": "items", "ttl": 24 * 60 * 60, "bucket": None, "label": "MAPPING",
+		"columns": None
+	},
+	"latest": {
+		"route": "/latest", "pathAttr": "latestSnapshotPath", "attr": "latestSnapshot",
+		"key": "data", "ttl": 5 * 60, "bucket": None, "label": "LATEST ALL",
+		"columns": LATEST_COLUMNS
+	},
+	"fiveMinAve": {
+		"route": "/5m", "pathAttr": "fiveMinAveSnapshotPath", "attr": "fiveMinAveSnapshot",
+		"key": "data", "ttl": 5 * 60, "bucket": 5 * 60, "label": "FIVE MIN AVE",
+		"columns": AVERAGE_COLUMNS
+	},
+	"oneHourAve": {
+		"route": "/1h", "pathAttr": "oneHourAveSnapshotPath", "attr": "oneHourAveSnapshot",
+		"key": "data", "ttl": 60 * 60, "bucket": 60 * 60, "label": "ONE HOUR AVE",
+		"columns": AVERAGE_COLUMNS
+	},
+	"sixHourAve": {
+		"route": "/6h", "pathAttr": "sixHourAveSnapshotPath", "attr": "sixHourAveSnapshot",
+		"key": "data", "ttl": 6 * 60 * 60, "bucket": 6 * 60 * 60, "label": "SIX HOUR AVE",
+		"columns": AVERAGE_COLUMNS
+	},
+	"oneDayAve": {
+		"route": "/24h", "pathAttr": "oneDayAveSnapshotPath", "attr": "oneDayAveSnapshot",
+		"key": "data", "ttl": 24 * 60 * 60, "bucket": 24 * 60 * 60, "label": "24 HOUR AVE",
+		"columns": AVERAGE_COLUMNS
+	},
+}
+
+# runs the blocking half of concurrent fetches. asyncio's default executor is sized by
+# cpu count, which would serialize network waits on small machines
+_fetchExecutor = ThreadPoolExecutor(max_workers=len(SNAPSHOTS), thread_name_prefix="GeapiFetch")
+
+# plans when each snapshot should next be fetched.
+#
+# the 5m/1h/6h/24h averages only change when the server publishes a new bucket. the
+# payload's "timestamp" is the start of the newest complete bucket, so the next one
+# can't exist before timestamp + 2 * bucket. we fetch shortly after that instead of
+# on a fixed TTL from retrieved_at, and if the server hasn't published yet (same
+# timestamp came back) we retry on a short, growing window.
+class RefreshPlanner:
+
+	PUBLISH_DELAY = 15 # seconds after a bucket closes before we expect it to be served
+	RETRY_SECONDS = 15 # first retry window when a bucket is late, doubles per retry
+
+	def nextRefreshAt(self, name, snapshot):
+		spec = SNAPSHOTS[name]
+		retrievedAt = snapshot["retrieved_at"]
+
+		bucket = spec["bucket"]
+		timestamp = snapshot.get("timestamp")
+
+		# no server timestamp (continuous data or an older snapshot file) -> plain TTL
+		if not bucket or not isinstance(timestamp, int):
+			return retrievedAt + spec["ttl"]
+
+		retries = snapshot.get("retries", 0)
+		if retries:
+			return retrievedAt + min(self.RETRY_SECONDS * 2 ** (retries - 1), bucket)
+
+		# never sit on a snapshot for more than two TTLs, whatever the server timestamp says
+		return min(timestamp + 2 * bucket + self.PUBLISH_DELAY, retrievedAt + 2 * spec["ttl"])
+
+	def isStale(self, name, snapshot, now):
+		return now >= self.nextRefreshAt(name, snapshot)
 
 class Geapi:
 
-	def __init__(self):
-		self.endpoint = "https://prices.runescape.wiki/api/v1/osrs"
-		self.mappingCachePath = "./data/mapping.json"
-		self.latestSnapshotPath = "./data/latest.json"
-		self.fiveMinAveSnapshotPath = "./data/fiveMinAve.json"
-		self.oneHourAveSnapshotPath = "./data/oneHourAve.json"
-		self.sixHourAveSnapshotPath = "./data/sixHourAve.json"
-		self.oneDayAveSnapshotPath = "./data/oneDayAve.json"
+	PREFETCH_LEAD = 10 # seconds before expiry the prefetcher refreshes a snapshot
+	PREFETCH_MAX_SLEEP = 60
+	PREFETCH_ERROR_BACKOFF = 30
+
+	# endpoint / dataDir can point somewhere else, e.g. a local stand-in server for testing.
+	# snapshotFormat picks the on-disk serializer ("json" or "msgpack"), existing snapshots
+	# in another format are migrated the first time they are read. with recordHistory every
+	# fetched price snapshot is also appended to the history store under dataDir/history
+	# (off by default, /latest alone grows it by ~1.7 GB a month).
+	# storage="sqlite" keeps snapshots and history in dataDir/osrsgep.sqlite3 instead
+	# (see sqlitestore.py), existing snapshot files are imported on first read
+	def __init__(self, endpoint="https://prices.runescape.wiki/api/v1/osrs", dataDir="./data", snapshotFormat="json", recordHistory=False, storage="files"):
+		self.endpoint = endpoint
+		self.dataDir = dataDir
+
+		if storage == "files":
+			self.snapshotStore = FileSnapshotStore(serializerFor(snapshotFormat))
+			self.historyStore = HistoryStore(f"{dataDir}/history") if recordHistory else None
+		elif storage == "sqlite":
+			self.snapshotStore = SqliteSnapshotStore(f"{dataDir}/osrsgep.sqlite3")
+			# the quotes / averages tables keep every snapshot already
+			self.historyStore = self.snapshotStore
+		else:
+			raise ValueError(f"unknown storage {storage!r}, expected 'files' or 'sqlite'")
+
+		self.storage = storage
+		self.mappingCachePath = f"{dataDir}/mapping.json"
+		self.latestSnapshotPath = f"{dataDir}/latest.json"
+		self.fiveMinAveSnapshotPath = f"{dataDir}/fiveMinAve.json"
+		self.oneHourAveSnapshotPath = f"{dataDir}/oneHourAve.json"
+		self.sixHourAveSnapshotPath = f"{dataDir}/sixHourAve.json"
+		self.oneDayAveSnapshotPath = f"{dataDir}/oneDayAve.json"
 		self.itemMapping = None
 		self.latestSnapshot = None
 		self.fiveMinAveSnapshot = None
@@ -29,8 +143,24 @@ class Geapi:
 		self.sixHourAveSnapshot = None
 		self.oneDayAveSnapshot = None
 
-		self.timeSinceLastRequest = 0
-		self.secondsBetweenRequest = 5 # 5 second minimum delay between requests
+		# parsed snapshots kept in memory so getters don't re-read ./data on every call
+		# name -> {"snapshot": dict, "mtime": file mtime (ns) the snapshot was read from / written as}
+		self.snapshotCache = {}
+		# unchanged counts fetches that came back with a bucket we already had
+		self.cacheStats = {name: {"hits": 0, "misses": 0, "diskReads": 0, "fetches": 0, "unchanged": 0} for name in SNAPSHOTS}
+		# per endpoint: wireBytes actually transferred, savedBytes not transferred thanks to
+		# compression and 304s (against the uncompressed body), notModified counts the 304s
+		self.transferStats = {name: {"requests": 0, "notModified": 0, "wireBytes": 0, "savedBytes": 0} for name in SNAPSHOTS}
+
+		self.refreshPlanner = RefreshPlanner()
+
+		# shared by every Geapi in the process so concurrent workers stay under one limit
+		self.rateLimiter = sharedLimiter()
+
+		# background stale-while-revalidate refresher, see startPrefetcher
+		self.prefetchThread = None
+		self.prefetchStop = None
+		self.prefetchNames = []
 
 		self.setup()
 
@@ -42,386 +172,542 @@ class Geapi:
 		self.reqSession.headers.update(
 			{
 				"User-Agent": "OSRS GE Market Making/Liquidity Provider script - Email: boyd.jc.github@gmail.com",
-				"From": "boyd.jc.github@gmail.com"
+				"From": "boyd.jc.github@gmail.com",
+				# every encoding urllib3 can decode here: gzip / deflate, plus br (and zstd)
+				# when brotli (zstandard) is installed
+				"Accept-Encoding": make_headers(accept_encoding=True)["accept-encoding"]
 			}
 		)
 
-	def latest(self, itemId=None):
-
-		reqUrl = self.endpoint + "/latest"
-
-		params = None
-
-		if itemId:
-
-			params = {"id": itemId}
+	# rate limited GET against the api
+	def _get(self, route, label, params=None):
+		self.rateLimiter.acquire()
+		return self._send(route, label, params)
 
-			now = int(time.time())
+	# plain GET, callers are responsible for the rate limit
+	def _send(self, route, label, params=None, headers=None):
+		reqUrl = self.endpoint + route
 
-			if self.timeSinceLastRequest and (now - self.timeSinceLastRequest) < self.secondsBetweenRequest:
-				time.sleep(self.secondsBetweenRequest)
-		
-			print("SENDING LATEST REQUEST")
-			res = self.reqSession.get(reqUrl, params = params)
+		print(f"SENDING {label} REQUEST")
+		return self.reqSession.get(reqUrl, params = params, headers = headers)
 
-			self.timeSinceLastRequest = int(time.time())
+	def latest(self, itemId=None):
 
+		if itemId:
+			res = self._get("/latest", "LATEST", params = {"id": itemId})
 			return res.json()
 
-	def saveAllItemsLatest(self):
-		reqUrl = self.endpoint + "/latest"
-		
+	# latest quotes for a set of item ids, keyed by int id (None for items without a quote).
+	# served from the all-items snapshot when it is at most maxAge seconds old (by default
+	# its TTL, the window the prefetcher keeps it in). otherwise one item is looked up with
+	# /latest?id=, several with a single /latest call that also refreshes the snapshot
+	def getQuotes(self, itemIds, maxAge=None):
+		itemIds = list(itemIds)
+		maxAge = SNAPSHOTS["latest"]["ttl"] if maxAge is None else maxAge
 		now = int(time.time())
+		snapshot = self._revalidate("latest", now)
 
-		if self.timeSinceLastRequest and (now - self.timeSinceLastRequest) < self.secondsBetweenRequest:
-			time.sleep(self.secondsBetweenRequest)
-	
-		print("SENDING LATEST ALL REQUEST")
-		res = self.reqSession.get(reqUrl)
-
-		self.timeSinceLastRequest = int(time.time())
-		res.raise_for_status()
-	
-		loadedJson = res.json()
-		mappedResult = {
-			"retrieved_at": int(time.time()),  # UTC unix seconds
-			"data": loadedJson["data"]
-		}
-
-		Path(self.latestSnapshotPath).parent.mkdir(parents=True, exist_ok=True)
+		if snapshot is None or now - snapshot["retrieved_at"] > maxAge:
+			if len(itemIds) == 1:
+				# a few hundred bytes instead of the whole payload
+				res = self._get("/latest", "LATEST", params = {"id": itemIds[0]})
+				res.raise_for_status()
+				return {int(itemIds[0]): res.json()["data"].get(str(itemIds[0]))}
 
-		with open(self.latestSnapshotPath, "w", encoding="utf-8") as f:
-			json.dump(mappedResult, f, ensure_ascii=False)
-
-	def loadAllItemsLatest(self):
+			self._saveSnapshot("latest")
+			snapshot = self.latestSnapshot
+		else:
+			self.latestSnapshot = snapshot
 
-		if Path(self.latestSnapshotPath).exists():
+		data = snapshot["data"]
+		return {int(itemId): data.get(str(itemId)) for itemId in itemIds}
 
-			# Load existing cache
-			with open(self.latestSnapshotPath, "r", encoding="utf-8") as f:
-				self.latestSnapshot = json.load(f)
+	def _snapshotPath(self, name):
+		return getattr(self, SNAPSHOTS[name]["pathAttr"])
 
-			TTL_SECONDS = 5 * 60
-			retrieved_time = self.latestSnapshot["retrieved_at"]
-			now = int(time.time())
+	def _columnarPath(self, name):
+		return Path(self._snapshotPath(name)).with_suffix(".col")
 
-			is_stale = (now - retrieved_time) >= TTL_SECONDS
+	def _isStale(self, name, snapshot, now):
+		return self.refreshPlanner.isStale(name, snapshot, now)
 
-			if is_stale:
-				# Refresh once
-				self.saveAllItemsLatest()
+	# arrays are the snapshot's SnapshotArrays when already built. a copy sharing the
+	# previous one's data (a 304) keeps its arrays
+	def _cacheSnapshot(self, name, snapshot, mtime, arrays=None):
+		previous = self.snapshotCache.get(name)
+		if arrays is None and previous and previous.get("arrays") is not None and previous["arrays"].data is snapshot.get("data"):
+			arrays = previous["arrays"]
 
-				# Reload once
-				with open(self.latestSnapshotPath, "r", encoding="utf-8") as f:
-					self.latestSnapshot = json.load(f) 
-		else:
-			self.saveAllItemsLatest()
+		self.snapshotCache[name] = {"snapshot": snapshot, "mtime": mtime, "arrays": arrays}
+		setattr(self, SNAPSHOTS[name]["attr"], snapshot)
 
-			# Reload once
-			with open(self.latestSnapshotPath, "r", encoding="utf-8") as f:
-				self.latestSnapshot = json.load(f) 
+	# GET + parse of a snapshot route, no rate limiting. the request is conditional on the
+	# validators of the copy we hold, returns (payload, validators) with payload None when
+	# the server answered 304 (our copy is still current)
+	def _fetchPayload(self, name):
+		spec = SNAPSHOTS[name]
+		cached = self.snapshotCache.get(name)
+		current = cached["snapshot"] if cached else {}
 
+		headers = {}
+		if current.get("etag"):
+			headers["If-None-Match"] = current["etag"]
+		if current.get("last_modified"):
+			headers["If-Modified-Since"] = current["last_modified"]
 
-	def saveFiveMinAve(self):
-		reqUrl = self.endpoint + "/5m"
-		now = int(time.time())
+		res = self._send(spec["route"], spec["label"], headers=headers)
 
-		if self.timeSinceLastRequest and (now - self.timeSinceLastRequest) < self.secondsBetweenRequest:
-			time.sleep(self.secondsBetweenRequest)
-		
-		print("SENDING FIVE MIN AVE REQUEST")
-		res = self.reqSession.get(reqUrl)
+		if res.status_code == 304 and headers:
+			validators = self._validators(res, current)
+			validators["size"] = current.get("size", 0)
+			self._recordTransfer(name, res, validators["size"])
+			return None, validators
 
-		self.timeSinceLastRequest = int(time.time())
 		res.raise_for_status()
-
-		loadedJson = res.json()
+		payload = res.json()
+
+		validators = self._validators(res, {})
+		validators["size"] = len(res.content)
+		self._recordTransfer(name, res, validators["size"])
+		return payload, validators
+
+	# cache validators for a response, a 304 may leave out the ones that didn't change
+	@staticmethod
+	def _validators(res, current):
+		validators = {}
+		for field, header in (("etag", "ETag"), ("last_modified", "Last-Modified")):
+			value = res.headers.get(header) or current.get(field)
+			if value:
+				validators[field] = value
+		return validators
+
+	# size is the uncompressed body this response stands for
+	def _recordTransfer(self, name, res, size):
+		# bytes read off the socket, before decompression
+		wireBytes = res.raw.tell() if res.raw is not None else len(res.content)
+		savedBytes = max(0, size - wireBytes)
+
+		stats = self.transferStats[name]
+		stats["requests"] += 1
+		stats["wireBytes"] += wireBytes
+		stats["savedBytes"] += savedBytes
+		if res.status_code == 304:
+			stats["notModified"] += 1
+
+		print(f"RECEIVED {SNAPSHOTS[name]['label']} {res.status_code}: {wireBytes:,} BYTES TRANSFERRED, {savedBytes:,} SAVED")
+
+	def getTransferStats(self):
+		return {name: dict(stats) for name, stats in self.transferStats.items()}
+
+	# fetches a snapshot from the api, writes it to ./data and keeps the parsed copy in memory
+	def _saveSnapshot(self, name):
+		self.rateLimiter.acquire()
+		self._storeSnapshot(name, *self._fetchPayload(name))
+
+	async def _saveSnapshotAsync(self, name):
+		# wait out our slot in the shared budget without holding a thread
+		await asyncio.sleep(self.rateLimiter.reserve())
+
+		# request, json parsing and the file write all happen off the event loop
+		loop = asyncio.get_running_loop()
+		loadedJson, validators = await loop.run_in_executor(_fetchExecutor, self._fetchPayload, name)
+		await loop.run_in_executor(_fetchExecutor, self._storeSnapshot, name, loadedJson, validators)
+
+	# loadedJson None (a 304) keeps the payload we have and only refreshes its freshness
+	def _storeSnapshot(self, name, loadedJson, validators=None):
+		if loadedJson is None:
+			self._touchSnapshot(name, validators or {})
+			return
+
+		spec = SNAPSHOTS[name]
 
 		mappedResult = {
-			"retrieved_at": int(time.time()), # UTC unix seconds
-			"data": loadedJson["data"]
+			"retrieved_at": int(time.time()),  # UTC unix seconds
+			spec["key"]: loadedJson if spec["key"] == "items" else loadedJson["data"],
+			**(validators or {})
 		}
 
-		Path(self.fiveMinAveSnapshotPath).parent.mkdir(parents=True, exist_ok=True)
-
-		with open(self.fiveMinAveSnapshotPath, "w", encoding="utf-8") as f:
-			json.dump(mappedResult, f, ensure_ascii=False)
-
-	def loadFiveMinAve(self):
-
-		if Path(self.fiveMinAveSnapshotPath).exists():
-
-			# Load existing cache
-			with open(self.fiveMinAveSnapshotPath, "r", encoding="utf-8") as f:
-				self.fiveMinAveSnapshot = json.load(f)
-
-			TTL_SECONDS = 5 * 60 # 5 minutes
-			retrieved_time = self.fiveMinAveSnapshot["retrieved_at"]
-			now = int(time.time())
-
-			is_stale = (now - retrieved_time) >= TTL_SECONDS
-
-			if is_stale:
-				# Refresh once
-				self.saveFiveMinAve()
-
-				# Reload once
-				with open(self.fiveMinAveSnapshotPath, "r", encoding="utf-8") as f:
-					self.fiveMinAveSnapshot = json.load(f)
+		if spec["bucket"]:
+			# server side bucket start, drives the refresh planner
+			mappedResult["timestamp"] = loadedJson.get("timestamp")
+
+			cached = self.snapshotCache.get(name)
+			previous = cached["snapshot"] if cached else self._storedMeta(name)
+
+			if previous and previous.get("timestamp") is not None and previous.get("timestamp") == mappedResult["timestamp"]:
+				# next bucket isn't published yet
+				mappedResult["retries"] = previous.get("retries", 0) + 1
+				self.cacheStats[name]["unchanged"] += 1
+
+		version = self.snapshotStore.write(self._snapshotPath(name), mappedResult)
+
+		arrays = None
+		if spec["columns"]:
+			try:
+				# one walk over the payload for both the columnar file and the scan engine
+				arrays = SnapshotArrays(mappedResult, spec["columns"])
+				writeColumnar(self._columnarPath(name), mappedResult, spec["columns"], arrays)
+			except Exception:
+				# e.g. windows won't replace a file that is still mapped. getColumnarSnapshot
+				# rewrites it once it sees the copy is behind, the fetch itself is kept
+				print(traceback.format_exc())
+
+			# the sqlite store keeps history as part of the write itself
+			if self.historyStore is not None and self.historyStore is not self.snapshotStore:
+				try:
+					self.historyStore.ingest(name, mappedResult, spec["columns"])
+				except Exception:
+					# losing a history point shouldn't cost us the fresh snapshot
+					print(traceback.format_exc())
+
+		self.cacheStats[name]["fetches"] += 1
+
+		# what we just wrote is what a re-read would give us, so skip the reload
+		self._cacheSnapshot(name, mappedResult, version, arrays)
+
+	# the server says the copy we hold is current: same payload, new retrieved_at. no
+	# history point is recorded (nothing new was published) and the columnar copy is
+	# brought up to date lazily by getColumnarSnapshot
+	def _touchSnapshot(self, name, validators):
+		spec = SNAPSHOTS[name]
+		snapshot = {**self.snapshotCache[name]["snapshot"], **validators, "retrieved_at": int(time.time())}
+
+		if spec["bucket"]:
+			# an unchanged payload is the bucket we already had, the next one is late
+			snapshot["retries"] = snapshot.get("retries", 0) + 1
+			self.cacheStats[name]["unchanged"] += 1
+
+		# stores that can update the freshness fields alone skip rewriting the rows
+		if hasattr(self.snapshotStore, "touch"):
+			version = self.snapshotStore.touch(self._snapshotPath(name), snapshot)
 		else:
-			self.saveFiveMinAve()
-
-			# Reload once
-			with open(self.fiveMinAveSnapshotPath, "r", encoding="utf-8") as f:
-				self.fiveMinAveSnapshot = json.load(f)
-
-	def saveOneHourAve(self):
-		reqUrl = self.endpoint + "/1h"
-		now = int(time.time())
+			version = self.snapshotStore.write(self._snapshotPath(name), snapshot)
 
-		if self.timeSinceLastRequest and (now - self.timeSinceLastRequest) < self.secondsBetweenRequest:
-			time.sleep(self.secondsBetweenRequest)
-		
-		print("SENDING ONE HOUR AVE REQUEST")
-		res = self.reqSession.get(reqUrl)
+		self.cacheStats[name]["fetches"] += 1
+		self._cacheSnapshot(name, snapshot, version)
 
-		self.timeSinceLastRequest = int(time.time())
-		res.raise_for_status()
+	# the in-memory copy while it is inside its TTL, otherwise revalidated against the
+	# file mtime (another worker may have refreshed it). the result can still be stale,
+	# None means there is no copy at all
+	def _revalidate(self, name, now):
+		stats = self.cacheStats[name]
+		cached = self.snapshotCache.get(name)
 
-		loadedJson = res.json()
+		if cached and not self._isStale(name, cached["snapshot"], now):
+			stats["hits"] += 1
+			return cached["snapshot"]
 
-		mappedResult = {
-			"retrieved_at": int(time.time()), # UTC unix seconds
-			"data": loadedJson["data"]
-		}
-
-		Path(self.oneHourAveSnapshotPath).parent.mkdir(parents=True, exist_ok=True)
-
-		with open(self.oneHourAveSnapshotPath, "w", encoding="utf-8") as f:
-			json.dump(mappedResult, f, ensure_ascii=False)
-
-	def loadOneHourAve(self):
-
-		if Path(self.oneHourAveSnapshotPath).exists():
+		stats["misses"] += 1
+		basePath = self._snapshotPath(name)
+		version = self.snapshotStore.version(basePath)
 
+		if version is not None and (cached is None or cached["mtime"] != version):
 			# Load existing cache
-			with open(self.oneHourAveSnapshotPath, "r", encoding="utf-8") as f:
-				self.oneHourAveSnapshot = json.load(f)
+			snapshot = self.snapshotStore.read(basePath)
 
-			TTL_SECONDS = 60 * 60 # 1 hour 
-			retrieved_time = self.oneHourAveSnapshot["retrieved_at"]
-			now = int(time.time())
+			stats["diskReads"] += 1
+			self._cacheSnapshot(name, snapshot, version)
+			cached = self.snapshotCache[name]
 
-			is_stale = (now - retrieved_time) >= TTL_SECONDS
+		return cached["snapshot"] if cached else None
 
-			if is_stale:
-				# Refresh once
-				self.saveOneHourAve()
+	def _loadSnapshot(self, name):
+		now = int(time.time())
+		snapshot = self._revalidate(name, now)
 
-				# Reload once
-				with open(self.oneHourAveSnapshotPath, "r", encoding="utf-8") as f:
-					self.oneHourAveSnapshot = json.load(f)
+		# a stale copy the prefetcher keeps is served as is and refreshed in the
+		# background, readers only wait on the network when there is no copy at all
+		if snapshot is None or (self._isStale(name, snapshot, now) and not self.isPrefetched(name)):
+			# Refresh once
+			self._saveSnapshot(name)
 		else:
-			self.saveOneHourAve()
+			setattr(self, SNAPSHOTS[name]["attr"], snapshot)
 
-			# Reload once
-			with open(self.oneHourAveSnapshotPath, "r", encoding="utf-8") as f:
-				self.oneHourAveSnapshot = json.load(f)
-
-	def saveSixHourAve(self):
-		reqUrl = self.endpoint + "/6h"
+	# brings every named snapshot (all of them by default) up to date, fetching the
+	# stale ones concurrently under the shared rate budget
+	async def refreshAllAsync(self, names=None):
+		names = list(SNAPSHOTS) if names is None else list(names)
 		now = int(time.time())
 
-		if self.timeSinceLastRequest and (now - self.timeSinceLastRequest) < self.secondsBetweenRequest:
-			time.sleep(self.secondsBetweenRequest)
-		
-		print("SENDING SIX HOUR AVE REQUEST")
-		res = self.reqSession.get(reqUrl)
+		stale = []
+		for name in names:
+			snapshot = self._revalidate(name, now)
+			if snapshot is None or self._isStale(name, snapshot, now):
+				stale.append(name)
+			else:
+				setattr(self, SNAPSHOTS[name]["attr"], snapshot)
 
-		self.timeSinceLastRequest = int(time.time())
-		res.raise_for_status()
+		await self._fetchAllAsync(stale)
 
-		loadedJson = res.json()
+		return {name: getattr(self, SNAPSHOTS[name]["attr"]) for name in names}
 
-		mappedResult = {
-			"retrieved_at": int(time.time()), # UTC unix seconds
-			"data": loadedJson["data"]
-		}
-
-		Path(self.sixHourAveSnapshotPath).parent.mkdir(parents=True, exist_ok=True)
+	async def _fetchAllAsync(self, names):
+		results = await asyncio.gather(*(self._saveSnapshotAsync(name) for name in names), return_exceptions=True)
 
-		with open(self.sixHourAveSnapshotPath, "w", encoding="utf-8") as f:
-			json.dump(mappedResult, f, ensure_ascii=False)
+		# let every fetch finish before surfacing the first failure
+		for result in results:
+			if isinstance(result, BaseException):
+				raise result
 
-	def loadSixHourAve(self):
+	def refreshAll(self, names=None):
+		return asyncio.run(self.refreshAllAsync(names))
 
-		if Path(self.sixHourAveSnapshotPath).exists():
-
-			# Load existing cache
-			with open(self.sixHourAveSnapshotPath, "r", encoding="utf-8") as f:
-				self.sixHourAveSnapshot = json.load(f)
-
-			TTL_SECONDS = 6 * 60 * 60 # 6 hour 
-			retrieved_time = self.sixHourAveSnapshot["retrieved_at"]
+	# drops the in-memory copies so the next getter goes back to disk
+	def clearSnapshotCache(self, name=None):
+		if name is None:
+			self.snapshotCache.clear()
+		else:
+			self.snapshotCache.pop(name, None)
+
+	# starts a background thread that refreshes the named snapshots (all by default)
+	# shortly before they expire (stale-while-revalidate)
+	def startPrefetcher(self, names=None):
+		if self.isPrefetching():
+			return
+
+		self.prefetchNames = list(SNAPSHOTS) if names is None else list(names)
+		self.prefetchStop = threading.Event()
+		self.prefetchThread = threading.Thread(target=self._prefetchLoop, name="GeapiPrefetcher", daemon=True)
+		self.prefetchThread.start()
+
+	def stopPrefetcher(self):
+		if not self.isPrefetching():
+			return
+
+		self.prefetchStop.set()
+		self.prefetchThread.join()
+		self.prefetchThread = None
+
+	def isPrefetching(self):
+		return self.prefetchThread is not None and self.prefetchThread.is_alive()
+
+	# whether the running prefetcher refreshes this snapshot, readers may serve it stale
+	def isPrefetched(self, name):
+		return self.isPrefetching() and name in self.prefetchNames
+
+	# when the prefetcher wants to refresh a snapshot. continuously updated snapshots
+	# go PREFETCH_LEAD seconds early, bucketed ones are due right after publication anyway
+	def _prefetchAt(self, name, snapshot):
+		due = self.refreshPlanner.nextRefreshAt(name, snapshot)
+		return due if SNAPSHOTS[name]["bucket"] else due - self.PREFETCH_LEAD
+
+	def _prefetchLoop(self):
+		while not self.prefetchStop.is_set():
 			now = int(time.time())
+			due = []
+			nextAt = now + self.PREFETCH_MAX_SLEEP
+
+			for name in self.prefetchNames:
+				snapshot = self._revalidate(name, now)
+				prefetchAt = now if snapshot is None else self._prefetchAt(name, snapshot)
+
+				if prefetchAt <= now:
+					due.append(name)
+				else:
+					nextAt = min(nextAt, prefetchAt)
+
+			if due:
+				try:
+					asyncio.run(self._fetchAllAsync(due))
+					continue
+				except Exception:
+					print(traceback.format_exc())
+					nextAt = now + self.PREFETCH_ERROR_BACKOFF
+
+			self.prefetchStop.wait(max(1, nextAt - int(time.time())))
+
+	# freshness fields of the stored snapshot when the store can give them without a
+	# full read (sqlite), None otherwise
+	def _storedMeta(self, name):
+		if not hasattr(self.snapshotStore, "meta"):
+			return None
+		return self.snapshotStore.meta(self._snapshotPath(name))
+
+	# makes sure the stored copy of a snapshot is fresh, without parsing it when the
+	# store can answer from its metadata. returns False for stores that can't
+	def _ensureStoredFresh(self, name):
+		if not hasattr(self.snapshotStore, "meta"):
+			return False
+
+		meta = self._storedMeta(name)
+		if meta is None or (not self.isPrefetched(name) and self._isStale(name, meta, int(time.time()))):
+			self._saveSnapshot(name)
+		return True
+
+	# one item's entry in a snapshot: an indexed query with the sqlite store, a binary
+	# search over the memory mapped columnar copy otherwise
+	def lookupItem(self, name, itemId):
+		if self._ensureStoredFresh(name):
+			return self.snapshotStore.lookup(name, itemId)
+		return self.getColumnarSnapshot(name).lookup(itemId)
+
+	# rows passing the scan filters, from one query over the current mapping, /latest and
+	# /5m (SqliteSnapshotStore.widestSpreadRows), each brought up to date first. what
+	# the controller's "sqlite" scan engine runs on, needs storage="sqlite"
+	def getWidestSpreadRows(self, taxRate):
+		if self.storage != "sqlite":
+			raise ValueError("the sqlite scan engine needs Geapi(storage=\"sqlite\")")
+
+		for name in ("mapping", "latest", "fiveMinAve"):
+			self._ensureStoredFresh(name)
+		return self.snapshotStore.widestSpreadRows(taxRate)
+
+	# memory mapped columnar copy of a snapshot (see columnar.py). when the columnar
+	# file is fresh the json snapshot isn't parsed at all, so lookups through this
+	# share the page cache with every other process instead of holding private dicts
+	def getColumnarSnapshot(self, name):
+		spec = SNAPSHOTS[name]
+		if not spec["columns"]:
+			raise ValueError(f"{name} has no columnar copy")
+
+		path = self._columnarPath(name)
+		columnar = openColumnar(path)
+
+		if columnar is not None and (self.isPrefetched(name) or not self._isStale(name, columnar.meta(), int(time.time()))):
+			return columnar
+
+		self._loadSnapshot(name)
+		snapshot = getattr(self, spec["attr"])
+
+		# snapshots written before the columnar copy existed
+		if columnar is None or columnar.retrievedAt != snapshot["retrieved_at"]:
+			try:
+				writeColumnar(path, snapshot, spec["columns"])
+			except OSError:
+				# the old copy is still mapped (windows), it serves until the next refresh
+				if columnar is None:
+					raise
+				return columnar
+
+		return openColumnar(path)
+
+	# SnapshotArrays of the snapshot the getters serve (see columnar.py), what the scan
+	# engine runs on. built when the snapshot is fetched, or on first use after a read
+	# from disk, never per call
+	def getSnapshotArrays(self, name):
+		spec = SNAPSHOTS[name]
+		if not spec["columns"]:
+			raise ValueError(f"{name} has no columns")
+
+		self._loadSnapshot(name)
+		cached = self.snapshotCache[name]
+		if cached["arrays"] is None:
+			cached["arrays"] = SnapshotArrays(cached["snapshot"], spec["columns"])
+		return cached["arrays"]
+
+	# stored history for one item between two unix times, oldest first
+	def getItemHistory(self, name, itemId, start, end):
+		spec = SNAPSHOTS[name]
+		if self.historyStore is None or not spec["columns"]:
+			raise ValueError(f"no history recorded for {name}")
+
+		return self.historyStore.itemHistory(name, itemId, start, end, spec["columns"])
+
+	# seconds since the snapshot was fetched, None if we don't have it in memory
+	def getSnapshotAge(self, name):
+		cached = self.snapshotCache.get(name)
+		if cached is None:
+			return None
+		return max(0, int(time.time()) - cached["snapshot"]["retrieved_at"])
+
+	def getSnapshotAges(self):
+		return {name: self.getSnapshotAge(name) for name in SNAPSHOTS}
+
+	# unix time the planner wants this snapshot refetched, None if it was never loaded
+	def nextRefreshAt(self, name):
+		cached = self.snapshotCache.get(name)
+		if cached is None:
+			return None
+		return self.refreshPlanner.nextRefreshAt(name, cached["snapshot"])
+
+	# version of the copy the getters serve for a snapshot, loading it first if needed.
+	# changes whenever the snapshot is re-fetched or re-read from disk. load=False only
+	# looks at memory (no disk or network), None if it was never loaded
+	def getSnapshotVersion(self, name, load=True):
+		if load:
+			self._loadSnapshot(name)
+		cached = self.snapshotCache.get(name)
+		return cached["mtime"] if cached else None
+
+	def getCacheStats(self):
+		return {name: dict(stats) for name, stats in self.cacheStats.items()}
 
-			is_stale = (now - retrieved_time) >= TTL_SECONDS
-
-			if is_stale:
-				# Refresh once
-				self.saveSixHourAve()
-
-				# Reload once
-				with open(self.sixHourAveSnapshotPath, "r", encoding="utf-8") as f:
-					self.sixHourAveSnapshot = json.load(f)
-		else:
-			self.saveSixHourAve()
+	def saveAllItemsLatest(self):
+		self._saveSnapshot("latest")
 
-			# Reload once
-			with open(self.sixHourAveSnapshotPath, "r", encoding="utf-8") as f:
-				self.sixHourAveSnapshot = json.load(f)
+	def loadAllItemsLatest(self):
+		self._loadSnapshot("latest")
 
-	def saveOneDayAve(self):
-		reqUrl = self.endpoint + "/24h"
-		now = int(time.time())
+	def saveFiveMinAve(self):
+		self._saveSnapshot("fiveMinAve")
 
-		if self.timeSinceLastRequest and (now - self.timeSinceLastRequest) < self.secondsBetweenRequest:
-			time.sleep(self.secondsBetweenRequest)
-		
-		print("SENDING 24 HOUR AVE REQUEST")
-		res = self.reqSession.get(reqUrl)
+	def loadFiveMinAve(self):
+		self._loadSnapshot("fiveMinAve")
 
-		self.timeSinceLastRequest = int(time.time())
-		res.raise_for_status()
+	def saveOneHourAve(self):
+		self._saveSnapshot("oneHourAve")
 
-		loadedJson = res.json()
+	def loadOneHourAve(self):
+		self._loadSnapshot("oneHourAve")
 
-		mappedResult = {
-			"retrieved_at": int(time.time()), # UTC unix seconds
-			"data": loadedJson["data"]
-		}
+	def saveSixHourAve(self):
+		self._saveSnapshot("sixHourAve")
 
-		Path(self.oneDayAveSnapshotPath).parent.mkdir(parents=True, exist_ok=True)
+	def loadSixHourAve(self):
+		self._loadSnapshot("sixHourAve")
 
-		with open(self.oneDayAveSnapshotPath, "w", encoding="utf-8") as f:
-			json.dump(mappedResult, f, ensure_ascii=False)
+	def saveOneDayAve(self):
+		self._saveSnapshot("oneDayAve")
 
 	def loadOneDayAve(self):
-
-		if Path(self.oneDayAveSnapshotPath).exists():
-
-			# Load existing cache
-			with open(self.oneDayAveSnapshotPath, "r", encoding="utf-8") as f:
-				self.oneDayAveSnapshot = json.load(f)
-
-			TTL_SECONDS = 24 * 60 * 60 # 6 hour 
-			retrieved_time = self.oneDayAveSnapshot["retrieved_at"]
-			now = int(time.time())
-
-			is_stale = (now - retrieved_time) >= TTL_SECONDS
-
-			if is_stale:
-				# Refresh once
-				self.saveOneDayAve()
-
-				# Reload once
-				with open(self.oneDayAveSnapshotPath, "r", encoding="utf-8") as f:
-					self.oneDayAveSnapshot = json.load(f)
-		else:
-			self.saveOneDayAve()
-
-			# Reload once
-			with open(self.oneDayAveSnapshotPath, "r", encoding="utf-8") as f:
-				self.oneDayAveSnapshot = json.load(f)
-
+		self._loadSnapshot("oneDayAve")
 
 	def saveMapping(self):
-		reqUrl = self.endpoint + "/mapping"
-		now = int(time.time())
-
-		if self.timeSinceLastRequest and (now - self.timeSinceLastRequest) < self.secondsBetweenRequest:
-			time.sleep(self.secondsBetweenRequest)
-		
-		print("SENDING MAPPING REQUEST")
-		res = self.reqSession.get(reqUrl)
-
-		self.timeSinceLastRequest = int(time.time())
-		res.raise_for_status()
-
-		loadedJson = res.json()
-
-		mappedResult = {
-			"retrieved_at": int(time.time()),  # UTC unix seconds
-			"items": loadedJson
-		}
-
-		Path(self.mappingCachePath).parent.mkdir(parents=True, exist_ok=True)
-
-		with open(self.mappingCachePath, "w", encoding="utf-8") as f:
-			json.dump(mappedResult, f, ensure_ascii=False)
+		self._saveSnapshot("mapping")
 
 	def loadMapping(self):
+		self._loadSnapshot("mapping")
 
-		if Path(self.mappingCachePath).exists():
-
-			# Load existing cache
-			with open(self.mappingCachePath, "r", encoding="utf-8") as f:
-				self.itemMapping = json.load(f)
-
-			TTL_SECONDS = 24 * 60 * 60
-			retrieved_time = self.itemMapping["retrieved_at"]
-			now = int(time.time())
-
-			is_stale = (now - retrieved_time) >= TTL_SECONDS
-
-			if is_stale:
-				# Refresh once
-				self.saveMapping()
-
-				# Reload once
-				with open(self.mappingCachePath, "r", encoding="utf-8") as f:
-					self.itemMapping = json.load(f)
-		else:
-			# Refresh once
-			self.saveMapping()
-
-			# Reload once
-			with open(self.mappingCachePath, "r", encoding="utf-8") as f:
-				self.itemMapping = json.load(f)
-
-	
 	def getLatestSnapshot(self):
 		self.loadAllItemsLatest()
 		return self.latestSnapshot
-	
+
 	def getItemMapping(self):
 		self.loadMapping()
 		return self.itemMapping
-	
+
+	# hashed id / name lookups over the mapping, only rebuilt when the mapping changes
+	def getItemIndex(self):
+		return indexForMapping(self.getItemMapping())
+
+	# type-ahead name search over the mapping (see namesearch.py), rebuilt only when the
+	# names change and cached next to the snapshots
+	def getNameIndex(self):
+		return nameIndexForMapping(self.getItemMapping(), f"{self.dataDir}/nameindex.npz")
+
 	def getFiveMinAveSnapshot(self):
 		self.loadFiveMinAve()
 		return self.fiveMinAveSnapshot
-	
+
 	def getOneHourAveSnapshot(self):
 		self.loadOneHourAve()
 		return self.oneHourAveSnapshot
-	
+
 	def getSixHourAveSnapshot(self):
 		self.loadSixHourAve()
 		return self.sixHourAveSnapshot
-	
+
 	def getOneDayAveSnapshot(self):
 		self.loadOneDayAve()
 		return self.oneDayAveSnapshot
-	
+
 if __name__ == '__main__':
 
 	geapi = Geapi()
-	geapi.setup()
 	geapi.getLatestSnapshot()
 	geapi.getItemMapping()
 	geapi.getFiveMinAveSnapshot()
 	geapi.getOneHourAveSnapshot()
 	geapi.getSixHourAveSnapshot()
 	geapi.getOneDayAveSnapshot()
-	
+	print(geapi.getCacheStats())
@@ -0,0 +1,354 @@
+'''
+    history backfill from the wiki's /timeseries and /{timestep}?timestamp= routes
+
+    the history store only fills up while the app is running. this walks a window of
+    buckets back from the newest complete one, works out which (item, bucket) points
+    the local store is missing and fetches them with as few requests as it can:
+
+        /1h?timestamp=T               every item for one bucket
+        /timeseries?id=X&timestep=1h  one item, the newest TIMESERIES_POINTS buckets
+
+    missing points form a bipartite graph of items and buckets. a bucket request
+    covers all edges of a bucket, a timeseries request all edges of an item inside
+    the timeseries window, so the fewest requests is a minimum vertex cover of that
+    graph, which König's theorem gives us from a maximum matching. buckets older than
+    the window can only be filled by bucket requests.
+
+    requests go through Geapi's rate limiter, results are written straight into
+    Geapi's history store and every finished request is recorded in a checkpoint
+    under dataDir/backfill, so an interrupted run picks up where it stopped.
+
+        python backfill.py --timestep 1h --days 365 --top 500
+        python backfill.py --endpoint http://127.0.0.1:8000 --timestep 5m --days 1 --items 2,561 --dry-run
+'''
+
+import json
+import time
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+from api import Geapi, SNAPSHOTS
+from columnar import AVERAGE_COLUMNS, intOrNull
+from snapshotstore import atomicWrite
+
+# --timestep -> the snapshot the buckets belong to
+TIMESTEPS = {
+    "5m": "fiveMinAve",
+    "1h": "oneHourAve",
+    "6h": "sixHourAve",
+    "24h": "oneDayAve",
+}
+
+# /timeseries returns this many of the newest buckets
+TIMESERIES_POINTS = 365
+
+
+# maximum matching of a bipartite graph, adjacency[left] lists the right vertices.
+# returns matchLeft / matchRight, -1 for unmatched
+def maximumMatching(adjacency, rightCount):
+    matchLeft = [-1] * len(adjacency)
+    matchRight = [-1] * rightCount
+
+    # hopcroft-karp: bfs layers from the free left vertices, then vertex disjoint
+    # shortest augmenting paths along those layers
+    while True:
+        layer = [-1] * len(adjacency)
+        queue = deque()
+        for left, right in enumerate(matchLeft):
+            if right == -1:
+                layer[left] = 0
+                queue.append(left)
+
+        found = False
+        while queue:
+            left = queue.popleft()
+            for right in adjacency[left]:
+                nextLeft = matchRight[right]
+                if nextLeft == -1:
+                    found = True
+                elif layer[nextLeft] == -1:
+                    layer[nextLeft] = layer[left] + 1
+                    queue.append(nextLeft)
+
+        if not found:
+            return matchLeft, matchRight
+
+        for left in range(len(adjacency)):
+            if matchLeft[left] == -1:
+                _augment(left, adjacency, layer, matchLeft, matchRight)
+
+
+# depth first search for an augmenting path from a free left vertex along the bfs
+# layers, flipping it into the matching when found. paths get as long as there are
+# items, so the search keeps its own stack: frames [left, next adjacency position],
+# path[i] is the right vertex that led from stack[i] to stack[i + 1]
+def _augment(root, adjacency, layer, matchLeft, matchRight):
+    stack = [[root, 0]]
+    path = []
+
+    while stack:
+        frame = stack[-1]
+        left, position = frame
+
+        if position == len(adjacency[left]):
+            # dead end, not worth visiting again this phase
+            layer[left] = -1
+            stack.pop()
+            if path:
+                path.pop()
+            continue
+
+        frame[1] += 1
+        right = adjacency[left][position]
+        nextLeft = matchRight[right]
+
+        if nextLeft == -1:
+            path.append(right)
+            for (pathLeft, _), pathRight in zip(stack, path):
+                matchLeft[pathLeft] = pathRight
+                matchRight[pathRight] = pathLeft
+            return True
+
+        if layer[nextLeft] == layer[left] + 1:
+            path.append(right)
+            stack.append([nextLeft, 0])
+
+    return False
+
+
+# smallest set of vertices touching every edge, as (left vertices, right vertices)
+def minimumVertexCover(adjacency, rightCount):
+    matchLeft, matchRight = maximumMatching(adjacency, rightCount)
+
+    # könig: walk alternating paths from the free left vertices, the cover is the
+    # unreached left vertices plus the reached right ones
+    reachedLeft = [right == -1 for right in matchLeft]
+    reachedRight = [False] * rightCount
+    queue = deque(left for left, reached in enumerate(reachedLeft) if reached)
+
+    while queue:
+        left = queue.popleft()
+        for right in adjacency[left]:
+            if reachedRight[right] or matchLeft[left] == right:
+                continue
+            reachedRight[right] = True
+            nextLeft = matchRight[right]
+            if nextLeft != -1 and not reachedLeft[nextLeft]:
+                reachedLeft[nextLeft] = True
+                queue.append(nextLeft)
+
+    return (
+        [left for left, reached in enumerate(reachedLeft) if not reached],
+        [right for right, reached in enumerate(reachedRight) if reached]
+    )
+
+
+class BackfillPlan:
+
+    def __init__(self, timestep, items, buckets, bucketTasks, timeseriesTasks, missing):
+        self.timestep = timestep
+        self.items = items
+        self.buckets = buckets
+        self.bucketTasks = bucketTasks # bucket timestamps, newest first
+        self.timeseriesTasks = timeseriesTasks # item ids
+        self.missing = missing # (item, bucket) points not stored yet
+
+    def __len__(self):
+        return len(self.bucketTasks) + len(self.timeseriesTasks)
+
+    def summary(self):
+        return (
+            f"{self.timestep}: {len(self.items)} items x {len(self.buckets)} buckets, "
+            f"{self.missing} points missing -> {len(self.bucketTasks)} bucket + "
+            f"{len(self.timeseriesTasks)} timeseries requests"
+        )
+
+
+class Backfiller:
+
+    # geapi supplies the endpoint, rate limiter and history store. its recordHistory
+    # has to be on (or storage="sqlite"), that is where everything is written
+    def __init__(self, geapi, timestep="1h"):
+        if timestep not in TIMESTEPS:
+            raise ValueError(f"unknown timestep {timestep!r}, expected one of {tuple(TIMESTEPS)}")
+        if geapi.historyStore is None:
+            raise ValueError("backfill needs a Geapi with a history store (recordHistory=True)")
+
+        self.geapi = geapi
+        self.timestep = timestep
+        self.name = TIMESTEPS[timestep]
+        self.step = SNAPSHOTS[self.name]["bucket"]
+        self.checkpointPath = Path(geapi.dataDir) / "backfill" / f"{timestep}.checkpoint.json"
+        self.checkpoint = self._readCheckpoint()
+
+    # checkpoint: bucket timestamps fetched, and item id -> [oldest, newest] bucket
+    # its timeseries request covered (buckets without trades come back empty, so the
+    # store alone can't tell those apart from buckets we never asked for)
+    def _readCheckpoint(self):
+        if not self.checkpointPath.exists():
+            return {"buckets": [], "timeseries": {}}
+        return json.loads(self.checkpointPath.read_bytes())
+
+    def _saveCheckpoint(self):
+        atomicWrite(self.checkpointPath, json.dumps(self.checkpoint).encode("utf-8"))
+
+    # start of the newest bucket the server has finished averaging
+    def newestBucket(self, now=None):
+        now = int(time.time()) if now is None else now
+        return (now // self.step - 1) * self.step
+
+    # the most traded items over the last day, by volume on both sides
+    def topItems(self, count):
+        data = self.geapi.getOneDayAveSnapshot()["data"]
+
+        def volume(entry):
+            return (entry.get("highPriceVolume") or 0) + (entry.get("lowPriceVolume") or 0)
+
+        ranked = sorted(data.items(), key=lambda kv: volume(kv[1]), reverse=True)
+        return [int(itemId) for itemId, _ in ranked[:count]]
+
+    def plan(self, items, days, now=None):
+        newest = self.newestBucket(now)
+        count = max(1, days * 24 * 60 * 60 // self.step)
+        buckets = np.arange(newest - (count - 1) * self.step, newest + 1, self.step, dtype=np.int64)
+        start, end = int(buckets[0]), int(buckets[-1])
+
+        store = self.geapi.historyStore
+        items = sorted({int(i) for i in items})
+
+        # whole buckets already stored (live fetches or earlier backfills)
+        complete = np.isin(buckets, np.array(
+            store.snapshotTimestampsBetween(self.name, start, end) + self.checkpoint["buckets"], dtype=np.int64
+        ))
+
+        stored = store.itemTimestamps(self.name, items, start, end, AVERAGE_COLUMNS)
+        missing = np.zeros((len(items), len(buckets)), dtype=bool)
+        for row, itemId in enumerate(items):
+            have = complete | np.isin(buckets, stored[itemId])
+            covered = self.checkpoint["timeseries"].get(str(itemId))
+            if covered:
+                have |= (buckets >= covered[0]) & (buckets <= covered[1])
+            missing[row] = ~have
+
+        # only bucket requests reach past the timeseries window
+        windowStart = newest - (TIMESERIES_POINTS - 1) * self.step
+        inWindow = buckets >= windowStart
+
+        bucketTasks = [int(b) for b in buckets[~inWindow & missing.any(axis=0)]]
+
+        windowBuckets = buckets[inWindow]
+        windowMissing = missing[:, inWindow]
+        adjacency = [np.flatnonzero(row).tolist() for row in windowMissing]
+        coverItems, coverBuckets = minimumVertexCover(adjacency, len(windowBuckets))
+
+        bucketTasks += [int(windowBuckets[b]) for b in coverBuckets]
+        timeseriesTasks = [items[i] for i in coverItems]
+
+        return BackfillPlan(
+            self.timestep, items, buckets, sorted(bucketTasks, reverse=True), timeseriesTasks, int(missing.sum())
+        )
+
+    def _fetch(self, route, label, params):
+        res = self.geapi._get(route, label, params)
+        res.raise_for_status()
+        return res.json()
+
+    # one whole bucket, stored like a live snapshot of it would have been
+    def fetchBucket(self, timestamp):
+        spec = SNAPSHOTS[self.name]
+        payload = self._fetch(spec["route"], f"{spec['label']} @ {timestamp}", {"timestamp": timestamp})
+
+        snapshot = {
+            "retrieved_at": int(time.time()),
+            "timestamp": payload.get("timestamp", timestamp),
+            "data": payload["data"]
+        }
+        self.geapi.historyStore.ingest(self.name, snapshot, AVERAGE_COLUMNS)
+
+        self.checkpoint["buckets"].append(int(timestamp))
+        self._saveCheckpoint()
+
+    # one item's timeseries, only the points we don't have yet are written
+    def fetchTimeseries(self, itemId, newest):
+        payload = self._fetch("/timeseries", f"TIMESERIES {itemId}", {"id": itemId, "timestep": self.timestep})
+        points = [p for p in payload.get("data", []) if isinstance(p.get("timestamp"), int)]
+
+        oldest = newest - (TIMESERIES_POINTS - 1) * self.step
+        if points:
+            oldest = min(oldest, min(p["timestamp"] for p in points))
+            newest = max(newest, max(p["timestamp"] for p in points))
+
+            store = self.geapi.historyStore
+            have = set(store.itemTimestamps(self.name, [itemId], oldest, newest, AVERAGE_COLUMNS)[itemId].tolist())
+            records = [
+                (p["timestamp"], itemId, *(intOrNull(p.get(c)) for c in AVERAGE_COLUMNS))
+                for p in points if p["timestamp"] not in have
+            ]
+            if records:
+                store.appendRecords(self.name, np.array(records, dtype=np.int64))
+
+        self.checkpoint["timeseries"][str(itemId)] = [oldest, newest]
+        self._saveCheckpoint()
+
+    def run(self, plan):
+        total = len(plan)
+        newest = int(plan.buckets[-1])
+        started = time.monotonic()
+
+        tasks = [("timeseries", itemId) for itemId in plan.timeseriesTasks]
+        tasks += [("bucket", timestamp) for timestamp in plan.bucketTasks]
+
+        for done, (kind, arg) in enumerate(tasks, 1):
+            if kind == "timeseries":
+                self.fetchTimeseries(arg, newest)
+            else:
+                self.fetchBucket(arg)
+
+            print(f"BACKFILL {self.timestep} {done}/{total} ({time.monotonic() - started:.0f}s)")
+
+        return total
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="fill local price history from the wiki api")
+    parser.add_argument("--timestep", choices=tuple(TIMESTEPS), default="1h")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--top", type=int, default=500, help="backfill the N most traded items")
+    parser.add_argument("--items", help="comma separated item ids instead of --top")
+    parser.add_argument("--endpoint", default=None, help="api base url, e.g. a local fake server")
+    parser.add_argument("--data-dir", default="./data")
+    parser.add_argument("--storage", choices=("files", "sqlite"), default="files")
+    parser.add_argument("--rate", type=float, default=None, help="requests per second (default: the shared limit)")
+    parser.add_argument("--dry-run", action="store_true", help="print the plan and exit")
+    args = parser.parse_args(argv)
+
+    # backfilling is what the history store is for, recorded whatever the storage
+    options = {"dataDir": args.data_dir, "storage": args.storage, "recordHistory": True}
+    if args.endpoint:
+        options["endpoint"] = args.endpoint
+
+    geapi = Geapi(**options)
+    if args.rate:
+        geapi.rateLimiter.configure(args.rate, geapi.rateLimiter.burst)
+
+    backfiller = Backfiller(geapi, args.timestep)
+
+    if args.items:
+        items = [int(i) for i in args.items.replace(" ", "").split(",") if i]
+    else:
+        items = backfiller.topItems(args.top)
+
+    plan = backfiller.plan(items, args.days)
+    print(plan.summary())
+    print(f"about {len(plan) / geapi.rateLimiter.rate / 60:.0f} minutes at {geapi.rateLimiter.rate:g} requests/s")
+
+    if not args.dry_run:
+        backfiller.run(plan)
+
+
+if __name__ == "__main__":
+    main()
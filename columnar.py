@@ -0,0 +1,196 @@
+'''
+    fixed layout columnar snapshot files, read through mmap
+
+    a parsed json snapshot costs every worker / process its own few MB of python
+    dicts. the columnar file keeps the same numbers as int64 arrays on disk; readers
+    map it and wrap the arrays with numpy.frombuffer, so every process shares the
+    one page cache copy and an item lookup is a binary search over the sorted ids.
+
+    layout (little endian, everything 8 byte aligned):
+        magic        8 bytes  b"OSGECOL1"
+        rows         int64
+        columns      int64
+        retrieved_at int64
+        timestamp    int64    NULL when the payload has none
+        retries      int64
+        names        32 bytes per column, utf-8, NUL padded
+        ids          int64[rows], ascending
+        column data  int64[rows] per column, in name order
+'''
+
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from snapshotstore import atomicWrite
+
+MAGIC = b"OSGECOL1"
+HEADER = struct.Struct("<8sqqqqq")
+NAME_BYTES = 32
+
+# stands in for null / missing values
+NULL = np.iinfo(np.int64).min
+
+# columns kept per snapshot
+LATEST_COLUMNS = ("high", "highTime", "low", "lowTime")
+AVERAGE_COLUMNS = ("avgHighPrice", "highPriceVolume", "avgLowPrice", "lowPriceVolume")
+
+
+def intOrNull(value):
+    return int(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else NULL
+
+
+# payload values are ints or null. those columns convert in one numpy pass, anything
+# else (floats, bools, junk) goes value by value through intOrNull
+def _intColumn(values):
+    if not set(map(type, values)) <= {int, type(None)}:
+        return np.array([intOrNull(value) for value in values], dtype=np.int64)
+
+    column = np.array(values, dtype=object)
+    column[np.equal(column, None)] = NULL
+    return column.astype(np.int64)
+
+
+# item ids and one int64 array per column, in payload order
+def snapshotArrays(snapshot, columns):
+    data = snapshot["data"]
+    quotes = list(data.values())
+
+    ids = np.fromiter(map(int, data.keys()), dtype=np.int64, count=len(data))
+    values = {column: _intColumn([q.get(column) for q in quotes]) for column in columns}
+    return ids, values
+
+
+# a parsed snapshot's ids and columns, built once per fetch / read and kept with it
+# (Geapi.getSnapshotArrays). positions line up with keys and data, the payload order
+class SnapshotArrays:
+
+    def __init__(self, snapshot, columns):
+        self.data = snapshot["data"]
+        self.keys = list(self.data.keys())
+        self.ids, self.columns = snapshotArrays(snapshot, columns)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+# arrays, when given, are the snapshot's SnapshotArrays and save walking it again
+def encode(snapshot, columns, arrays=None):
+    if arrays is None:
+        ids, values = snapshotArrays(snapshot, columns)
+    else:
+        ids, values = arrays.ids, arrays.columns
+    order = np.argsort(ids, kind="stable")
+
+    header = HEADER.pack(
+        MAGIC,
+        len(ids),
+        len(columns),
+        snapshot["retrieved_at"],
+        intOrNull(snapshot.get("timestamp")),
+        snapshot.get("retries", 0)
+    )
+    names = b"".join(name.encode("utf-8").ljust(NAME_BYTES, b"\0") for name in columns)
+
+    parts = [header, names, ids[order].tobytes()]
+    for column in columns:
+        parts.append(values[column][order].tobytes())
+
+    return b"".join(parts)
+
+
+def writeColumnar(path, snapshot, columns, arrays=None):
+    atomicWrite(path, encode(snapshot, columns, arrays))
+    return Path(path).stat().st_mtime_ns
+
+
+class ColumnarSnapshot:
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+        with open(self.path, "rb") as f:
+            self.version = os.fstat(f.fileno()).st_mtime_ns
+            # the mapping outlives the file object, and a later atomic replace of the
+            # file leaves this mapping on the old contents
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, rows, columns, retrievedAt, timestamp, retries = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a columnar snapshot")
+
+        self.rows = rows
+        self.retrievedAt = retrievedAt
+        self.timestamp = None if timestamp == NULL else timestamp
+        self.retries = retries
+
+        offset = HEADER.size
+        self.columnNames = []
+        for _ in range(columns):
+            self.columnNames.append(bytes(self.buffer[offset:offset + NAME_BYTES]).rstrip(b"\0").decode("utf-8"))
+            offset += NAME_BYTES
+
+        self.ids = np.frombuffer(self.buffer, dtype=np.int64, count=rows, offset=offset)
+        offset += rows * 8
+
+        self.columns = {}
+        for name in self.columnNames:
+            self.columns[name] = np.frombuffer(self.buffer, dtype=np.int64, count=rows, offset=offset)
+            offset += rows * 8
+
+    # the freshness fields Geapi's refresh planner looks at
+    def meta(self):
+        meta = {"retrieved_at": self.retrievedAt, "retries": self.retries}
+        if self.timestamp is not None:
+            meta["timestamp"] = self.timestamp
+        return meta
+
+    def __len__(self):
+        return self.rows
+
+    def rowOf(self, itemId):
+        itemId = int(itemId)
+        row = int(np.searchsorted(self.ids, itemId))
+        if row < self.rows and self.ids[row] == itemId:
+            return row
+        return None
+
+    def column(self, name):
+        return self.columns[name]
+
+    # same shape as the json payload's entry for the item, None if it isn't there
+    def lookup(self, itemId):
+        row = self.rowOf(itemId)
+        if row is None:
+            return None
+
+        quote = {}
+        for name, values in self.columns.items():
+            value = int(values[row])
+            quote[name] = None if value == NULL else value
+        return quote
+
+
+_openLock = threading.Lock()
+_openSnapshots = {}
+
+
+# one mapping per file per process, reopened when the file has been replaced
+def openColumnar(path):
+    path = Path(path)
+
+    try:
+        version = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    with _openLock:
+        snapshot = _openSnapshots.get(path)
+        if snapshot is None or snapshot.version != version:
+            snapshot = ColumnarSnapshot(path)
+            _openSnapshots[path] = snapshot
+        return snapshot
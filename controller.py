@@ -1,14 +1,38 @@
 from api import Geapi
+import scanengine
 import time
 from datetime import datetime
 import pandas as pd
 
 class GeController:
 
-    def __init__(self):
-        self.geapi = Geapi()
-
-    def findWidestSpreads(self):
+    # "numpy" runs the columnar engine in scanengine.py, "python" the per-item loop,
+    # "sqlite" runs the scan as a query (needs the sqlite storage backend). all three
+    # give the same DataFrame, except that the sqlite rows come in item id order and the
+    # others in /latest payload order. the api serves ids ascending, so in practice
+    # that is the same order
+    SCAN_ENGINES = ("numpy", "python", "sqlite")
+
+    # geapiOptions are passed to Geapi, e.g. storage="sqlite"
+    def __init__(self, scanEngine="numpy", **geapiOptions):
+        self.geapi = Geapi(**geapiOptions)
+        self.scanEngine = scanEngine
+        self.incrementalScanner = scanengine.IncrementalScanner()
+
+    def findWidestSpreads(self, engine=None):
+
+        engine = engine or self.scanEngine
+
+        if engine == "numpy":
+            return scanengine.widestSpreads(
+                self.geapi.getSnapshotArrays("latest"),
+                self.geapi.getSnapshotArrays("fiveMinAve"),
+                self.geapi.getItemIndex()
+            )
+        if engine == "sqlite":
+            return scanengine.widestSpreadsFromRows(self.geapi.getWidestSpreadRows(scanengine.GE_TAX_RATE))
+        if engine != "python":
+            raise ValueError(f"unknown scan engine {engine!r}, expected one of {self.SCAN_ENGINES}")
 
         latestSnapshot = self.geapi.getLatestSnapshot()
         data = latestSnapshot["data"]
@@ -17,6 +41,9 @@ class GeController:
 
         GE_TAX_RATE = 0.02
 
+        itemIndex = self.geapi.getItemIndex()
+        fiveMinData = self.geapi.getFiveMinAveSnapshot()["data"]
+
         rows = []
 
         for itemId, q in data.items():
@@ -56,10 +83,12 @@ class GeController:
             netSpreadPct = netProfit / mid
 
             # mapping lookup
-            itemDetails = self.searchMapping(itemId)
+            itemDetails = itemIndex.byId(itemId)
+            if itemDetails is None:
+                continue
 
             # five minute average
-            fiveMinuteAverage = self.searchFiveMinuteAveSnapshot(itemId)
+            fiveMinuteAverage = fiveMinData.get(itemId)
 
             lastTradeTime = max(highTime, lowTime)
 
@@ -84,9 +113,11 @@ class GeController:
                                 "item_id": int(itemId),
                                 "item_name": itemDetails.get("name"),
                                 "item_limit": itemDetails.get("limit"),
+                                "members": bool(itemDetails.get("members")),
                                 "low": low,
                                 "vol (5m)": fiveMinVol,
                                 "high": high,
+                                "netProfit": int(netProfit),
                                 "netSpreadPct": round(netSpreadPct, 2),
                                 "lastTradeReadable": datetime.fromtimestamp(lastTradeTime).strftime("%H:%M:%S"),
                                 "lastTradeTime": lastTradeTime
@@ -94,36 +125,47 @@ class GeController:
 
         return pd.DataFrame(rows)
     
+    # findWidestSpreads that only re-evaluates items whose quotes changed since the last
+    # call. returns a scanengine.ScanDelta: the full result plus inserted / updated / removed
+    def findWidestSpreadsIncremental(self):
+
+        return self.incrementalScanner.scan(
+            self.geapi.getSnapshotArrays("latest"),
+            self.geapi.getSnapshotArrays("fiveMinAve"),
+            self.geapi.getItemIndex()
+        )
+
     def searchMapping(self, itemId):
 
-        itemMapping = self.geapi.getItemMapping()
+        return self.geapi.getItemIndex().byId(itemId)
+
+    def searchMappingByName(self, name):
+
+        return self.geapi.getItemIndex().find(name)
+
+    # ranked [(itemId, name)] for a partial / misspelled name, for type-ahead
+    def searchNames(self, query, limit=10):
 
-        itemId = int(itemId)
-        for item in itemMapping["items"]:
-            if item["id"] == itemId:
-                return item
-        return None
+        return self.geapi.getNameIndex().search(query, limit)
     
+    # single item lookups are indexed, see Geapi.lookupItem
     def searchLatestSnapshot(self, itemId):
 
-        latestSnapshot = self.geapi.getLatestSnapshot()
-
-        return latestSnapshot["data"].get(str(itemId))
+        return self.geapi.lookupItem("latest", itemId)
     
     def searchFiveMinuteAveSnapshot(self, itemId):
 
-        fiveMinuteAveSnapshot = self.geapi.getFiveMinAveSnapshot()
-
-        return fiveMinuteAveSnapshot["data"].get(str(itemId))
+        return self.geapi.lookupItem("fiveMinAve", itemId)
     
     def searchOneHourAveSnapshot(self, itemId):
 
-        oneHourAveSnapshot = self.geapi.getOneHourAveSnapshot()
-
-        return oneHourAveSnapshot["data"].get(str(itemId))
+        return self.geapi.lookupItem("oneHourAve", itemId)
     
     def searchItem(self, itemId):
 
+        # fetch whatever is stale concurrently, the getters below then hit memory
+        self.geapi.refreshAll(["latest", "fiveMinAve", "oneHourAve", "sixHourAve", "oneDayAve"])
+
         latestSnapshot = self.geapi.getLatestSnapshot()
         fiveMinSnapshot = self.geapi.getFiveMinAveSnapshot()
         oneHourAveSnapshot = self.geapi.getOneHourAveSnapshot()
@@ -137,8 +179,24 @@ class GeController:
             "oneDayAve": oneDayAveSnapshot["data"].get(str(itemId))
         }]
     
+    # recorded prices for an item, name is the snapshot ("latest", "fiveMinAve", ...)
+    def getItemHistory(self, itemId, start, end=None, name="latest"):
+        return self.geapi.getItemHistory(name, itemId, start, int(time.time()) if end is None else end)
+
     def getLatest(self, itemId):
-        return [self.geapi.latest(itemId)["data"].get(str(itemId)), self.searchFiveMinuteAveSnapshot(itemId), self.searchMapping(itemId)]
+        return self.getLatestMany([itemId])[int(itemId)]
+
+    # [latest, fiveMinAve, mapping] per item id, all quotes from one /latest call at most.
+    # maxAge is how old (seconds) the all-items snapshot may be, see Geapi.getQuotes
+    def getLatestMany(self, itemIds, maxAge=None):
+        quotes = self.geapi.getQuotes(itemIds, maxAge)
+        fiveMinData = self.geapi.getFiveMinAveSnapshot()["data"]
+        itemIndex = self.geapi.getItemIndex()
+
+        return {
+            itemId: [quote, fiveMinData.get(str(itemId)), itemIndex.byId(itemId)]
+            for itemId, quote in quotes.items()
+        }
 
         
 if __name__ == "__main__":
@@ -0,0 +1,295 @@
+'''
+    sort / filter proxy backed by numpy
+
+    QSortFilterProxyModel compares rows by calling back into the source model's
+    python data() for both sides of every comparison. this proxy instead pulls
+    whole columns of sort keys from the source (sortKeys(column), see
+    ScannerViewTableModel), sorts them with numpy.argsort and keeps the result as a
+    permutation: proxy row -> source row. filters are boolean masks over the same
+    columns, so re-sorting or re-filtering all items costs a couple of array
+    operations.
+
+    source row removals are passed on as row removals. inserts and layout changes
+    are applied as a layout change: the permutation is rebuilt and persistent
+    indexes (selection, current row) are moved to where their source rows ended
+    up. a dataChanged is forwarded as is and the rows are re-sorted / re-filtered
+    once the event loop comes back around.
+'''
+
+import numpy as np
+
+from PySide6.QtCore import QAbstractProxyModel, QModelIndex, QPersistentModelIndex, Qt, QTimer, Slot
+
+
+# sort keys -> (array, missing mask). numbers and bools as float64, anything else as
+# strings. missing cells are left out of filters and always sort last
+def keyArray(keys):
+    missing = np.fromiter((key is None for key in keys), dtype=bool, count=len(keys))
+    try:
+        values = np.array(keys, dtype=np.float64)
+    except (TypeError, ValueError):
+        values = np.array(["" if key is None else str(key) for key in keys], dtype=object)
+    return values, missing
+
+
+class ArraySortFilterProxyModel(QAbstractProxyModel):
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._sortColumn = -1
+        self._sortOrder = Qt.SortOrder.AscendingOrder
+        self._minimums = {}     # column name -> minimum value
+        self._required = set()  # column names that have to be true
+
+        self._arrays = {}       # column -> keyArray(), dropped on every source change
+        self._toSource = np.empty(0, dtype=np.int64)
+        self._toSourceRows = []  # same as _toSource, as a list for per-cell lookups
+        self._fromSource = np.empty(0, dtype=np.int64)
+        self._pending = []
+        self._refreshPending = False
+        self._sourceCellData = None
+
+    def setSourceModel(self, sourceModel):
+        self.beginResetModel()
+        super().setSourceModel(sourceModel)
+        self._sourceCellData = getattr(sourceModel, "cellData", None)
+
+        sourceModel.modelAboutToBeReset.connect(self.beginResetModel)
+        sourceModel.modelReset.connect(self._onSourceReset)
+        sourceModel.dataChanged.connect(self._onSourceDataChanged)
+        sourceModel.headerDataChanged.connect(self.headerDataChanged)
+        sourceModel.rowsAboutToBeRemoved.connect(self._onSourceRowsAboutToBeRemoved)
+        sourceModel.rowsRemoved.connect(self._onSourceRowsRemoved)
+        for about, done in (
+            (sourceModel.rowsAboutToBeInserted, sourceModel.rowsInserted),
+            (sourceModel.columnsAboutToBeInserted, sourceModel.columnsInserted),
+            (sourceModel.columnsAboutToBeRemoved, sourceModel.columnsRemoved),
+            (sourceModel.layoutAboutToBeChanged, sourceModel.layoutChanged),
+        ):
+            about.connect(self._beginLayoutChange)
+            done.connect(self._endLayoutChange)
+
+        self._rebuild()
+        self.endResetModel()
+
+    # filters
+
+    # rows whose `column` (header name) is below value are hidden, None clears it
+    def setMinimum(self, column, value):
+        if value is None:
+            self._minimums.pop(column, None)
+        else:
+            self._minimums[column] = value
+        self._refresh()
+
+    # rows whose `column` isn't true are hidden
+    def setRequired(self, column, required=True):
+        if required:
+            self._required.add(column)
+        else:
+            self._required.discard(column)
+        self._refresh()
+
+    def clearFilters(self):
+        self._minimums.clear()
+        self._required.clear()
+        self._refresh()
+
+    # sorting
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        self._sortColumn = column
+        self._sortOrder = order
+        self._refresh()
+
+    def sortColumn(self):
+        return self._sortColumn
+
+    def sortOrder(self):
+        return self._sortOrder
+
+    # building the permutation
+
+    def _columnOf(self, name):
+        source = self.sourceModel()
+        for column in range(source.columnCount()):
+            if source.headerData(column, Qt.Orientation.Horizontal, Qt.ItemDataRole.DisplayRole) == name:
+                return column
+        return None
+
+    def _array(self, column):
+        if column not in self._arrays:
+            self._arrays[column] = keyArray(self.sourceModel().sortKeys(column))
+        return self._arrays[column]
+
+    def _permutation(self):
+        source = self.sourceModel()
+        rows = source.rowCount() if source is not None else 0
+        if rows == 0 or source.columnCount() == 0:
+            return np.empty(0, dtype=np.int64)
+
+        visible = np.ones(rows, dtype=bool)
+        with np.errstate(invalid="ignore"):
+            for name, minimum in self._minimums.items():
+                column = self._columnOf(name)
+                if column is not None:
+                    values, missing = self._array(column)
+                    visible &= ~missing & (values >= minimum)
+            for name in self._required:
+                column = self._columnOf(name)
+                if column is not None:
+                    values, missing = self._array(column)
+                    visible &= ~missing & (values == 1)
+
+        order = np.flatnonzero(visible)
+        if 0 <= self._sortColumn < source.columnCount():
+            values, missing = self._array(self._sortColumn)
+            present = order[~missing[order]]
+            present = present[np.argsort(values[present], kind="stable")]
+            if self._sortOrder == Qt.SortOrder.DescendingOrder:
+                present = present[::-1]
+            order = np.concatenate([present, order[missing[order]]])
+
+        return order
+
+    def _rebuild(self):
+        self._arrays = {}
+        self._toSource = self._permutation()
+        self._toSourceRows = self._toSource.tolist()
+
+        source = self.sourceModel()
+        self._fromSource = np.full(source.rowCount() if source is not None else 0, -1, dtype=np.int64)
+        self._fromSource[self._toSource] = np.arange(len(self._toSource))
+
+    def _refresh(self):
+        if self.sourceModel() is None:
+            return
+        self._beginLayoutChange()
+        self._endLayoutChange()
+
+    @Slot()
+    def _beginLayoutChange(self):
+        self.layoutAboutToBeChanged.emit()
+
+        # remember which source cell every persistent index is on
+        self._pending = [
+            (index, QPersistentModelIndex(self.mapToSource(index)))
+            for index in self.persistentIndexList()
+        ]
+
+    @Slot()
+    def _endLayoutChange(self):
+        self._rebuild()
+
+        old = [index for index, _ in self._pending]
+        new = [self._mapFromPersistent(sourceIndex) for _, sourceIndex in self._pending]
+        self.changePersistentIndexList(old, new)
+        self._pending = []
+
+        self.layoutChanged.emit()
+
+    def _mapFromPersistent(self, sourceIndex):
+        if not sourceIndex.isValid():
+            return QModelIndex()
+        return self.mapFromSource(self.sourceModel().index(sourceIndex.row(), sourceIndex.column()))
+
+    @Slot()
+    def _onSourceReset(self):
+        self._rebuild()
+        self.endResetModel()
+
+    # removing rows doesn't change the order of the rest, so they go out as plain row
+    # removals, one per contiguous run of proxy rows
+    @Slot(QModelIndex, int, int)
+    def _onSourceRowsAboutToBeRemoved(self, parent, first, last):
+        rows = np.sort(self._fromSource[first:last + 1])
+        rows = rows[rows >= 0]
+
+        runStarts = np.flatnonzero(np.r_[True, np.diff(rows) != 1]) if len(rows) else []
+        runEnds = np.r_[runStarts[1:], len(rows)] if len(rows) else []
+        for start, end in reversed(list(zip(runStarts, runEnds))):
+            top, bottom = int(rows[start]), int(rows[end - 1])
+            self.beginRemoveRows(QModelIndex(), top, bottom)
+            self._toSource = np.delete(self._toSource, np.s_[top:bottom + 1])
+            self._toSourceRows = self._toSource.tolist()
+            self.endRemoveRows()
+
+    @Slot(QModelIndex, int, int)
+    def _onSourceRowsRemoved(self, parent, first, last):
+        self._arrays = {}
+        self._toSource = np.where(self._toSource > last, self._toSource - (last - first + 1), self._toSource)
+        self._toSourceRows = self._toSource.tolist()
+        self._fromSource = np.full(self.sourceModel().rowCount(), -1, dtype=np.int64)
+        self._fromSource[self._toSource] = np.arange(len(self._toSource))
+
+    # edits don't move rows by themselves: the mapping stays valid, so the change is
+    # forwarded right away and the re-sort / re-filter runs once after the source's
+    # whole batch of updates, instead of once per dataChanged
+    @Slot(QModelIndex, QModelIndex)
+    def _onSourceDataChanged(self, topLeft, bottomRight, roles=()):
+        self._arrays = {}
+
+        rows = self._fromSource[topLeft.row():bottomRight.row() + 1]
+        rows = rows[rows >= 0]
+        if len(rows):
+            self.dataChanged.emit(
+                self.index(int(rows.min()), topLeft.column()),
+                self.index(int(rows.max()), bottomRight.column())
+            )
+
+        if not self._refreshPending:
+            self._refreshPending = True
+            QTimer.singleShot(0, self._deferredRefresh)
+
+    @Slot()
+    def _deferredRefresh(self):
+        self._refreshPending = False
+        if not np.array_equal(self._permutation(), self._toSource):
+            self._refresh()
+
+    # QAbstractProxyModel
+
+    def mapToSource(self, proxyIndex):
+        if not proxyIndex.isValid() or proxyIndex.row() >= len(self._toSource):
+            return QModelIndex()
+        return self.sourceModel().index(int(self._toSource[proxyIndex.row()]), proxyIndex.column())
+
+    # called for every painted cell, skips the default's round trip through mapToSource
+    # (and the source's index(), when it offers cellData(row, column, role))
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._toSourceRows[index.row()]
+        if self._sourceCellData is not None:
+            return self._sourceCellData(row, index.column(), role)
+        source = self.sourceModel()
+        return source.data(source.index(row, index.column()), role)
+
+    def mapFromSource(self, sourceIndex):
+        if not sourceIndex.isValid() or sourceIndex.row() >= len(self._fromSource):
+            return QModelIndex()
+        row = int(self._fromSource[sourceIndex.row()])
+        return QModelIndex() if row < 0 else self.index(row, sourceIndex.column())
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not (0 <= row < len(self._toSource)) or not (0 <= column < self.columnCount()):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=None):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._toSource)
+
+    def columnCount(self, parent=QModelIndex()):
+        source = self.sourceModel()
+        return 0 if parent.isValid() or source is None else source.columnCount()
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        source = self.sourceModel()
+        if source is None:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return source.headerData(section, orientation, role)
+        return None
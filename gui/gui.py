@@ -1,6 +1,7 @@
+import importlib
 import sys
 
-from PySide6.QtCore import Signal
+from PySide6.QtCore import QThread, QTimer, Signal, Slot
 from PySide6.QtWidgets import (QApplication, 
                             QMainWindow, 
                             QWidget, 
@@ -10,8 +11,10 @@ from PySide6.QtWidgets import (QApplication,
                             QComboBox, 
                             QStackedLayout )
 
+# only what the first paint needs is imported here. pandas, numpy and the api
+# (requests) come in through ModulePreloader once the window is up, and the search
+# view is built the first time it is selected
 from .scanner import ScannerView
-from .search import SearchView
 from .widgets import LineSep
 
 class MainWindow(QMainWindow):
@@ -34,7 +37,31 @@ class MainWindow(QMainWindow):
         widget = QWidget()
         widget.setLayout(layout)
         self.setCentralWidget(widget)
-        
+
+        self.preloader = None
+
+    # the first paint is the cue to start on everything the window didn't need to show
+    # itself: heavy imports on a background thread, then the scanner's models and data
+    def paintEvent(self, event):
+        super().paintEvent(event)
+
+        if self.preloader is None:
+            self.preloader = ModulePreloader(self)
+            self.preloader.finished.connect(self.stackedDisplay.scannerView.activate)
+            QTimer.singleShot(0, self.preloader.start)
+
+
+# imports the modules behind the views off the gui thread. the view that ends up
+# needing one first just finds it in sys.modules (or waits on its import lock)
+class ModulePreloader(QThread):
+
+    MODULES = ["controller", ".tablecache", ".arrayproxy", ".search"]
+
+    def run(self):
+        for name in self.MODULES:
+            importlib.import_module(name, __package__)
+
+
 class InfoBar(QWidget):
     viewChanged = Signal(str)
 
@@ -68,18 +95,22 @@ class StackedDisplay(QWidget):
         layout.addLayout(self.stackedLayout)
 
         self.scannerView = ScannerView()
-        self.searchView = SearchView()
+        self.searchView = None # built on first selection
 
         self.stackedLayout.addWidget(self.scannerView)
-        self.stackedLayout.addWidget(self.searchView)
 
         self.setLayout(layout)
 
+    @Slot(str)
     def switchDisplay(self, viewStr):
         if viewStr == "Scanner":
-            self.stackedLayout.setCurrentIndex(0)
+            self.stackedLayout.setCurrentWidget(self.scannerView)
         elif viewStr == "Search":
-            self.stackedLayout.setCurrentIndex(1)
+            if self.searchView is None:
+                from .search import SearchView
+                self.searchView = SearchView()
+                self.stackedLayout.addWidget(self.searchView)
+            self.stackedLayout.setCurrentWidget(self.searchView)
 
 
 if __name__ == "__main__":
@@ -1,53 +1,71 @@
-import pandas as pd
-import numpy as np
-import traceback
+import time
 from datetime import datetime
 
 from PySide6.QtCore import (
-    QAbstractTableModel, Qt, QObject, QThread, Signal, Slot, QSortFilterProxyModel
+    QAbstractTableModel, QModelIndex, Qt, QObject, QTimer, Signal, Slot
 )
 from PySide6.QtWidgets import (
     QPushButton, QTableView, QHeaderView, QSizePolicy,
-    QWidget, QVBoxLayout, QHBoxLayout, QLabel
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QSpinBox, QCheckBox
 )
 
 from .widgets import LineSep
-from controller import GeController
+from .workers import JobScheduler, sharedPool
+
+# pandas, numpy and the api are imported where they are first used (mostly
+# activate()), so building this view doesn't wait on them
 
 
 class ScannerView(QWidget):
     def __init__(self):
         super().__init__()
 
-        self.scannerController = ScannerController()
+        # created by activate()
+        self.scannerController = None
+        self.tableModel = None
+        self.proxy = None
 
         layout = QVBoxLayout()
 
         self.controlBar = ScannerViewControlBar()
+        self.controlBar.scanPushButton.setEnabled(False)
         layout.addWidget(self.controlBar, 0)
 
         self.scannerTable = QTableView()
         self.scannerTable.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+        self.scannerTable.verticalHeader().setVisible(False)
+        self.scannerTable.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+
+        layout.addWidget(LineSep())
+        layout.addWidget(self.scannerTable, 1)
+        self.setLayout(layout)
+
+        # data freshness, ticks once a second off the prefetcher's snapshots
+        self.dataAgeTimer = QTimer(self)
+        self.dataAgeTimer.setInterval(1000)
+        self.dataAgeTimer.timeout.connect(self._updateDataAge)
+
+    # builds the models and the controller (whose prefetcher starts loading snapshots
+    # in the background). MainWindow calls it once the window is on screen
+    @Slot()
+    def activate(self):
+        if self.scannerController is not None:
+            return
+
+        from .arrayproxy import ArraySortFilterProxyModel
+
+        self.scannerController = ScannerController()
 
         # Source model
-        self.tableModel = ScannerViewTableModel(pd.DataFrame())
+        self.tableModel = ScannerViewTableModel()
 
-        # Proxy for sorting (portable, correct numeric sorting)
-        self.proxy = QSortFilterProxyModel(self)
+        # sorting and the control bar's filters, done on numpy arrays of the sort keys
+        self.proxy = ArraySortFilterProxyModel(self)
         self.proxy.setSourceModel(self.tableModel)
-        self.proxy.setSortRole(Qt.ItemDataRole.UserRole)
-        self.proxy.setDynamicSortFilter(True)
 
         self.scannerTable.setModel(self.proxy)
         self.scannerTable.setSortingEnabled(True)
 
-        self.scannerTable.verticalHeader().setVisible(False)
-        self.scannerTable.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
-
-        layout.addWidget(LineSep())
-        layout.addWidget(self.scannerTable, 1)
-        self.setLayout(layout)
-
         # Wiring
         self.controlBar.scanPushButton.clicked.connect(self.scannerController.scan)
         self.scannerController.resultsReady.connect(self.tableModel.setDataFrame)
@@ -57,11 +75,63 @@ class ScannerView(QWidget):
         self.scannerController.busyChanged.connect(self.controlBar.setBusy)
         self.scannerController.error.connect(self._onError)
 
+        self.controlBar.live.toggled.connect(self.scannerController.setLive)
+        self.controlBar.liveInterval.valueChanged.connect(self.scannerController.setLiveInterval)
+        self.dataAgeTimer.timeout.connect(self.scannerController.checkLive)
+
+        self.controlBar.minProfit.valueChanged.connect(
+            lambda v: self.proxy.setMinimum("netProfit", v or None)
+        )
+        self.controlBar.minVolume.valueChanged.connect(
+            lambda v: self.proxy.setMinimum("vol (5m)", v or None)
+        )
+        self.controlBar.membersOnly.toggled.connect(
+            lambda checked: self.proxy.setRequired("members", checked)
+        )
+
+        # filters set before the proxy existed
+        self.proxy.setMinimum("netProfit", self.controlBar.minProfit.value() or None)
+        self.proxy.setMinimum("vol (5m)", self.controlBar.minVolume.value() or None)
+        self.proxy.setRequired("members", self.controlBar.membersOnly.isChecked())
+        self.scannerController.setLiveInterval(self.controlBar.liveInterval.value())
+        self.scannerController.setLive(self.controlBar.live.isChecked())
+
+        self.controlBar.scanPushButton.setEnabled(True)
+        self.dataAgeTimer.start()
+
+    @Slot()
+    def _updateDataAge(self):
+        ages = self.scannerController.snapshotAges()
+        self.controlBar.setDataAge(
+            f"Data Age: latest {formatAge(ages.get('latest'))} | 5m {formatAge(ages.get('fiveMinAve'))}"
+        )
+
+        nextAt = self.scannerController.nextLiveRefresh()
+        if not self.scannerController.live:
+            self.controlBar.setNextRefresh("")
+        elif nextAt is None:
+            self.controlBar.setNextRefresh("Next Refresh: --:--:--")
+        else:
+            self.controlBar.setNextRefresh(
+                f"Next Refresh: {datetime.fromtimestamp(nextAt).strftime('%H:%M:%S')}"
+                f" (in {formatAge(max(0, int(nextAt - time.time())))})"
+            )
+
     @Slot(str)
     def _onError(self, tb: str):
         print(tb)
 
 
+def formatAge(seconds):
+    if seconds is None:
+        return "--"
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 60 * 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
+
 class ScannerViewControlBar(QWidget):
     def __init__(self):
         super().__init__()
@@ -69,8 +139,42 @@ class ScannerViewControlBar(QWidget):
 
         self.lastScanTime = QLabel("Last Scan Time: --:--:--")
         layout.addWidget(self.lastScanTime)
+
+        self.dataAge = QLabel("Data Age: --")
+        layout.addWidget(self.dataAge)
+
+        # empty unless live
+        self.nextRefresh = QLabel("")
+        layout.addWidget(self.nextRefresh)
         layout.addStretch()
 
+        # row filters, 0 means no minimum
+        layout.addWidget(QLabel("Min Profit:"))
+        self.minProfit = QSpinBox()
+        self.minProfit.setRange(0, 2 ** 31 - 1)
+        self.minProfit.setSuffix(" gp")
+        layout.addWidget(self.minProfit)
+
+        layout.addWidget(QLabel("Min Vol (5m):"))
+        self.minVolume = QSpinBox()
+        self.minVolume.setRange(0, 2 ** 31 - 1)
+        layout.addWidget(self.minVolume)
+
+        self.membersOnly = QCheckBox("Members only")
+        layout.addWidget(self.membersOnly)
+
+        # live rescans, on every new snapshot or on a fixed interval
+        self.live = QCheckBox("Live")
+        layout.addWidget(self.live)
+
+        self.liveInterval = QSpinBox()
+        self.liveInterval.setRange(0, 60 * 60)
+        self.liveInterval.setSingleStep(30)
+        self.liveInterval.setSuffix(" s")
+        self.liveInterval.setSpecialValueText("On new data")
+        self.liveInterval.setToolTip("seconds between live rescans, 0 rescans as new data arrives")
+        layout.addWidget(self.liveInterval)
+
         self.scanPushButton = QPushButton("Scan", self)
         layout.addWidget(self.scanPushButton)
 
@@ -79,123 +183,293 @@ class ScannerViewControlBar(QWidget):
     def setLastScanTime(self, text: str):
         self.lastScanTime.setText(text)
 
+    def setDataAge(self, text: str):
+        self.dataAge.setText(text)
+
+    def setNextRefresh(self, text: str):
+        self.nextRefresh.setText(text)
+
     @Slot(bool)
     def setBusy(self, busy: bool):
         self.scanPushButton.setEnabled(not busy)
         self.scanPushButton.setText("Scanning..." if busy else "Scan")
 
 
+# rows are keyed on item_id. a new scan result is diffed against what the model
+# holds and applied as row removals, dataChanged for rows whose values changed and
+# one insert for the new items, so views keep their selection, scroll position and
+# sort instead of rebuilding on a reset. row order inside the model is arbitrary,
+# the view sorts through the proxy.
+#
+# display strings and sort keys are kept per column (see tablecache.py) and only
+# redone for the rows a scan touched, data() never goes back to pandas
 class ScannerViewTableModel(QAbstractTableModel):
-    def __init__(self, df: pd.DataFrame):
+
+    KEY = "item_id"
+
+    def __init__(self, df=None):
         super().__init__()
-        self._data = df
+        self._columns = []
+        self._keys = []       # item_id per row
+        self._display = []    # [column][row] display strings
+        self._sortKeys = []   # [column][row] python values, None when missing
+        self._load(df)
+
+    def _load(self, df):
+        if df is None:
+            self._columns, self._display, self._sortKeys, self._keys = [], [], [], []
+            return
 
-    @Slot(object)
-    def setDataFrame(self, df: pd.DataFrame):
-        self.beginResetModel()
-        self._data = df if df is not None else pd.DataFrame()
-        self.endResetModel()
+        from .tablecache import columnCaches
+
+        self._columns = [str(c) for c in df.columns]
+        self._display, self._sortKeys = columnCaches(df)
 
-    def rowCount(self, parent=None):
-        return 0 if self._data is None else self._data.shape[0]
+        if self.KEY in self._columns:
+            self._keys = list(self._sortKeys[self._columns.index(self.KEY)])
+        else:
+            self._keys = list(range(len(df)))
+
+    def _row(self, row):
+        return [column[row] for column in self._sortKeys]
+
+    # every row's sort key for a column, what ArraySortFilterProxyModel sorts and filters on
+    def sortKeys(self, column):
+        return self._sortKeys[column]
+
+    @Slot(object)
+    def setDataFrame(self, df):
+        from .tablecache import columnKeys
+
+        # the layout changed or there is nothing to key on, start over
+        if df is None or [str(c) for c in df.columns] != self._columns or self.KEY not in self._columns or not self._keys:
+            self.beginResetModel()
+            self._load(df)
+            self.endResetModel()
+            return
 
-    def columnCount(self, parent=None):
-        return 0 if self._data is None else self._data.shape[1]
+        keys = columnKeys(df)
+        incoming = {row[0]: row[1:] for row in zip(keys[self._columns.index(self.KEY)], *keys)}
+
+        # removals, back to front in contiguous runs so the rows above stay valid
+        gone = [i for i, key in enumerate(self._keys) if key not in incoming]
+        for first, last in reversed(_runs(gone)):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self._keys[first:last + 1]
+            for column in range(len(self._columns)):
+                del self._display[column][first:last + 1]
+                del self._sortKeys[column][first:last + 1]
+            self.endRemoveRows()
+
+        # rows still here but with different values
+        changed = []
+        for i, key in enumerate(self._keys):
+            row = incoming.pop(key)
+            if list(row) != self._row(i):
+                self._setRow(i, row)
+                changed.append(i)
+
+        lastColumn = len(self._columns) - 1
+        for first, last in _runs(changed):
+            self.dataChanged.emit(self.index(first, 0), self.index(last, lastColumn))
+
+        # whatever is left is new, appended in one block
+        if incoming:
+            first = len(self._keys)
+            self.beginInsertRows(QModelIndex(), first, first + len(incoming) - 1)
+            for key, row in incoming.items():
+                self._keys.append(key)
+                for column, value in enumerate(row):
+                    self._sortKeys[column].append(value)
+                    self._display[column].append("" if value is None else str(value))
+            self.endInsertRows()
+
+    def _setRow(self, i, row):
+        for column, value in enumerate(row):
+            self._sortKeys[column][i] = value
+            self._display[column][i] = "" if value is None else str(value)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._keys)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns)
 
     def data(self, index, role):
-        if not index.isValid() or self._data is None or self._data.empty:
+        if not index.isValid():
             return None
+        return self.cellData(index.row(), index.column(), role)
 
-        value = self._data.iat[index.row(), index.column()]
+    # data() without the QModelIndex, for the sort proxy's per-cell lookups
+    def cellData(self, row, column, role):
 
         # Raw values for sorting (UserRole exists in PySide6)
         if role == Qt.ItemDataRole.UserRole:
-            if pd.isna(value):
-                return None
-            if isinstance(value, (np.generic,)):
-                return value.item()
-            return value
+            return self._sortKeys[column][row]
 
         # Pretty display
         if role == Qt.ItemDataRole.DisplayRole:
-            if pd.isna(value):
-                return ""
-            return str(value)
+            return self._display[column][row]
 
         return None
 
     def headerData(self, section, orientation, role):
-        if role == Qt.ItemDataRole.DisplayRole and self._data is not None and not self._data.empty:
+        if role == Qt.ItemDataRole.DisplayRole and self._columns:
             if orientation == Qt.Orientation.Horizontal:
-                return str(self._data.columns[section])
+                return self._columns[section]
         return None
 
 
+# sorted row numbers -> [(first, last), ...] of consecutive runs
+def _runs(rows):
+    runs = []
+    for row in rows:
+        if runs and runs[-1][1] == row - 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return [tuple(run) for run in runs]
+
+
+# live mode rescans on its own, either as soon as the prefetcher swaps in a new
+# /latest or /5m snapshot, or every liveInterval seconds. a rescan only runs when
+# those snapshots' versions moved on from the ones the table shows, and goes
+# through the incremental scanner, so only items whose quotes changed are redone
 class ScannerController(QObject):
     resultsReady = Signal(object)  # pd.DataFrame
     error = Signal(str)
     busyChanged = Signal(bool)
     lastScanTimeChanged = Signal(str)
 
+    # snapshots the scan reads, kept warm in the background
+    PREFETCH = ["mapping", "latest", "fiveMinAve"]
+
+    # a new version of either starts a live rescan
+    LIVE_SNAPSHOTS = ["latest", "fiveMinAve"]
+
     def __init__(self):
         super().__init__()
-        self._busy = False
-        self._thread = None
-        self._worker = None
 
-    def _setBusy(self, v: bool):
-        if self._busy != v:
-            self._busy = v
-            self.busyChanged.emit(v)
+        # scans run on the shared pool's controller, whose prefetcher keeps the scan's
+        # snapshots fresh in memory, so a scan rarely waits on the network
+        self._pool = sharedPool()
+        self._pool.controller().geapi.startPrefetcher(self.PREFETCH)
+
+        # a scan requested while one runs shares its result
+        self._jobs = JobScheduler(self, self._pool)
+        self._jobs.busyChanged.connect(self.busyChanged)
+
+        self.live = False
+        self.liveInterval = 0      # seconds, 0 follows the prefetcher
+        self._nextLiveScan = None  # unix time of the next interval rescan
+        self._shownVersions = None # LIVE_SNAPSHOTS versions of the rows on screen
+        self._liveVersions = None  # versions of the live rescan submitted last
+
+    def snapshotAges(self):
+        return self._pool.controller().geapi.getSnapshotAges()
+
+    def _loadedVersions(self):
+        geapi = self._pool.controller().geapi
+        return tuple(geapi.getSnapshotVersion(name, load=False) for name in self.LIVE_SNAPSHOTS)
 
     @Slot()
     def scan(self):
-        if self._busy:
-            return
-        self._setBusy(True)
+        self._jobs.submit(("scan",), SCAN_STAGES, self._onResult, self.error.emit)
 
-        self._thread = QThread(self)
-        self._worker = ScanWorker()
-        self._worker.moveToThread(self._thread)
+    @Slot(bool)
+    def setLive(self, live):
+        self.live = live
+        self._liveVersions = None
+        self._nextLiveScan = time.time() if live and self.liveInterval else None
+        self.checkLive()
+
+    @Slot(int)
+    def setLiveInterval(self, seconds):
+        self.liveInterval = seconds
+        self._nextLiveScan = time.time() + seconds if self.live and seconds else None
+
+    # called once a second while the view is up, cheap when nothing is due
+    @Slot()
+    def checkLive(self):
+        if not self.live:
+            return
 
-        self._thread.started.connect(self._worker.run)
-        self._worker.result.connect(self._onResult)
-        self._worker.error.connect(self.error)
+        if self.liveInterval:
+            if time.time() < self._nextLiveScan:
+                return
+            # fixed schedule, a slow rescan doesn't push the next ones back
+            while self._nextLiveScan <= time.time():
+                self._nextLiveScan += self.liveInterval
+            # whether the data moved on is only known once the job has loaded it. a
+            # scan still running covers this tick
+            if not self._jobs.isBusy():
+                self._jobs.submit(("live",), liveScanStages(self._shownVersions), self._onLiveResult, self.error.emit)
+            return
 
-        self._worker.finished.connect(self._thread.quit)
-        self._worker.finished.connect(self._worker.deleteLater)
-        self._thread.finished.connect(self._thread.deleteLater)
-        self._thread.finished.connect(self._onFinished)
+        # only the in-memory versions, the prefetcher does the fetching
+        versions = self._loadedVersions()
+        if None in versions or versions == self._shownVersions or versions == self._liveVersions:
+            return
+        self._liveVersions = versions
+        self._jobs.submit(("live", versions), liveScanStages(self._shownVersions), self._onLiveResult, self.error.emit)
 
-        self._thread.start()
+    # unix time of the next rescan (interval) or of the next expected snapshot, None
+    # when not live or nothing has been loaded yet
+    def nextLiveRefresh(self):
+        if not self.live:
+            return None
+        if self.liveInterval:
+            return self._nextLiveScan
 
-    @Slot()
-    def _onFinished(self):
-        self._worker = None
-        self._thread = None
-        self._setBusy(False)
+        geapi = self._pool.controller().geapi
+        due = [geapi.nextRefreshAt(name) for name in self.LIVE_SNAPSHOTS]
+        due = [at for at in due if at is not None]
+        return min(due) if due else None
 
     @Slot(object)
-    def _onResult(self, df: pd.DataFrame):
+    def _onResult(self, result):
+        versions, df = result
+        self._shownVersions = versions
         self.resultsReady.emit(df)
         self.lastScanTimeChanged.emit(datetime.now().strftime("%H:%M:%S"))
 
+    # (versions, ScanDelta), the delta is None when the versions hadn't changed.
+    # the full result is always applied: the scanner's previous state can be a
+    # superseded job's whose rows never reached the table, and the model's keyed diff
+    # leaves unchanged rows alone anyway
+    @Slot(object)
+    def _onLiveResult(self, result):
+        versions, delta = result
+        if delta is None:
+            return
 
-class ScanWorker(QObject):
-    finished = Signal()
-    result = Signal(object)   # pd.DataFrame
-    error = Signal(str)
+        self._shownVersions = versions
+        self.resultsReady.emit(delta.result)
+        self.lastScanTimeChanged.emit(datetime.now().strftime("%H:%M:%S"))
 
-    def __init__(self):
-        super().__init__()
-        self._controller = GeController()
 
-    @Slot()
-    def run(self):
-        try:
-            df = self._controller.findWidestSpreads()
-            self.result.emit(df)
-        except Exception:
-            self.error.emit(traceback.format_exc())
-        finally:
-            self.finished.emit()
\ No newline at end of file
+# scan job stages. fetching brings in whatever of the scan's snapshots is missing
+# (or stale, without the prefetcher), so computing only reads memory. both pass
+# along the versions the result is computed from
+def _fetchScanSnapshots(controller):
+    for name in ScannerController.PREFETCH:
+        controller.geapi.getSnapshotVersion(name)
+    return tuple(controller.geapi.getSnapshotVersion(name, load=False) for name in ScannerController.LIVE_SNAPSHOTS)
+
+
+def _computeScan(controller, versions):
+    return versions, controller.findWidestSpreads()
+
+
+SCAN_STAGES = [_fetchScanSnapshots, _computeScan]
+
+
+# a live rescan skips computing when the snapshots are still the ones shownVersions
+# came from
+def liveScanStages(shownVersions):
+    def computeLiveScan(controller, versions):
+        if versions == shownVersions:
+            return versions, None
+        return versions, controller.findWidestSpreadsIncremental()
+
+    return [_fetchScanSnapshots, computeLiveScan]
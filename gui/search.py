@@ -1,9 +1,9 @@
 import pandas as pd
-import numpy as np
-import traceback
-from typing import Optional
+import re
+from typing import List, Optional
 
 from PySide6.QtWidgets import (
+                        QCompleter,
                         QWidget,
                         QVBoxLayout,
                         QLabel,
@@ -17,15 +17,20 @@ from PySide6.QtWidgets import (
                     )
 
 from PySide6.QtCore import (
-    QAbstractTableModel, Qt, QObject, QThread, Signal, Slot, QSortFilterProxyModel
+    QAbstractTableModel, Qt, QObject, Signal, Slot, QStringListModel
 )
 
 from PySide6.QtGui import QFont
 
+from .tablecache import columnCaches
 from .widgets import LineSep
-from controller import GeController
+from .workers import JobScheduler, sharedPool
 
 class SearchView(QWidget):
+
+    # names offered by the completer popup
+    COMPLETIONS = 10
+
     def __init__(self):
         super().__init__()
 
@@ -49,6 +54,7 @@ class SearchView(QWidget):
         # UI -> controller
         self.controlBar.itemSearchPushButton.clicked.connect(self._onSearchClicked)
         self.controlBar.itemIdSearchField.returnPressed.connect(self._onSearchClicked)
+        self.controlBar.itemIdSearchField.textEdited.connect(self._onSearchEdited)
 
         # controller -> UI
         self.controller.latestReady.connect(self.tables.latestTableModel.setDataFrame)
@@ -57,18 +63,74 @@ class SearchView(QWidget):
         self.controller.busyChanged.connect(self.controlBar.setBusy)
         self.controller.error.connect(self._onError)
 
+        # name type-ahead, the index is loaded (or built) on the worker pool
+        self.nameIndex = None
+        self._completionIds = {}  # completer label -> item id
+        self.controller.nameIndexReady.connect(self._setNameIndex)
+        self.controlBar.nameCompleter.activated[str].connect(self._onNamePicked)
+        self.controller.loadNameIndex()
+
     @Slot()
     def _onSearchClicked(self):
         txt = self.controlBar.itemIdSearchField.text().strip()
         try:
-            item_id = int(txt)
-            if item_id <= 0:
-                raise ValueError()
+            item_ids = parseItemIds(txt)
         except ValueError:
-            QMessageBox.warning(self, "Invalid item id", "Enter a positive integer item id.")
+            item_id = self._matchName(txt)
+            if item_id is None:
+                QMessageBox.warning(self, "No matching item", "Enter an item name, or one or more positive integer item ids separated by commas or spaces.")
+                return
+            item_ids = [item_id]
+
+        self.controller.search(item_ids)
+
+    # id lists are searched as they are typed (once the input settles), anything else
+    # is a name and gets completions
+    @Slot(str)
+    def _onSearchEdited(self, txt: str):
+        try:
+            item_ids = parseItemIds(txt.strip())
+        except ValueError:
+            self.controller.cancelSearch()
+            self._complete(txt)
+            return
+
+        self.controlBar.setCompletions([])
+        self.controller.searchDebounced(item_ids)
+
+    @Slot(object)
+    def _setNameIndex(self, nameIndex):
+        self.nameIndex = nameIndex
+
+    def _complete(self, txt: str):
+        if self.nameIndex is None:
             return
 
-        self.controller.search(item_id)
+        self._completionIds = {}
+        labels = []
+        for item_id, name in self.nameIndex.search(txt, self.COMPLETIONS):
+            label = name if name not in self._completionIds else f"{name} ({item_id})"
+            self._completionIds[label] = item_id
+            labels.append(label)
+
+        self.controlBar.setCompletions(labels)
+
+    # a label from the popup, otherwise the best match for whatever was typed
+    def _matchName(self, txt: str) -> Optional[int]:
+        if txt in self._completionIds:
+            return self._completionIds[txt]
+        if self.nameIndex is None:
+            return None
+        matches = self.nameIndex.search(txt, 1)
+        return matches[0][0] if matches else None
+
+    @Slot(str)
+    def _onNamePicked(self, label: str):
+        item_id = self._completionIds.get(label)
+        if item_id is None:
+            return
+        self.controlBar.itemIdSearchField.setText(label)
+        self.controller.search([item_id])
 
     @Slot(object)
     def _applyInfo(self, info: dict):
@@ -91,17 +153,39 @@ class SearchView(QWidget):
         # You can replace with QMessageBox.critical(...)
         print(tb)
 
+# "391, 2 4151" -> [391, 2, 4151], duplicates dropped, order kept
+def parseItemIds(txt: str) -> List[int]:
+    parts = [p for p in re.split(r"[,\s]+", txt) if p]
+    if not parts:
+        raise ValueError("no item ids")
+
+    item_ids = []
+    for part in parts:
+        item_id = int(part)
+        if item_id <= 0:
+            raise ValueError(f"invalid item id {part}")
+        if item_id not in item_ids:
+            item_ids.append(item_id)
+    return item_ids
+
 class SearchControlBar(QWidget):
     def __init__(self):
         super().__init__()
         layout = QHBoxLayout()
 
-        layout.addWidget(QLabel("Item Id: "))
+        layout.addWidget(QLabel("Item: "))
 
         self.itemIdSearchField = QLineEdit()
-        self.itemIdSearchField.setMaximumWidth(75)
+        self.itemIdSearchField.setPlaceholderText("name, or id(s) e.g. 391, 2, 4151")
+        self.itemIdSearchField.setMaximumWidth(250)
         layout.addWidget(self.itemIdSearchField)
 
+        # the name index does the matching and ranking, the popup shows its list as is
+        self.completionModel = QStringListModel(self)
+        self.nameCompleter = QCompleter(self.completionModel, self)
+        self.nameCompleter.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.nameCompleter.setWidget(self.itemIdSearchField)
+
         layout.addStretch()
 
         self.itemSearchPushButton = QPushButton("Search", self)
@@ -109,10 +193,16 @@ class SearchControlBar(QWidget):
 
         self.setLayout(layout)
 
+    def setCompletions(self, labels: List[str]):
+        self.completionModel.setStringList(labels)
+        if labels:
+            self.nameCompleter.complete()
+        else:
+            self.nameCompleter.popup().hide()
+
+    # a new search supersedes the one running, so the input stays live
     @Slot(bool)
     def setBusy(self, busy: bool):
-        self.itemSearchPushButton.setEnabled(not busy)
-        self.itemIdSearchField.setEnabled(not busy)
         self.itemSearchPushButton.setText("Searching..." if busy else "Search")
 
 class SearchItemInfo(QWidget):
@@ -213,131 +303,136 @@ class SearchTableContainer(QWidget):
 
         self.setLayout(layout)
 
+# display strings and sort keys are built once per result (see tablecache.py),
+# data() only indexes into them
 class SearchViewTableModel(QAbstractTableModel):
     def __init__(self, df: pd.DataFrame):
         super().__init__()
-        self._data = df
+        self._load(df)
+
+    def _load(self, df):
+        df = df if df is not None else pd.DataFrame()
+        self._columns = [str(c) for c in df.columns]
+        self._rowCount = len(df)
+        self._display, self._sortKeys = columnCaches(df)
 
     @Slot(object)
     def setDataFrame(self, df: pd.DataFrame):
         self.beginResetModel()
-        self._data = df if df is not None else pd.DataFrame()
+        self._load(df)
         self.endResetModel()
 
     def rowCount(self, parent=None):
-        return 0 if self._data is None else self._data.shape[0]
+        return self._rowCount
 
     def columnCount(self, parent=None):
-        return 0 if self._data is None else self._data.shape[1]
+        return len(self._columns)
 
     def data(self, index, role):
-        if not index.isValid() or self._data is None or self._data.empty:
+        if not index.isValid():
             return None
 
-        value = self._data.iat[index.row(), index.column()]
-
         # Center all cell contents
         if role == Qt.ItemDataRole.TextAlignmentRole:
             return Qt.AlignmentFlag.AlignCenter
 
         # Raw values for sorting
         if role == Qt.ItemDataRole.UserRole:
-            if pd.isna(value):
-                return None
-            if isinstance(value, (np.generic,)):
-                return value.item()
-            return value
+            return self._sortKeys[index.column()][index.row()]
 
         # Display text
         if role == Qt.ItemDataRole.DisplayRole:
-            if pd.isna(value):
-                return ""
-            return str(value)
+            return self._display[index.column()][index.row()]
 
         return None
     
     def headerData(self, section, orientation, role):
         if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
-            if self._data is not None and not self._data.empty:
-                return str(self._data.columns[section])
+            if self._columns:
+                return self._columns[section]
         return None
     
 
-class SearchWorker(QObject):
-    finished = Signal()
-    result = Signal(object, object, object)  # latest_df, five_df, info_dict
-    error = Signal(str)
+# search job stages: one quote request for every id, then the tables as
+# (latest_df, five_df, info for the first id)
+def searchStages(item_ids: List[int]):
+    return [
+        lambda controller: controller.getLatestMany(item_ids),
+        lambda controller, results: searchFrames(item_ids, results),
+    ]
 
-    def __init__(self, item_id: int):
-        super().__init__()
-        self._controller = GeController()
-        self._item_id = item_id
 
-    @Slot()
-    def run(self):
-        try:
-            latest, five, info = self._controller.getLatest(self._item_id)
+def searchFrames(item_ids: List[int], results):
+    latest_rows = []
+    five_rows = []
+    for item_id in item_ids:
+        latest, five, _ = results[item_id]
+        if latest:
+            latest_rows.append({"item_id": item_id, **latest})
+        if five:
+            five_rows.append({"item_id": item_id, **five})
+
+    latest_df = pd.DataFrame(latest_rows)
+    five_df   = pd.DataFrame(five_rows)
 
-            latest_df = pd.DataFrame([latest]) if latest else pd.DataFrame()
-            five_df   = pd.DataFrame([five]) if five else pd.DataFrame()
+    # item details are shown for the first id
+    info = results[item_ids[0]][2]
 
-            self.result.emit(latest_df, five_df, info or {})
-        except Exception:
-            self.error.emit(traceback.format_exc())
-        finally:
-            self.finished.emit()
+    return latest_df, five_df, info or {}
 
 
 class SearchController(QObject):
     latestReady = Signal(object)      # pd.DataFrame
     fiveReady = Signal(object)        # pd.DataFrame
     infoReady = Signal(object)        # dict
+    nameIndexReady = Signal(object)   # namesearch.NameIndex
     busyChanged = Signal(bool)
     error = Signal(str)
 
     def __init__(self):
         super().__init__()
-        self._busy = False
-        self._thread = None
-        self._worker = None
-
-    def _setBusy(self, v: bool):
-        if self._busy != v:
-            self._busy = v
-            self.busyChanged.emit(v)
-
-    @Slot(int)
-    def search(self, item_id: int):
-        if self._busy:
-            return
+        self._pool = sharedPool()
 
-        self._setBusy(True)
+        # the same ids while a search runs share it, different ids supersede it
+        self._jobs = JobScheduler(self, self._pool)
+        self._jobs.busyChanged.connect(self.busyChanged)
 
-        self._thread = QThread(self)
-        self._worker = SearchWorker(item_id=item_id)
-        self._worker.moveToThread(self._thread)
-
-        self._thread.started.connect(self._worker.run)
-        self._worker.result.connect(self._onResult)
-        self._worker.error.connect(self.error)
+    # the mapping's name index, from memory or disk unless the names changed
+    @Slot()
+    def loadNameIndex(self):
+        self._pool.submit(
+            lambda controller: controller.geapi.getNameIndex(),
+            onResult=self.nameIndexReady.emit,
+            onError=self.error.emit
+        )
+
+    @staticmethod
+    def _key(item_ids):
+        if isinstance(item_ids, int):
+            item_ids = [item_ids]
+        return list(item_ids), ("search", tuple(item_ids))
 
-        self._worker.finished.connect(self._thread.quit)
-        self._worker.finished.connect(self._worker.deleteLater)
-        self._thread.finished.connect(self._thread.deleteLater)
-        self._thread.finished.connect(self._onFinished)
+    @Slot(object)
+    def search(self, item_ids):
+        item_ids, key = self._key(item_ids)
+        self._jobs.submit(key, searchStages(item_ids), self._onResult, self.error.emit)
 
-        self._thread.start()
+    # for input as it is typed, runs once it has been still for a moment
+    @Slot(object)
+    def searchDebounced(self, item_ids):
+        item_ids, key = self._key(item_ids)
+        self._jobs.submitDebounced(key, searchStages(item_ids), self._onResult, self.error.emit)
 
     @Slot()
-    def _onFinished(self):
-        self._worker = None
-        self._thread = None
-        self._setBusy(False)
+    def cancelSearch(self):
+        self._jobs.cancel()
 
-    @Slot(object, object, object)
-    def _onResult(self, latest_df, five_df, info):
+    @Slot(object)
+    def _onResult(self, result):
+        latest_df, five_df, info = result
         self.latestReady.emit(latest_df)
         self.fiveReady.emit(five_df)
         self.infoReady.emit(info)
 
-
+        # a search may have refreshed the mapping, the index follows if the names changed
+        self.loadNameIndex()
@@ -0,0 +1,171 @@
+'''
+    display / sort caches for the table models
+
+    a view asks its model for every visible cell on each paint, and a sorting proxy
+    asks for two sort keys per comparison. going to the DataFrame for each of those
+    (iat, pd.isna, numpy scalar -> python, str) is what made scrolling and sorting
+    slow, so the models convert each cell once when data arrives and data() just
+    indexes into plain python lists.
+
+    run this module to time paint and sort for both models and both sort proxies,
+    against the plain DataFrame model they replaced (the first row, the baseline):
+        python -m gui.tablecache [rows]
+'''
+
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def _isMissing(value):
+    return value is None or value is pd.NA or value is pd.NaT or (isinstance(value, float) and math.isnan(value))
+
+
+# python value used for sorting, None for missing cells
+def sortKey(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    return None if _isMissing(value) else value
+
+
+def displayText(value):
+    value = sortKey(value)
+    return "" if value is None else str(value)
+
+
+# sort keys per column for a DataFrame, as lists indexed [column][row]
+def columnKeys(df):
+    keys = []
+    for column in df.columns:
+        series = df[column]
+
+        # tolist() already hands back python scalars, only columns that can hold
+        # missing values need a look at each cell
+        if series.dtype.kind in "iub":
+            keys.append(series.tolist())
+        else:
+            keys.append([sortKey(value) for value in series.tolist()])
+    return keys
+
+
+# (display strings, sort keys) per column for a DataFrame
+def columnCaches(df):
+    keys = columnKeys(df)
+    display = [["" if key is None else str(key) for key in column] for column in keys]
+    return display, keys
+
+
+def benchmark(rows=5000, repeat=5):
+    import os
+    import time
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    from PySide6.QtCore import QAbstractTableModel, QSortFilterProxyModel, Qt
+    from PySide6.QtWidgets import QApplication, QTableView
+
+    from .arrayproxy import ArraySortFilterProxyModel
+    from .scanner import ScannerViewTableModel
+    from .search import SearchViewTableModel
+
+    app = QApplication.instance() or QApplication([])
+
+    # the table model before the caches: every data() call goes back to the DataFrame
+    class DataFrameTableModel(QAbstractTableModel):
+
+        def __init__(self, df):
+            super().__init__()
+            self._data = df
+
+        def setDataFrame(self, df):
+            self.beginResetModel()
+            self._data = df
+            self.endResetModel()
+
+        def rowCount(self, parent=None):
+            return self._data.shape[0]
+
+        def columnCount(self, parent=None):
+            return self._data.shape[1]
+
+        def data(self, index, role):
+            if not index.isValid() or self._data.empty:
+                return None
+
+            value = self._data.iat[index.row(), index.column()]
+            if role == Qt.ItemDataRole.TextAlignmentRole:
+                return Qt.AlignmentFlag.AlignCenter
+            if role == Qt.ItemDataRole.UserRole:
+                if pd.isna(value):
+                    return None
+                return value.item() if isinstance(value, np.generic) else value
+            if role == Qt.ItemDataRole.DisplayRole:
+                return "" if pd.isna(value) else str(value)
+            return None
+
+        def headerData(self, section, orientation, role):
+            if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+                return str(self._data.columns[section])
+            return None
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "item_id": np.arange(rows),
+        "item_name": [f"item {i}" for i in range(rows)],
+        "item_limit": rng.integers(1, 25000, rows),
+        "low": rng.integers(1, 10 ** 6, rows),
+        "vol (5m)": rng.integers(1, 10 ** 5, rows),
+        "high": rng.integers(1, 10 ** 6, rows),
+        "netSpreadPct": rng.random(rows).round(2),
+        "lastTradeReadable": ["12:00:00"] * rows,
+        "lastTradeTime": rng.integers(1.7e9, 1.8e9, rows),
+    })
+
+    baseline = None
+    for modelClass, proxyClass in (
+        (DataFrameTableModel, QSortFilterProxyModel),
+        (ScannerViewTableModel, ArraySortFilterProxyModel),
+        (ScannerViewTableModel, QSortFilterProxyModel),
+        (SearchViewTableModel, QSortFilterProxyModel),
+    ):
+        model = modelClass(pd.DataFrame())
+        proxy = proxyClass()
+        if proxyClass is QSortFilterProxyModel:
+            proxy.setSortRole(Qt.ItemDataRole.UserRole)
+        proxy.setSourceModel(model)
+
+        view = QTableView()
+        view.setModel(proxy)
+        view.resize(1200, 800)
+        view.show()
+
+        start = time.perf_counter()
+        model.setDataFrame(df)
+        loadMs = (time.perf_counter() - start) * 1000
+
+        # the first paint pays for one-off Qt / enum setup
+        view.viewport().grab()
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            view.viewport().grab()
+        paintMs = (time.perf_counter() - start) / repeat * 1000
+
+        start = time.perf_counter()
+        for i in range(repeat):
+            proxy.sort(3 + i % 3, Qt.SortOrder.AscendingOrder if i % 2 else Qt.SortOrder.DescendingOrder)
+        sortMs = (time.perf_counter() - start) / repeat * 1000
+
+        if baseline is None:
+            baseline = (paintMs, sortMs)
+        speedup = f"({baseline[0] / paintMs:.1f}x / {baseline[1] / sortMs:.1f}x of baseline)"
+
+        print(f"{modelClass.__name__:<22} {proxyClass.__name__:<26} {rows} rows  load {loadMs:>7.1f} ms  paint {paintMs:>7.1f} ms  sort {sortMs:>7.1f} ms  {speedup}")
+        app.processEvents()
+
+
+if __name__ == "__main__":
+    import sys
+
+    benchmark(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,249 @@
+'''
+    process wide worker pool for the views
+
+    scans and searches used to get a new QThread, worker, GeController, Geapi and
+    requests.Session on every click, all thrown away afterwards. they are now tasks
+    on one long lived QThreadPool sharing a single GeController, so repeat requests
+    reuse its keep-alive (TLS) connection and the snapshots it already holds in
+    memory. the scanner's prefetcher runs on the same controller, so a scan reads
+    what the prefetcher fetched without going back to disk.
+
+    a task is a callable taking the controller. its return value comes back on the
+    gui thread through the result signal, an exception as a formatted traceback
+    through error, and finished follows either way:
+
+        sharedPool().submit(lambda controller: controller.findWidestSpreads(),
+                            onResult=model.setDataFrame)
+
+    the views go through a JobScheduler instead, which runs a request as stages
+    (fetch, then compute) and decides what is still worth running: a request for
+    the job already in flight shares its result, a different request supersedes it
+    (the old one stops at its next stage boundary and its result is dropped), and
+    type-ahead requests wait until the input settles.
+'''
+
+import threading
+import traceback
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, QTimer, Signal, Slot
+
+# a scan and a search can run side by side, more only queues on the rate limit
+MAX_THREADS = 2
+
+
+# raised at a stage boundary of a cancelled Job, ends its task quietly
+class JobCancelled(Exception):
+    pass
+
+
+class TaskSignals(QObject):
+    result = Signal(object)
+    error = Signal(str)
+    finished = Signal()
+
+
+class Task(QRunnable):
+
+    def __init__(self, pool, fn):
+        super().__init__()
+        # the pool keeps a reference until finished, Qt mustn't delete it under python
+        self.setAutoDelete(False)
+        self.pool = pool
+        self.fn = fn
+        self.signals = TaskSignals()
+
+    def run(self):
+        try:
+            self.signals.result.emit(self.fn(self.pool.controller()))
+        except JobCancelled:
+            pass
+        except Exception:
+            self.signals.error.emit(traceback.format_exc())
+        finally:
+            self.signals.finished.emit()
+
+
+class WorkerPool:
+
+    def __init__(self, maxThreads=MAX_THREADS):
+        self.threadPool = QThreadPool()
+        self.threadPool.setMaxThreadCount(maxThreads)
+        # the threads stay up between clicks
+        self.threadPool.setExpiryTimeout(-1)
+
+        self._controller = None
+        self._controllerLock = threading.Lock()
+        self._tasks = set()
+
+    # the shared GeController, created on first use. safe from any thread
+    def controller(self):
+        with self._controllerLock:
+            if self._controller is None:
+                from controller import GeController
+                self._controller = GeController()
+            return self._controller
+
+    # runs fn(controller) on the pool, the callbacks are called on the gui thread
+    def submit(self, fn, onResult=None, onError=None, onFinished=None):
+        task = Task(self, fn)
+
+        if onResult is not None:
+            task.signals.result.connect(onResult)
+        if onError is not None:
+            task.signals.error.connect(onError)
+        if onFinished is not None:
+            task.signals.finished.connect(onFinished)
+
+        self._tasks.add(task)
+        task.signals.finished.connect(lambda: self._tasks.discard(task))
+
+        self.threadPool.start(task)
+        return task
+
+    # drops a task that hasn't started yet, False if it is already running
+    def withdraw(self, task):
+        if not self.threadPool.tryTake(task):
+            return False
+        self._tasks.discard(task)
+        return True
+
+
+_sharedPool = None
+
+
+def sharedPool():
+    global _sharedPool
+    if _sharedPool is None:
+        _sharedPool = WorkerPool()
+    return _sharedPool
+
+
+# a request run as stages: the first gets the controller, every later one the
+# controller and the previous stage's result. cancel() is checked before each stage,
+# so a superseded job stops between fetching and computing
+class Job:
+
+    def __init__(self, key, stages):
+        self.key = key
+        self.stages = stages
+        self.callbacks = []  # (onResult, onError) of every request sharing this job
+        self.task = None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def isCancelled(self):
+        return self._cancelled.is_set()
+
+    def __call__(self, controller):
+        value = None
+        for i, stage in enumerate(self.stages):
+            if self._cancelled.is_set():
+                raise JobCancelled(self.key)
+            value = stage(controller) if i == 0 else stage(controller, value)
+        return value
+
+
+# one lane of work for a view: at most one job whose result is still wanted
+class JobScheduler(QObject):
+    busyChanged = Signal(bool)
+
+    DEBOUNCE_MS = 300
+
+    def __init__(self, parent=None, pool=None):
+        super().__init__(parent)
+        self.pool = pool or sharedPool()
+        self._current = None
+        self._busy = False
+
+        self._pending = None
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.timeout.connect(self._submitPending)
+
+        # how requests were handled
+        self.stats = {"submitted": 0, "coalesced": 0, "superseded": 0, "debounced": 0}
+
+    def _setBusy(self, busy):
+        if self._busy != busy:
+            self._busy = busy
+            self.busyChanged.emit(busy)
+
+    def isBusy(self):
+        return self._busy
+
+    # runs stages for key now. the same key as the job in flight joins it, any other
+    # key cancels it
+    def submit(self, key, stages, onResult, onError=None):
+        self._debounce.stop()
+        self._pending = None
+
+        current = self._current
+        if current is not None and current.key == key and not current.isCancelled():
+            current.callbacks.append((onResult, onError))
+            self.stats["coalesced"] += 1
+            return current
+
+        if current is not None:
+            self._supersede(current)
+
+        job = Job(key, stages)
+        job.callbacks.append((onResult, onError))
+        self._current = job
+        self.stats["submitted"] += 1
+        self._setBusy(True)
+
+        job.task = self.pool.submit(
+            job,
+            onResult=lambda result: self._onResult(job, result),
+            onError=lambda tb: self._onError(job, tb),
+            onFinished=lambda: self._onFinished(job)
+        )
+        return job
+
+    # submit once no other request has come in for delayMs, for input as it is typed
+    def submitDebounced(self, key, stages, onResult, onError=None, delayMs=None):
+        if self._pending is not None:
+            self.stats["debounced"] += 1
+        self._pending = (key, stages, onResult, onError)
+        self._debounce.start(self.DEBOUNCE_MS if delayMs is None else delayMs)
+
+    # drops the pending request and cancels the job in flight
+    def cancel(self):
+        self._debounce.stop()
+        self._pending = None
+        if self._current is not None:
+            self._supersede(self._current)
+            self._current = None
+            self._setBusy(False)
+
+    def _supersede(self, job):
+        job.cancel()
+        self.stats["superseded"] += 1
+        # still queued behind other work, it never has to start
+        if job.task is not None:
+            self.pool.withdraw(job.task)
+
+    @Slot()
+    def _submitPending(self):
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            self.submit(*pending)
+
+    # results and errors of superseded jobs are dropped
+    def _onResult(self, job, result):
+        if job is self._current and not job.isCancelled():
+            for onResult, _ in job.callbacks:
+                onResult(result)
+
+    def _onError(self, job, tb):
+        if job is self._current and not job.isCancelled():
+            for _, onError in job.callbacks:
+                if onError is not None:
+                    onError(tb)
+
+    def _onFinished(self, job):
+        if job is self._current:
+            self._current = None
+            self._setBusy(False)
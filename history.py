@@ -0,0 +1,194 @@
+'''
+    append-only price history
+
+    every fetched /latest, /5m, /1h, /6h and /24h snapshot is appended to columnar
+    segments instead of being thrown away on the next save. layout:
+
+        <root>/<snapshot name>/<YYYY-MM-DD>/b<NN>.seg   records for item_id % ITEM_BUCKETS == NN
+        <root>/<snapshot name>/<YYYY-MM-DD>/snapshots   timestamps of whole snapshots ingested that day
+
+    a record is ITEM_FIELDS + the snapshot's columns as little endian int64
+    (see columnar.py for the columns and the NULL sentinel). segments are only ever
+    appended to, and the day / item bucket split is the per-item index: a range
+    query for one item reads one segment per day in the range and nothing else.
+'''
+
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from columnar import NULL, snapshotArrays
+
+ITEM_BUCKETS = 64
+ITEM_FIELDS = ("timestamp", "item_id")
+
+DAY_SECONDS = 24 * 60 * 60
+
+
+def dayOf(ts):
+    return datetime.fromtimestamp(int(ts), tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+# utc day partitions touched by [start, end]
+def daysBetween(start, end):
+    day = datetime.fromtimestamp(int(start), tz=timezone.utc).date()
+    last = datetime.fromtimestamp(int(end), tz=timezone.utc).date()
+
+    while day <= last:
+        yield day.strftime("%Y-%m-%d")
+        day += timedelta(days=1)
+
+
+# a single write() on an O_APPEND descriptor, so concurrent writers don't interleave records
+def _append(path, raw):
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, raw)
+    finally:
+        os.close(fd)
+
+
+class HistoryStore:
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _dayDir(self, name, day):
+        return self.root / name / day
+
+    def _fieldCount(self, columns):
+        return len(ITEM_FIELDS) + len(columns)
+
+    # timestamps of whole snapshots ingested on a day
+    def snapshotTimestamps(self, name, day):
+        path = self._dayDir(name, day) / "snapshots"
+        if not path.exists():
+            return np.empty(0, dtype=np.int64)
+        raw = path.read_bytes()
+        return np.frombuffer(raw[:len(raw) // 8 * 8], dtype=np.int64)
+
+    def snapshotTimestampsBetween(self, name, start, end):
+        timestamps = []
+        for day in daysBetween(start, end):
+            stored = self.snapshotTimestamps(name, day)
+            timestamps.extend(int(ts) for ts in np.unique(stored[(stored >= start) & (stored <= end)]))
+        return timestamps
+
+    def hasSnapshot(self, name, ts):
+        return bool((self.snapshotTimestamps(name, dayOf(ts)) == int(ts)).any())
+
+    # appends a whole snapshot, keyed on its server timestamp (bucketed data) or the
+    # fetch time (/latest). returns False when that snapshot was already stored
+    def ingest(self, name, snapshot, columns):
+        ts = snapshot.get("timestamp") or snapshot["retrieved_at"]
+        if self.hasSnapshot(name, ts):
+            return False
+
+        ids, values = snapshotArrays(snapshot, columns)
+        records = np.empty((len(ids), self._fieldCount(columns)), dtype=np.int64)
+        records[:, 0] = ts
+        records[:, 1] = ids
+        for i, column in enumerate(columns):
+            records[:, len(ITEM_FIELDS) + i] = values[column]
+
+        self.appendRecords(name, records)
+        _append(self._dayDir(name, dayOf(ts)) / "snapshots", np.array([ts], dtype="<i8").tobytes())
+        return True
+
+    # records: int64 rows of (timestamp, item_id, *columns), any mix of days and items
+    def appendRecords(self, name, records):
+        records = np.asarray(records, dtype="<i8")
+        if len(records) == 0:
+            return
+
+        days = records[:, 0] // DAY_SECONDS
+        buckets = records[:, 1] % ITEM_BUCKETS
+        keys = days * ITEM_BUCKETS + buckets
+
+        order = np.argsort(keys, kind="stable")
+        records = records[order]
+        keys = keys[order]
+
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        ends = np.r_[starts[1:], len(keys)]
+
+        for start, end in zip(starts, ends):
+            dayDir = self._dayDir(name, dayOf(records[start, 0]))
+            dayDir.mkdir(parents=True, exist_ok=True)
+            _append(dayDir / f"b{int(records[start, 1]) % ITEM_BUCKETS:02d}.seg", records[start:end].tobytes())
+
+    # records for one item with start <= timestamp <= end, oldest first. when a timestamp
+    # was stored more than once (e.g. backfill overlapping a live fetch) the last write wins
+    def itemRecords(self, name, itemId, start, end, columns):
+        itemId = int(itemId)
+        width = self._fieldCount(columns)
+        bucket = itemId % ITEM_BUCKETS
+
+        parts = []
+        for day in daysBetween(start, end):
+            path = self._dayDir(name, day) / f"b{bucket:02d}.seg"
+            if not path.exists():
+                continue
+
+            segment = np.fromfile(path, dtype="<i8")
+            segment = segment[:len(segment) // width * width].reshape(-1, width)
+
+            mask = (segment[:, 1] == itemId) & (segment[:, 0] >= start) & (segment[:, 0] <= end)
+            if mask.any():
+                parts.append(segment[mask])
+
+        if not parts:
+            return np.empty((0, width), dtype=np.int64)
+
+        records = np.concatenate(parts)
+
+        # keep the last occurrence of each timestamp, sorted by timestamp
+        reversedTs = records[::-1, 0]
+        _, firstInReversed = np.unique(reversedTs, return_index=True)
+        return records[len(records) - 1 - firstInReversed]
+
+    # itemId -> sorted timestamps stored for it in [start, end]. reads each day's
+    # segment once however many of the items share it
+    def itemTimestamps(self, name, itemIds, start, end, columns):
+        width = self._fieldCount(columns)
+        itemIds = np.unique(np.asarray(list(itemIds), dtype=np.int64))
+        buckets = np.unique(itemIds % ITEM_BUCKETS)
+
+        parts = []
+        for day in daysBetween(start, end):
+            for bucket in buckets:
+                path = self._dayDir(name, day) / f"b{int(bucket):02d}.seg"
+                if not path.exists():
+                    continue
+
+                segment = np.fromfile(path, dtype="<i8")
+                segment = segment[:len(segment) // width * width].reshape(-1, width)[:, :2]
+
+                mask = np.isin(segment[:, 1], itemIds) & (segment[:, 0] >= start) & (segment[:, 0] <= end)
+                if mask.any():
+                    parts.append(segment[mask])
+
+        found = {int(itemId): np.empty(0, dtype=np.int64) for itemId in itemIds}
+        if parts:
+            records = np.unique(np.concatenate(parts), axis=0)
+            # unique sorts by timestamp first, the split needs each item's rows together
+            records = records[np.lexsort((records[:, 0], records[:, 1]))]
+            ids, starts = np.unique(records[:, 1], return_index=True)
+            for itemId, part in zip(ids, np.split(records[:, 0], starts[1:])):
+                found[int(itemId)] = part
+
+        return found
+
+    def itemHistory(self, name, itemId, start, end, columns):
+        records = self.itemRecords(name, itemId, start, end, columns)
+
+        frame = {"timestamp": records[:, 0]}
+        for i, column in enumerate(columns):
+            values = records[:, len(ITEM_FIELDS) + i]
+            frame[column] = pd.array(values, dtype="Int64")
+            frame[column][values == NULL] = pd.NA
+
+        return pd.DataFrame(frame)
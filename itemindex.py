@@ -0,0 +1,114 @@
+'''
+    hashed lookups over the /mapping payload
+
+    searching itemMapping["items"] is a linear walk, so anything that looks items
+    up in a loop (findWidestSpreads) goes quadratic. ItemIndex is built once per
+    mapping refresh and shared by every controller in the process.
+'''
+
+import hashlib
+import json
+import threading
+
+import numpy as np
+
+
+def normalizeName(name):
+    return " ".join(str(name).split()).casefold()
+
+
+class ItemIndex:
+
+    # numeric mapping fields kept as arrays, row-aligned with self.ids
+    COLUMNS = ("limit", "highalch", "lowalch", "value")
+
+    def __init__(self, items):
+        self.items = list(items)
+
+        self.byIdMap = {}
+        self.byNameMap = {}
+        self.byNormalizedNameMap = {}
+
+        for row, item in enumerate(self.items):
+            self.byIdMap[int(item["id"])] = row
+
+            name = item.get("name")
+            if name is None:
+                continue
+            self.byNameMap.setdefault(name, row)
+            self.byNormalizedNameMap.setdefault(normalizeName(name), row)
+
+        self.ids = np.fromiter((int(item["id"]) for item in self.items), dtype=np.int64, count=len(self.items))
+
+        # missing values are NaN so comparisons against them are always False
+        self.columns = {
+            column: np.array([self._number(item.get(column)) for item in self.items], dtype=np.float64)
+            for column in self.COLUMNS
+        }
+        self.columns["members"] = np.array([bool(item.get("members")) for item in self.items], dtype=bool)
+
+    @staticmethod
+    def _number(value):
+        return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, itemId):
+        return self.rowOf(itemId) is not None
+
+    def rowOf(self, itemId):
+        try:
+            return self.byIdMap.get(int(itemId))
+        except (TypeError, ValueError):
+            return None
+
+    # row positions for a sequence of ids, -1 where the id isn't in the mapping
+    def rowsOf(self, itemIds):
+        return np.fromiter((self.byIdMap.get(int(itemId), -1) for itemId in itemIds), dtype=np.int64)
+
+    def byId(self, itemId):
+        row = self.rowOf(itemId)
+        return None if row is None else self.items[row]
+
+    def byName(self, name):
+        row = self.byNameMap.get(name)
+        return None if row is None else self.items[row]
+
+    def byNormalizedName(self, name):
+        row = self.byNormalizedNameMap.get(normalizeName(name))
+        return None if row is None else self.items[row]
+
+    # exact name first, then case / whitespace insensitive
+    def find(self, name):
+        return self.byName(name) or self.byNormalizedName(name)
+
+    def column(self, name):
+        return self.columns[name]
+
+
+# content fingerprint so a refetch that returns the same mapping keeps the old index
+def mappingSignature(items):
+    return hashlib.sha1(json.dumps(items, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+_indexLock = threading.Lock()
+_indexCache = {"retrievedAt": None, "signature": None, "index": None}
+
+
+# process wide index for a mapping snapshot ({"retrieved_at": ..., "items": [...]})
+def indexForMapping(itemMapping):
+    retrievedAt = itemMapping.get("retrieved_at")
+
+    with _indexLock:
+        if _indexCache["index"] is not None and _indexCache["retrievedAt"] == retrievedAt:
+            return _indexCache["index"]
+
+        signature = mappingSignature(itemMapping["items"])
+
+        if _indexCache["index"] is None or _indexCache["signature"] != signature:
+            _indexCache["index"] = ItemIndex(itemMapping["items"])
+            _indexCache["signature"] = signature
+
+        _indexCache["retrievedAt"] = retrievedAt
+        return _indexCache["index"]
@@ -0,0 +1,345 @@
+'''
+    type-ahead item name search over the /mapping names
+
+    two indexes over the normalized names (itemindex.normalizeName):
+
+        prefix trie  every name inserted from each of its word starts, so "whip"
+                     reaches "Abyssal whip". each node keeps the items below it best
+                     first, completing a prefix is a walk of len(query) nodes
+        trigrams     posting lists per 3-gram of " name ", for misspellings the trie
+                     can't follow ("abysal whip", "whip abyssal")
+
+    results are ranked: exact name, then names starting with the query, then names
+    with a later word starting with it, then trigram (Dice) similarity. ties go to
+    the shorter name. the trigram pass only runs when the trie came up short.
+
+    both indexes are stored as flat numpy arrays, cached on disk as an .npz next to
+    the snapshots and loaded without rebuilding. nameIndexForMapping only rebuilds
+    when the names in the mapping change.
+
+        python namesearch.py [dataDir]      build / load / per keystroke timings
+'''
+
+import bisect
+import hashlib
+import io
+import logging
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from itemindex import normalizeName
+from snapshotstore import atomicWrite
+
+log = logging.getLogger(__name__)
+
+# bumped whenever the layout below changes, older cache files are rebuilt
+FORMAT = 1
+
+# items kept per trie node, more than a completion popup ever shows
+NODE_ITEMS = 32
+
+MIN_SIMILARITY = 0.35
+
+EXACT, PREFIX, WORD_PREFIX, FUZZY = range(4)
+
+
+def trigrams(text):
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# fingerprint of what the index is built from, ids and names only
+def nameSignature(items):
+    digest = hashlib.sha1(f"{FORMAT}".encode())
+    for item in items:
+        digest.update(f"{item.get('id')}\t{item.get('name')}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+# lists of lists -> (offsets, values), row i is values[offsets[i]:offsets[i + 1]]
+def _packRows(rows):
+    offsets = np.zeros(len(rows) + 1, dtype=np.int32)
+    np.cumsum([len(row) for row in rows], out=offsets[1:])
+    values = np.fromiter((value for row in rows for value in row), dtype=np.int32, count=int(offsets[-1]))
+    return offsets, values
+
+
+def _packStrings(strings):
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _unpackStrings(array):
+    return array.tobytes().decode("utf-8").split("\n") if len(array) else []
+
+
+# every array is flat, so the index round trips through an uncompressed .npz
+# without pickling or rebuilding anything:
+#   ids, names, normalized       per position, positions ordered best first (short names first)
+#   edgeStart / edgeChar / edgeChild   trie edges per node, sorted by char code
+#   itemStart / itemPos          trie node -> up to NODE_ITEMS positions, best first
+#   grams / gramStart / gramPos  trigram -> positions, gramCounts per position
+class NameIndex:
+
+    ARRAYS = ("ids", "names", "normalized", "edgeStart", "edgeChar", "edgeChild",
+              "itemStart", "itemPos", "grams", "gramStart", "gramPos", "gramCounts")
+
+    def __init__(self, signature, arrays):
+        self.signature = signature
+        self.arrays = arrays
+
+        self.ids = arrays["ids"].tolist()
+        self.names = _unpackStrings(arrays["names"])
+        self.normalized = _unpackStrings(arrays["normalized"])
+
+        # walked one char per keystroke, plain lists bisect faster than numpy slices
+        self.edgeStart = arrays["edgeStart"].tolist()
+        self.edgeChar = arrays["edgeChar"].tolist()
+        self.edgeChild = arrays["edgeChild"].tolist()
+        self.itemStart = arrays["itemStart"].tolist()
+        self.itemPos = arrays["itemPos"]
+
+        self.grams = {gram: i for i, gram in enumerate(_unpackStrings(arrays["grams"]))}
+        self.gramStart = arrays["gramStart"].tolist()
+        self.gramPos = arrays["gramPos"]
+        self.gramCounts = arrays["gramCounts"]
+
+        self.exact = {}
+        for position, name in enumerate(self.normalized):
+            self.exact.setdefault(name, position)
+
+    @classmethod
+    def build(cls, items):
+        named = [item for item in items if item.get("name")]
+        named.sort(key=lambda item: (len(item["name"]), normalizeName(item["name"])))
+
+        names = [item["name"] for item in named]
+        normalized = [normalizeName(name) for name in names]
+
+        children = [{}]
+        nodeItems = [[]]
+        grams = {}
+        gramCounts = []
+
+        # positions go in best first, so every node's list is already ranked
+        for position, name in enumerate(normalized):
+            starts = [0] + [i + 1 for i, char in enumerate(name) if char == " "]
+            for start in starts:
+                node = 0
+                for char in name[start:]:
+                    child = children[node].get(char)
+                    if child is None:
+                        child = children[node][char] = len(children)
+                        children.append({})
+                        nodeItems.append([])
+                    node = child
+                    found = nodeItems[node]
+                    if len(found) < NODE_ITEMS and (not found or found[-1] != position):
+                        found.append(position)
+
+            nameGrams = trigrams(name)
+            gramCounts.append(len(nameGrams))
+            for gram in nameGrams:
+                grams.setdefault(gram, []).append(position)
+
+        edges = [sorted((ord(char), child) for char, child in nodeChildren.items()) for nodeChildren in children]
+        edgeStart, edgeChar = _packRows([[code for code, _ in row] for row in edges])
+        _, edgeChild = _packRows([[child for _, child in row] for row in edges])
+        itemStart, itemPos = _packRows(nodeItems)
+
+        gramKeys = sorted(grams)
+        gramStart, gramPos = _packRows([grams[gram] for gram in gramKeys])
+
+        return cls(nameSignature(items), {
+            "ids": np.array([int(item["id"]) for item in named], dtype=np.int64),
+            "names": _packStrings(names),
+            "normalized": _packStrings(normalized),
+            "edgeStart": edgeStart,
+            "edgeChar": edgeChar,
+            "edgeChild": edgeChild,
+            "itemStart": itemStart,
+            "itemPos": itemPos,
+            "grams": _packStrings(gramKeys),
+            "gramStart": gramStart,
+            "gramPos": gramPos,
+            "gramCounts": np.array(gramCounts, dtype=np.int32),
+        })
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _walk(self, text):
+        node = 0
+        for char in text:
+            code = ord(char)
+            hi = self.edgeStart[node + 1]
+            i = bisect.bisect_left(self.edgeChar, code, self.edgeStart[node], hi)
+            if i == hi or self.edgeChar[i] != code:
+                return None
+            node = self.edgeChild[i]
+        return node
+
+    # [(itemId, name)] best first
+    def search(self, query, limit=10):
+        return [(self.ids[position], self.names[position]) for position, _ in self.rank(query, limit)]
+
+    # [(position, tier)] best first, tier is EXACT / PREFIX / WORD_PREFIX / FUZZY
+    def rank(self, query, limit=10):
+        text = normalizeName(query)
+        if not text or limit <= 0:
+            return []
+
+        ranked = []
+        exact = self.exact.get(text)
+        if exact is not None:
+            ranked.append((exact, EXACT))
+
+        node = self._walk(text)
+        if node is not None:
+            prefix = []
+            wordPrefix = []
+            for position in self.itemPos[self.itemStart[node]:self.itemStart[node + 1]].tolist():
+                if position == exact:
+                    continue
+                if self.normalized[position].startswith(text):
+                    prefix.append((position, PREFIX))
+                else:
+                    wordPrefix.append((position, WORD_PREFIX))
+            ranked += prefix + wordPrefix
+
+        if len(ranked) >= limit or len(text) < 3:
+            return ranked[:limit]
+
+        return ranked + self._fuzzy(text, [position for position, _ in ranked], limit - len(ranked))
+
+    def _fuzzy(self, text, exclude, limit):
+        queryGrams = trigrams(text)
+        known = [self.grams[gram] for gram in queryGrams if gram in self.grams]
+        if not known:
+            return []
+
+        # only names sharing a trigram with the query can score, the rest are never
+        # looked at
+        postings = np.concatenate([self.gramPos[self.gramStart[g]:self.gramStart[g + 1]] for g in known])
+        positions, shared = np.unique(postings, return_counts=True)
+
+        # trigrams no name has still count against the similarity
+        similarity = 2 * shared / (len(queryGrams) + self.gramCounts[positions])
+        keep = (similarity >= MIN_SIMILARITY) & ~np.isin(positions, exclude)
+        positions, similarity = positions[keep], similarity[keep]
+
+        # positions are ranked already, so they break ties
+        best = positions[np.lexsort((positions, -similarity))][:limit]
+        return [(position, FUZZY) for position in best.tolist()]
+
+
+def readNameIndex(path, signature):
+    try:
+        with np.load(path) as stored:
+            if int(stored["format"]) != FORMAT or str(stored["signature"]) != signature:
+                return None
+            arrays = {name: stored[name] for name in NameIndex.ARRAYS}
+    except (OSError, ValueError, KeyError):
+        return None
+    return NameIndex(signature, arrays)
+
+
+def writeNameIndex(path, index):
+    buffer = io.BytesIO()
+    np.savez(buffer, format=np.int64(FORMAT), signature=np.str_(index.signature), **index.arrays)
+    atomicWrite(path, buffer.getvalue())
+
+
+_indexLock = threading.Lock()
+_indexCache = {"retrievedAt": None, "index": None}
+
+
+# process wide NameIndex for a mapping snapshot. a new retrieved_at with the same
+# names keeps the index, different names load it from cachePath when that was built
+# from them, otherwise it is rebuilt (and written to cachePath)
+def nameIndexForMapping(itemMapping, cachePath=None):
+    retrievedAt = itemMapping.get("retrieved_at")
+
+    with _indexLock:
+        index = _indexCache["index"]
+        if index is not None and _indexCache["retrievedAt"] == retrievedAt:
+            return index
+
+        signature = nameSignature(itemMapping["items"])
+
+        if index is None or index.signature != signature:
+            index = readNameIndex(cachePath, signature) if cachePath else None
+            if index is None:
+                index = NameIndex.build(itemMapping["items"])
+                if cachePath:
+                    try:
+                        writeNameIndex(cachePath, index)
+                    except OSError:
+                        # only costs the next start a rebuild
+                        log.warning("couldn't cache the name index at %s", cachePath, exc_info=True)
+
+        _indexCache["index"] = index
+        _indexCache["retrievedAt"] = retrievedAt
+        return index
+
+
+def benchmark(dataDir="./data", repeat=3):
+    import json
+    import tempfile
+    import time
+
+    items = json.loads(Path(dataDir, "mapping.json").read_bytes())["items"]
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        index = NameIndex.build(items)
+    buildMs = (time.perf_counter() - start) / repeat * 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp, "nameindex.npz")
+        writeNameIndex(path, index)
+        signature = nameSignature(items)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            readNameIndex(path, signature)
+        loadMs = (time.perf_counter() - start) / repeat * 1000
+        size = path.stat().st_size
+
+    # every prefix of every name typed one key at a time, plus misspellings
+    queries = [name[:i] for name in index.names[::7] for i in range(1, len(name) + 1)]
+    queries += [name[:3] + name[4:] for name in index.names[::7] if len(name) > 5]
+
+    # each keystroke timed repeat times. the first run is what a user gets, its max is
+    # mostly the process being descheduled mid search; the best run is the search's
+    # own cost
+    first = []
+    best = []
+    for query in queries:
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            index.search(query)
+            runs.append(time.perf_counter() - start)
+        first.append(runs[0])
+        best.append(min(runs))
+
+    def ms(seconds):
+        return f"{seconds * 1000:.3f}"
+
+    def stats(timings):
+        timings = sorted(timings)
+        return f"median {ms(timings[len(timings) // 2])} ms  p99 {ms(timings[int(len(timings) * 0.99)])} ms  max {ms(timings[-1])} ms"
+
+    print(f"{len(index)} names  build {buildMs:.1f} ms  load {loadMs:.1f} ms ({size / 1024:.0f} KB)")
+    print(f"{len(queries)} keystrokes, first run  {stats(first)}")
+    print(f"{len(queries)} keystrokes, best of {repeat}  {stats(best)}")
+    for query in ("abyssal wh", "whip", "abysal whip", "rune plat", "shark"):
+        print(f"  {query!r:>14} -> {[name for _, name in index.search(query, 5)]}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    benchmark(*sys.argv[1:2])
@@ -0,0 +1,91 @@
+'''
+    process wide rate limiting for requests to the prices api
+
+    several Geapi objects can be live at once (the gui's shared controller, the
+    headless scanner, backfills), so the limit has to live outside Geapi to hold
+    across all of them. this is a token bucket: up to
+    `burst` requests go out back to back, after that one request per 1 / rate seconds.
+'''
+
+import threading
+import time
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst):
+        self.lock = threading.Lock()
+        self.configure(rate, burst)
+
+        self.requests = 0
+        self.waited = 0
+        self.totalWait = 0.0
+        self.maxWait = 0.0
+
+    # rate is requests per second, burst how many may go out without waiting
+    def configure(self, rate, burst):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+
+        with self.lock:
+            self.rate = float(rate)
+            self.burst = float(burst)
+            self.tokens = float(burst)
+            self.updatedAt = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updatedAt) * self.rate)
+        self.updatedAt = now
+
+    # seconds a request made now would have to wait
+    def delay(self):
+        with self.lock:
+            self._refill(time.monotonic())
+            return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    # takes a token and returns how long the caller has to wait before using it.
+    # the token is taken under the lock (the balance may go negative), so concurrent
+    # callers queue up in order instead of all waking at once
+    def reserve(self):
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+            self.requests += 1
+            if wait > 0:
+                self.waited += 1
+                self.totalWait += wait
+                self.maxWait = max(self.maxWait, wait)
+
+        return wait
+
+    # blocking reserve, sleeps only for the time left until the token is ours
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
+
+    def getMetrics(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "waited": self.waited,
+                "totalWaitSeconds": self.totalWait,
+                "maxWaitSeconds": self.maxWait,
+                "meanWaitSeconds": self.totalWait / self.requests if self.requests else 0.0
+            }
+
+
+# long run average of one request every 5 seconds, with room for one refresh of
+# every snapshot endpoint to go out together
+REQUESTS_PER_SECOND = 1 / 5
+BURST = 6
+
+_sharedLimiter = TokenBucket(REQUESTS_PER_SECOND, BURST)
+
+
+def sharedLimiter():
+    return _sharedLimiter
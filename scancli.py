@@ -0,0 +1,194 @@
+'''
+    headless scanner
+
+    runs GeController.findWidestSpreads without the gui (nothing here imports
+    PySide6), once or on a schedule, with the thresholds as flags. one GeController
+    is kept warm for the whole run and its prefetcher keeps the scan's snapshots
+    fresh, so a scheduled scan rarely waits on the network.
+
+        python scancli.py                                  one scan, table on stdout
+        python scancli.py --min-profit 50 --members-only --limit 20
+        python scancli.py --interval 60 --format jsonl --output scans.jsonl
+        python scancli.py --interval 300 --format parquet --output scans/
+
+    csv / jsonl outputs are appended to (csv writes its header once), parquet writes
+    one file per scan into the --output directory. request logging goes to stderr
+    so stdout only carries results.
+'''
+
+import argparse
+import contextlib
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import scanengine
+from controller import GeController
+
+FORMATS = ("table", "csv", "jsonl", "parquet")
+
+# snapshots a scan reads, same as the gui scanner keeps warm
+PREFETCH = ["mapping", "latest", "fiveMinAve"]
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="scan the GE for the widest after-tax spreads")
+
+    thresholds = parser.add_argument_group("thresholds")
+    thresholds.add_argument("--min-profit", type=int, default=None, help="minimum net profit per item (gp)")
+    thresholds.add_argument("--min-volume", type=int, default=None, help="minimum 5 minute volume")
+    thresholds.add_argument("--min-spread-pct", type=float, default=None, help="minimum net spread, 0.05 = 5%%")
+    thresholds.add_argument("--members-only", action="store_true")
+    thresholds.add_argument("--limit", type=int, default=None, help="keep the best N rows")
+
+    schedule = parser.add_argument_group("schedule")
+    schedule.add_argument("--interval", type=float, default=0, help="seconds between scans, 0 scans once")
+    schedule.add_argument("--count", type=int, default=None, help="stop after N scans")
+    schedule.add_argument("--changes-only", action="store_true", help="skip scans whose rows didn't change")
+
+    output = parser.add_argument_group("output")
+    output.add_argument("--format", choices=FORMATS, default="table")
+    output.add_argument("--output", default=None, help="file (csv / jsonl) or directory (parquet), default stdout")
+
+    data = parser.add_argument_group("data")
+    data.add_argument("--engine", choices=GeController.SCAN_ENGINES, default="numpy")
+    data.add_argument("--storage", choices=("files", "sqlite"), default="files")
+    data.add_argument("--record-history", action="store_true", help="append every fetched snapshot to DATA_DIR/history")
+    data.add_argument("--data-dir", default="./data")
+    data.add_argument("--endpoint", default=None, help="api base url, e.g. a local stand-in server")
+
+    args = parser.parse_args(argv)
+    if args.format == "parquet" and args.output is None:
+        parser.error("--format parquet needs --output DIR")
+    return args
+
+
+class ScanWriter:
+
+    # stream is where results go without --output, taken before stdout is redirected
+    def __init__(self, format, output=None, stream=None):
+        self.format = format
+        self.output = Path(output) if output else None
+        self.stream = stream or sys.stdout
+        self.wroteHeader = False
+
+        if format == "parquet":
+            # optional dependency, only needed for this format. checked up front so a
+            # daemon doesn't find out on its first scan
+            try:
+                import pyarrow
+            except ImportError:
+                try:
+                    import fastparquet
+                except ImportError as e:
+                    raise ImportError("--format parquet needs pyarrow or fastparquet (pip install pyarrow)") from e
+
+            self.output.mkdir(parents=True, exist_ok=True)
+
+    def write(self, df, scannedAt):
+        if self.format == "table":
+            self._emit(f"SCAN {datetime.fromtimestamp(scannedAt).strftime('%H:%M:%S')}  {len(df)} rows\n")
+            self._emit((df.to_string(index=False) if not df.empty else "(no rows)") + "\n\n")
+            return
+
+        df = df.assign(scanned_at=scannedAt)
+
+        if self.format == "csv":
+            if self.output is None:
+                header = not self.wroteHeader
+            else:
+                header = not self.output.exists() or self.output.stat().st_size == 0
+            self._emit(df.to_csv(index=False, header=header))
+            self.wroteHeader = True
+        elif self.format == "jsonl":
+            if not df.empty:
+                self._emit(df.to_json(orient="records", lines=True).rstrip("\n") + "\n")
+        elif self.format == "parquet":
+            stamp = datetime.fromtimestamp(scannedAt).strftime("%Y%m%d-%H%M%S")
+            df.to_parquet(self.output / f"scan-{stamp}.parquet", index=False)
+
+    def _emit(self, text):
+        if self.output is None:
+            self.stream.write(text)
+            self.stream.flush()
+        else:
+            with open(self.output, "a", encoding="utf-8") as f:
+                f.write(text)
+
+
+class HeadlessScanner:
+
+    def __init__(self, args, stream=None):
+        options = {"dataDir": args.data_dir, "storage": args.storage, "recordHistory": args.record_history}
+        if args.endpoint:
+            options["endpoint"] = args.endpoint
+
+        self.args = args
+        self.controller = GeController(scanEngine=args.engine, **options)
+        self.writer = ScanWriter(args.format, args.output, stream)
+        self.previous = None
+
+    def scanOnce(self):
+        args = self.args
+
+        df = self.controller.findWidestSpreads()
+
+        df = scanengine.filterSpreads(
+            df,
+            minProfit=args.min_profit,
+            minVolume=args.min_volume,
+            minSpreadPct=args.min_spread_pct,
+            membersOnly=args.members_only,
+            limit=args.limit
+        )
+
+        if args.changes_only and self.previous is not None and df.equals(self.previous):
+            return df
+        self.previous = df
+
+        self.writer.write(df, int(time.time()))
+        return df
+
+    def run(self):
+        args = self.args
+        if not args.interval:
+            self.scanOnce()
+            return
+
+        self.controller.geapi.startPrefetcher(PREFETCH)
+
+        scans = 0
+        nextScan = time.monotonic()
+        try:
+            while args.count is None or scans < args.count:
+                try:
+                    self.scanOnce()
+                except Exception as e:
+                    # a failed fetch shouldn't end the daemon, the next tick retries
+                    print(f"SCAN FAILED: {e!r}", file=sys.stderr)
+                scans += 1
+
+                if args.count is not None and scans >= args.count:
+                    break
+
+                # fixed schedule, a slow scan doesn't push the next ones back
+                nextScan += args.interval
+                time.sleep(max(0.0, nextScan - time.monotonic()))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.controller.geapi.stopPrefetcher()
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    scanner = HeadlessScanner(args, stream=sys.stdout)
+
+    # Geapi (and its prefetch thread) log requests with print, stdout only carries results
+    with contextlib.redirect_stdout(sys.stderr):
+        scanner.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+'''
+    columnar scan engine for GeController.findWidestSpreads
+
+    runs on the /latest and /5m columns Geapi builds once per fetch
+    (columnar.SnapshotArrays), aligned on the /latest item order by id. the spread /
+    tax / volume filters run as masked array operations and the result columns are
+    cut from the same arrays, so a scan never walks the payload dicts. the output is
+    the same DataFrame the per-item loop builds.
+
+    IncrementalScanner keeps the previous scan keyed by item id and only re-runs
+    the filters for items whose quote or volumes changed, reporting the rows that
+    were inserted, updated or removed alongside the full result.
+'''
+
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from columnar import NULL
+
+GE_TAX_RATE = 0.02
+
+LATEST_FIELDS = ("high", "low", "highTime", "lowTime")
+FIVE_MIN_FIELDS = ("lowPriceVolume", "highPriceVolume")
+
+# last conversion per kind, keyed on the SnapshotArrays / ItemIndex objects it was
+# built from. Geapi hands back the same objects until a refresh, so rescans of an
+# unchanged snapshot skip even the float conversion. shared by every scanning thread
+# (pool workers, the prefetcher, the service), builds run outside the lock since one
+# build can need another kind
+_columnLock = threading.Lock()
+_columnCache = {}
+
+
+def _cached(kind, sources, build):
+    with _columnLock:
+        cached = _columnCache.get(kind)
+    if cached is not None and len(cached[0]) == len(sources) and all(a is b for a, b in zip(cached[0], sources)):
+        return cached[1]
+
+    columns = build()
+    with _columnLock:
+        _columnCache[kind] = (sources, columns)
+    return columns
+
+
+# int64 column with NULL for missing -> float64 with NaN, so every comparison
+# against a missing value is False
+def _floatColumn(values):
+    column = values.astype(np.float64)
+    column[values == NULL] = np.nan
+    return column
+
+
+def latestColumns(latestArrays):
+
+    def build():
+        columns = {"ids": latestArrays.ids, "ints": latestArrays.columns}
+        for field in LATEST_FIELDS:
+            columns[field] = _floatColumn(latestArrays.columns[field])
+        return columns
+
+    return _cached("latest", (latestArrays,), build)
+
+
+# 5m volumes re-ordered to line up with the /latest rows. ints keeps the raw int64
+# columns for building result rows
+def fiveMinColumns(latestArrays, fiveMinArrays):
+
+    def build():
+        position, found = _align(latestArrays.ids, _sortedIds("fiveMinIds", fiveMinArrays, fiveMinArrays.ids))
+
+        columns = {"ints": {}}
+        for field in FIVE_MIN_FIELDS:
+            ints = np.where(found, fiveMinArrays.columns[field][position], NULL)
+            columns["ints"][field] = ints
+            columns[field] = _floatColumn(ints)
+        return columns
+
+    return _cached("fiveMin", (latestArrays, fiveMinArrays), build)
+
+
+# mapping rows for each /latest row, -1 where the item isn't mapped
+def mappingRows(latestArrays, itemIndex):
+
+    def build():
+        position, found = _align(latestArrays.ids, _sortedIds("mappingIds", itemIndex, itemIndex.ids))
+        return np.where(found, position, -1)
+
+    return _cached("mappingRows", (latestArrays, itemIndex), build)
+
+
+# (order, ids[order]) of an id column, kept per source object so a new /latest only
+# pays for the searchsorted
+def _sortedIds(kind, source, ids):
+
+    def build():
+        order = np.argsort(ids, kind="stable")
+        return order, ids[order]
+
+    return _cached(kind, (source,), build)
+
+
+# for each of ids, its position in the sorted other ids and whether it is there at all
+def _align(ids, sortedOther):
+    order, sortedIds = sortedOther
+    if len(order) == 0:
+        return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+
+    at = np.minimum(np.searchsorted(sortedIds, ids), len(order) - 1)
+    return order[at], sortedIds[at] == ids
+
+
+# whole gp made per item after tax, buying at low + 1 and selling at high - 1
+def _netProfit(high, low):
+    return int(((high - 1) - (low + 1)) - GE_TAX_RATE * (high - 1))
+
+
+def _truthy(column):
+    return ~np.isnan(column) & (column != 0)
+
+
+# latestArrays / fiveMinArrays are columnar.SnapshotArrays (Geapi.getSnapshotArrays)
+def widestSpreads(latestArrays, fiveMinArrays, itemIndex):
+
+    latest = latestColumns(latestArrays)
+    fiveMin = fiveMinColumns(latestArrays, fiveMinArrays)
+    rows = mappingRows(latestArrays, itemIndex)
+
+    selected, netSpreadPct = _select(latest, fiveMin, rows, itemIndex, np.arange(len(rows)))
+    if selected.size == 0:
+        return pd.DataFrame([])
+
+    return pd.DataFrame(_rowColumns(latest, fiveMin, rows, itemIndex, selected, netSpreadPct), copy=False)
+
+
+# positions among `candidates` (indices into the /latest rows) that pass the scan
+# filters, with their net spread
+def _select(latest, fiveMin, rows, itemIndex, candidates):
+
+    high = latest["high"][candidates]
+    low = latest["low"][candidates]
+    highTime = latest["highTime"][candidates]
+    lowTime = latest["lowTime"][candidates]
+    lowVol = fiveMin["lowPriceVolume"][candidates]
+    highVol = fiveMin["highPriceVolume"][candidates]
+    rows = rows[candidates]
+
+    mapped = rows >= 0
+    limit = np.where(mapped, itemIndex.column("limit")[np.where(mapped, rows, 0)], np.nan)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # assume we buy at low + 1 and sell at high - 1, taxed on the sell
+        spread = (high - 1) - (low + 1)
+        netProfit = spread - GE_TAX_RATE * (high - 1)
+        mid = (high + low) / 2
+        netSpreadPct = netProfit / mid
+
+        fiveMinVol = lowVol + highVol
+
+        mask = (
+            (high > 0) & (low > 0)
+            & (spread > 0)
+            & ~np.isnan(highTime) & ~np.isnan(lowTime)
+            & (netProfit > 0)
+            & mapped
+            & _truthy(lowVol) & _truthy(highVol)
+            & _truthy(limit)
+            # 5 minute volume is at least 100% of the limit
+            & (fiveMinVol / limit >= 1)
+        )
+
+    return candidates[mask], netSpreadPct[mask]
+
+
+# result columns for the selected /latest rows, the selected ones have every quote and
+# volume field set. the numbers come straight from the int64 columns (the payload's
+# own ints), dtypes and rounding match the per-item implementation exactly
+def _rowColumns(latest, fiveMin, rows, itemIndex, selected, netSpreadPct):
+
+    high = latest["ints"]["high"][selected]
+    low = latest["ints"]["low"][selected]
+    lastTradeTimes = np.maximum(latest["ints"]["highTime"][selected], latest["ints"]["lowTime"][selected])
+    items = [itemIndex.items[row] for row in rows[selected].tolist()]
+
+    return {
+        "item_id": latest["ids"][selected],
+        "item_name": np.array([item.get("name") for item in items], dtype=object),
+        "item_limit": np.array([item.get("limit") for item in items], dtype=np.int64),
+        "members": np.array([bool(item.get("members")) for item in items], dtype=bool),
+        "low": low,
+        "vol (5m)": fiveMin["ints"]["lowPriceVolume"][selected] + fiveMin["ints"]["highPriceVolume"][selected],
+        "high": high,
+        # int() of the same float expression, positive so truncating is the same
+        "netProfit": (((high - 1) - (low + 1)) - GE_TAX_RATE * (high - 1)).astype(np.int64),
+        "netSpreadPct": np.array([round(pct, 2) for pct in netSpreadPct.tolist()], dtype=np.float64),
+        "lastTradeReadable": np.array(
+            [datetime.fromtimestamp(t).strftime("%H:%M:%S") for t in lastTradeTimes.tolist()], dtype=object
+        ),
+        "lastTradeTime": lastTradeTimes
+    }
+
+
+# scan result rows passing the user's thresholds, best net spread first. None / False
+# leaves a threshold off, limit keeps the top n rows
+def filterSpreads(df, minProfit=None, minVolume=None, minSpreadPct=None, membersOnly=False, limit=None):
+    if df.empty:
+        return df
+
+    mask = pd.Series(True, index=df.index)
+    if minProfit is not None:
+        mask &= df["netProfit"] >= minProfit
+    if minVolume is not None:
+        mask &= df["vol (5m)"] >= minVolume
+    if minSpreadPct is not None:
+        mask &= df["netSpreadPct"] >= minSpreadPct
+    if membersOnly:
+        mask &= df["members"]
+
+    df = df[mask].sort_values("netSpreadPct", ascending=False, kind="stable").reset_index(drop=True)
+    return df if limit is None else df.head(limit)
+
+
+# what changed between two incremental scans. result is the full scan, inserted /
+# updated hold the rows that are new or differ from last time, removed the item ids
+# that dropped out. recomputed counts the items that were re-evaluated at all
+class ScanDelta:
+
+    def __init__(self, result, inserted, updated, removed, recomputed):
+        self.result = result
+        self.inserted = inserted
+        self.updated = updated
+        self.removed = removed
+        self.recomputed = recomputed
+
+    def isEmpty(self):
+        return self.inserted.empty and self.updated.empty and not self.removed
+
+    def __repr__(self):
+        return (
+            f"ScanDelta({len(self.result)} rows: +{len(self.inserted)} ~{len(self.updated)} "
+            f"-{len(self.removed)}, {self.recomputed} recomputed)"
+        )
+
+
+# a scan that remembers the previous one. between two /latest fetches most items'
+# quotes are untouched, so only items whose quote (highTime / lowTime / prices) or
+# 5m volumes differ from the last scan are run through the filters again, everything
+# else keeps its previous row. a new mapping re-evaluates every item. scans are
+# serialized, two callers (pool threads) would otherwise interleave the saved state
+class IncrementalScanner:
+
+    SIGNATURE_FIELDS = ("highTime", "lowTime", "high", "low")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.itemIndex = None
+        self.ids = np.empty(0, dtype=np.int64) # sorted item ids of the previous scan
+        self.signatures = np.empty((0, len(self.SIGNATURE_FIELDS) + len(FIVE_MIN_FIELDS)))
+        self.rows = {} # item_id -> result row of the items that passed
+
+    def _signatures(self, latest, fiveMin):
+        return np.column_stack(
+            [latest[field] for field in self.SIGNATURE_FIELDS]
+            + [fiveMin[field] for field in FIVE_MIN_FIELDS]
+        )
+
+    def scan(self, latestArrays, fiveMinArrays, itemIndex):
+        with self.lock:
+            return self._scan(latestArrays, fiveMinArrays, itemIndex)
+
+    def _scan(self, latestArrays, fiveMinArrays, itemIndex):
+
+        latest = latestColumns(latestArrays)
+        fiveMin = fiveMinColumns(latestArrays, fiveMinArrays)
+        rows = mappingRows(latestArrays, itemIndex)
+
+        ids = latestArrays.ids
+        signatures = self._signatures(latest, fiveMin)
+
+        # line the previous scan up with this one by item id
+        changed = np.ones(len(ids), dtype=bool)
+        if itemIndex is self.itemIndex and len(self.ids):
+            at = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+            known = self.ids[at] == ids
+
+            previous = self.signatures[at]
+            same = (previous == signatures) | (np.isnan(previous) & np.isnan(signatures))
+            changed = ~known | ~same.all(axis=1)
+
+        candidates = np.flatnonzero(changed)
+        selected, netSpreadPct = _select(latest, fiveMin, rows, itemIndex, candidates)
+        columns = _rowColumns(latest, fiveMin, rows, itemIndex, selected, netSpreadPct)
+        fresh = [dict(zip(columns, values)) for values in zip(*(column.tolist() for column in columns.values()))]
+
+        # rows of untouched items carry over, items gone from /latest drop out
+        unchanged = set(ids[~changed].tolist())
+        newRows = {itemId: row for itemId, row in self.rows.items() if itemId in unchanged}
+        inserted = []
+        updated = []
+        for row in fresh:
+            old = self.rows.get(row["item_id"])
+            if old is None:
+                inserted.append(row)
+            elif old != row:
+                updated.append(row)
+            newRows[row["item_id"]] = row
+
+        removed = [itemId for itemId in self.rows if itemId not in newRows]
+
+        order = np.argsort(ids, kind="stable")
+        self.ids = ids[order]
+        self.signatures = signatures[order]
+        self.itemIndex = itemIndex
+        self.rows = newRows
+
+        # full result in /latest payload order, like widestSpreads
+        position = {itemId: i for i, itemId in enumerate(ids.tolist()) if itemId in newRows}
+        result = [newRows[itemId] for itemId in sorted(position, key=position.get)]
+
+        return ScanDelta(
+            pd.DataFrame(result),
+            pd.DataFrame(inserted),
+            pd.DataFrame(updated),
+            removed,
+            len(candidates)
+        )
+
+
+# DataFrame for rows that already passed the scan filters (the sqlite engine pushes them
+# into its query). rows: item_id, name, limit, members, high, low, highTime, lowTime, lowVol, highVol
+def widestSpreadsFromRows(rows):
+    if not rows:
+        return pd.DataFrame([])
+
+    netSpreadPcts = []
+    lastTradeTimes = []
+    for itemId, name, limit, members, high, low, highTime, lowTime, lowVol, highVol in rows:
+        spread = (high - 1) - (low + 1)
+        netProfit = spread - GE_TAX_RATE * (high - 1)
+        netSpreadPcts.append(round(netProfit / ((high + low) / 2), 2))
+        lastTradeTimes.append(max(highTime, lowTime))
+
+    return pd.DataFrame({
+        "item_id": [row[0] for row in rows],
+        "item_name": [row[1] for row in rows],
+        "item_limit": [row[2] for row in rows],
+        "members": [bool(row[3]) for row in rows],
+        "low": [row[5] for row in rows],
+        "vol (5m)": [row[8] + row[9] for row in rows],
+        "high": [row[4] for row in rows],
+        "netProfit": [_netProfit(row[4], row[5]) for row in rows],
+        "netSpreadPct": netSpreadPcts,
+        "lastTradeReadable": [datetime.fromtimestamp(t).strftime("%H:%M:%S") for t in lastTradeTimes],
+        "lastTradeTime": lastTradeTimes
+    })
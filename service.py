@@ -0,0 +1,325 @@
+'''
+    local http service for scan and item results
+
+    one process keeps a warm GeController (with the prefetcher running) and serves
+    every desk from it:
+
+        GET /scan?min_profit=&min_volume=&min_spread_pct=&members_only=1&limit=
+        GET /item/{id}
+        GET /watchlist?ids=391,2,4151
+
+    responses are json. each one is built at most once per combination of the
+    snapshot versions it was computed from (Geapi.getSnapshotVersion) and its
+    query, and kept as encoded bytes. the ETag is derived from that same key, so a
+    client sending If-None-Match gets a 304 without anything being rebuilt, and
+    upstream is only ever hit by the prefetcher, on the same schedule as the gui.
+    only requests for the same key wait on each other's build, a revalidation never
+    waits on a build at all.
+
+        python service.py --port 8080
+'''
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import scanengine
+from controller import GeController
+
+SCAN_SNAPSHOTS = ("mapping", "latest", "fiveMinAve")
+ITEM_SNAPSHOTS = ("mapping", "latest", "fiveMinAve", "oneHourAve")
+
+# snapshots kept warm in the background, everything the routes read
+PREFETCH = list(ITEM_SNAPSHOTS)
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class NotFound(LookupError):
+    pass
+
+
+# encoded responses keyed on (route, query, snapshot versions), least recently used
+# dropped past maxEntries. each key is built by one caller at a time, callers asking
+# for the same key meanwhile wait for that build instead of repeating it
+class ResultCache:
+
+    def __init__(self, maxEntries=256):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.builds = 0
+
+        # guards entries and the counters, never held while building
+        self.lock = threading.Lock()
+        # key -> lock held while that key is being built
+        self.building = {}
+
+    @staticmethod
+    def etagFor(key):
+        return '"' + hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:20] + '"'
+
+    def _lookup(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return body
+
+    def get(self, key, build):
+        body = self._lookup(key)
+        if body is not None:
+            return body
+
+        with self.lock:
+            keyLock = self.building.setdefault(key, threading.Lock())
+
+        with keyLock:
+            # built by whoever held the key lock before us
+            body = self._lookup(key)
+            if body is not None:
+                return body
+
+            try:
+                body = build()
+                with self.lock:
+                    self.builds += 1
+                    self.entries[key] = body
+                    if len(self.entries) > self.maxEntries:
+                        self.entries.popitem(last=False)
+            finally:
+                with self.lock:
+                    self.building.pop(key, None)
+            return body
+
+
+def _encode(obj):
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def _intParam(query, name):
+    value = query.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer") from None
+
+
+def _floatParam(query, name):
+    value = query.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a number") from None
+
+
+class ScanService:
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.geapi = controller.geapi
+        # locks per key itself. Geapi is read by every request thread at once, the
+        # prefetcher keeps what the routes read fresh, so a version check is a dict
+        # lookup and only the prefetcher fetches
+        self.cache = ResultCache()
+
+    def _versions(self, names):
+        return tuple(self.geapi.getSnapshotVersion(name) for name in names)
+
+    # (etag, build) for a request, build() -> encoded body. raises BadRequest / NotFound
+    def resolve(self, path, query):
+        parts = [p for p in path.split("/") if p]
+
+        if parts == ["scan"]:
+            filters = {
+                "minProfit": _intParam(query, "min_profit"),
+                "minVolume": _intParam(query, "min_volume"),
+                "minSpreadPct": _floatParam(query, "min_spread_pct"),
+                "membersOnly": query.get("members_only", "0").lower() in ("1", "true", "yes"),
+                "limit": _intParam(query, "limit"),
+            }
+            versions = self._versions(SCAN_SNAPSHOTS)
+            key = ("scan", tuple(sorted(filters.items())), versions)
+            return key, lambda: self._scanBody(versions, filters)
+
+        if len(parts) == 2 and parts[0] == "item":
+            try:
+                itemId = int(parts[1])
+            except ValueError:
+                raise BadRequest("item id must be an integer") from None
+
+            versions = self._versions(ITEM_SNAPSHOTS)
+            return ("item", itemId, versions), lambda: self._itemBody(itemId)
+
+        if parts == ["watchlist"]:
+            try:
+                itemIds = tuple(dict.fromkeys(int(i) for i in query.get("ids", "").replace(" ", "").split(",") if i))
+            except ValueError:
+                raise BadRequest("ids must be comma separated integers") from None
+            if not itemIds:
+                raise BadRequest("ids is required")
+
+            versions = self._versions(ITEM_SNAPSHOTS)
+            return ("watchlist", itemIds, versions), lambda: self._watchlistBody(itemIds)
+
+        raise NotFound(path)
+
+    # (etag, body), body None when the client's copy is current
+    def handle(self, path, query, etags):
+        key, build = self.resolve(path, query)
+        etag = ResultCache.etagFor(key)
+        if etag in etags:
+            return etag, None
+
+        # "*" matches any current representation, so the resource has to exist
+        # (build didn't raise NotFound) before it can be a 304
+        body = self.cache.get(key, build)
+        if "*" in etags:
+            return etag, None
+        return etag, body
+
+    # bodies
+
+    def _fullScan(self, versions):
+        # the unfiltered scan, shared by every set of thresholds
+        return self.cache.get(("scanFrame", versions), self.controller.findWidestSpreads)
+
+    def _scanBody(self, versions, filters):
+        df = scanengine.filterSpreads(self._fullScan(versions), **filters)
+        return _encode({
+            "generated_at": int(time.time()),
+            "data_age": self._ages(SCAN_SNAPSHOTS),
+            "rows": json.loads(df.to_json(orient="records")) if not df.empty else [],
+        })
+
+    def _ages(self, names):
+        return {name: self.geapi.getSnapshotAge(name) for name in names}
+
+    def _item(self, itemId):
+        mapping = self.geapi.getItemIndex().byId(itemId)
+        if mapping is None:
+            return None
+
+        key = str(itemId)
+        return {
+            "item_id": itemId,
+            "item": mapping,
+            "latest": self.geapi.getLatestSnapshot()["data"].get(key),
+            "fiveMinAve": self.geapi.getFiveMinAveSnapshot()["data"].get(key),
+            "oneHourAve": self.geapi.getOneHourAveSnapshot()["data"].get(key),
+        }
+
+    def _itemBody(self, itemId):
+        item = self._item(itemId)
+        if item is None:
+            raise NotFound(f"item {itemId}")
+        return _encode({"generated_at": int(time.time()), "data_age": self._ages(ITEM_SNAPSHOTS), **item})
+
+    def _watchlistBody(self, itemIds):
+        items = [self._item(itemId) for itemId in itemIds]
+        return _encode({
+            "generated_at": int(time.time()),
+            "data_age": self._ages(ITEM_SNAPSHOTS),
+            "items": [item for item in items if item is not None],
+            "unknown": [itemId for itemId, item in zip(itemIds, items) if item is None],
+        })
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+
+    server_version = "osrsgep"
+    protocol_version = "HTTP/1.1"
+    # headers and body go out as separate writes, with Nagle on a keep-alive client
+    # waits out its delayed ack on every response
+    disable_nagle_algorithm = True
+    service = None # set by makeServer
+    quiet = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        etags = {tag.strip() for tag in self.headers.get("If-None-Match", "").split(",") if tag.strip()}
+
+        try:
+            etag, body = self.service.handle(url.path, query, etags)
+        except BadRequest as e:
+            return self._send(400, _encode({"error": str(e)}))
+        except NotFound as e:
+            return self._send(404, _encode({"error": f"not found: {e}"}))
+        except Exception as e:
+            self.log_error("%s failed: %r", self.path, e)
+            return self._send(500, _encode({"error": "internal error"}))
+
+        if body is None:
+            return self._send(304, None, etag)
+        self._send(200, body, etag)
+
+    def _send(self, status, body, etag=None):
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+            # clients may keep it, but must check back (cheaply, with If-None-Match)
+            self.send_header("Cache-Control", "no-cache")
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+        else:
+            self.send_header("Content-Length", "0")
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def makeServer(controller, host="127.0.0.1", port=8080, quiet=True):
+    handler = type("Handler", (ServiceHandler,), {"service": ScanService(controller), "quiet": quiet})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="serve cached scan and item results over http")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--engine", choices=GeController.SCAN_ENGINES, default="numpy")
+    parser.add_argument("--storage", choices=("files", "sqlite"), default="files")
+    parser.add_argument("--record-history", action="store_true", help="append every fetched snapshot to DATA_DIR/history")
+    parser.add_argument("--data-dir", default="./data")
+    parser.add_argument("--endpoint", default=None, help="api base url, e.g. a local stand-in server")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    options = {"dataDir": args.data_dir, "storage": args.storage, "recordHistory": args.record_history}
+    if args.endpoint:
+        options["endpoint"] = args.endpoint
+
+    controller = GeController(scanEngine=args.engine, **options)
+    controller.geapi.startPrefetcher(PREFETCH)
+
+    server = makeServer(controller, args.host, args.port, quiet=not args.verbose)
+    print(f"SERVING ON http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        controller.geapi.stopPrefetcher()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+'''
+    on-disk snapshot storage for Geapi
+
+    snapshots are written through a pluggable serializer (json, or msgpack when it is
+    installed) and always atomically: the bytes go to a temp file in the same
+    directory which is then renamed over the old snapshot, so a concurrent reader
+    sees either the old file or the new one, never half of one.
+
+    run this module to benchmark load / save for each format:
+        python snapshotstore.py [dataDir]
+'''
+
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+
+class JsonSerializer:
+
+    name = "json"
+    extension = ".json"
+
+    def dumps(self, obj):
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    def loads(self, raw):
+        return json.loads(raw)
+
+
+class MsgpackSerializer:
+
+    name = "msgpack"
+    extension = ".msgpack"
+
+    def __init__(self):
+        # optional dependency, only needed when this format is selected
+        try:
+            import msgpack
+        except ImportError as e:
+            raise ImportError("the msgpack snapshot format needs the msgpack package (pip install msgpack)") from e
+
+        self.msgpack = msgpack
+
+    def dumps(self, obj):
+        return self.msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, raw):
+        return self.msgpack.unpackb(raw, raw=False)
+
+
+SERIALIZERS = {
+    "json": JsonSerializer,
+    "msgpack": MsgpackSerializer,
+}
+
+
+def serializerFor(name):
+    try:
+        return SERIALIZERS[name]()
+    except KeyError:
+        raise ValueError(f"unknown snapshot format {name!r}, expected one of {tuple(SERIALIZERS)}") from None
+
+
+# write-to-temp then rename, the rename is atomic on posix and windows
+def atomicWrite(path, raw):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    fd, tmpPath = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(raw)
+        os.replace(tmpPath, path)
+    except BaseException:
+        try:
+            os.unlink(tmpPath)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class FileSnapshotStore:
+
+    # snapshots are addressed by their json path (Geapi's *Path attributes), the
+    # serializer decides the real extension
+    def __init__(self, serializer=None):
+        self.serializer = serializer or JsonSerializer()
+
+    def path(self, basePath):
+        return Path(basePath).with_suffix(self.serializer.extension)
+
+    # changes whenever the snapshot file is replaced, None if there is no snapshot.
+    # a snapshot only present in another format is migrated to ours first
+    def version(self, basePath):
+        path = self.path(basePath)
+
+        if not path.exists():
+            self._migrate(basePath)
+            if not path.exists():
+                return None
+
+        return path.stat().st_mtime_ns
+
+    def read(self, basePath):
+        return self.serializer.loads(self.path(basePath).read_bytes())
+
+    # returns the version of what was written
+    def write(self, basePath, snapshot):
+        path = self.path(basePath)
+        atomicWrite(path, self.serializer.dumps(snapshot))
+        return path.stat().st_mtime_ns
+
+    def _migrate(self, basePath):
+        for name, serializerClass in SERIALIZERS.items():
+            if name == self.serializer.name:
+                continue
+
+            legacyPath = Path(basePath).with_suffix(serializerClass.extension)
+            if not legacyPath.exists():
+                continue
+
+            snapshot = serializerClass().loads(legacyPath.read_bytes())
+            self.write(basePath, snapshot)
+            legacyPath.unlink()
+            print(f"MIGRATED {legacyPath} TO {self.serializer.name}")
+            return
+
+
+def benchmark(dataDir="./data", repeat=5):
+    import shutil
+
+    available = []
+    for name in SERIALIZERS:
+        try:
+            serializerFor(name)
+            available.append(name)
+        except ImportError as e:
+            print(f"{name}: skipped ({e})")
+
+    sources = sorted(Path(dataDir).glob("*.json"))
+    scratch = Path(tempfile.mkdtemp(prefix="snapshotbench"))
+
+    try:
+        for source in sources:
+            snapshot = json.loads(source.read_bytes())
+
+            for name in available:
+                store = FileSnapshotStore(serializerFor(name))
+                basePath = scratch / source.name
+
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    store.write(basePath, snapshot)
+                saveMs = (time.perf_counter() - start) / repeat * 1000
+
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    store.read(basePath)
+                loadMs = (time.perf_counter() - start) / repeat * 1000
+
+                size = store.path(basePath).stat().st_size
+                print(f"{source.name:<18} {name:<8} {size / 1024:>8.0f} KiB  save {saveMs:>7.2f} ms  load {loadMs:>7.2f} ms")
+    finally:
+        shutil.rmtree(scratch)
+
+
+if __name__ == "__main__":
+    import sys
+
+    benchmark(*sys.argv[1:2])
@@ -0,0 +1,406 @@
+'''
+    optional SQLite storage backend for Geapi
+
+    drop-in for FileSnapshotStore (version / read / write keyed by the snapshot's
+    path stem, e.g. ./data/latest.json -> "latest") that keeps every snapshot as
+    rows instead of one big file:
+
+        snapshots  one row per snapshot: freshness fields, the http validators
+                   (etag / last_modified / size) and a write counter
+        history_snapshots  (name, ts) of every whole snapshot stored, live or backfilled
+        mapping    one row per item
+        quotes     /latest rows per (item_id, ts), ts = fetch time
+        averages   5m/1h/6h/24h rows per (endpoint, item_id, ts), ts = bucket start
+
+    old rows are kept, so the quotes / averages tables double as price history.
+    the database runs in WAL mode so the GUI and a headless scanner can read and
+    write it at the same time, and single item lookups, history ranges and the
+    scan are indexed queries instead of whole file parses.
+'''
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from columnar import NULL
+from snapshotstore import SERIALIZERS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    name TEXT PRIMARY KEY,
+    retrieved_at INTEGER NOT NULL,
+    timestamp INTEGER,
+    retries INTEGER NOT NULL DEFAULT 0,
+    ts INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    size INTEGER
+);
+CREATE TABLE IF NOT EXISTS mapping (
+    item_id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    name TEXT,
+    members INTEGER,
+    "limit" INTEGER,
+    highalch INTEGER,
+    lowalch INTEGER,
+    value INTEGER,
+    item TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS mapping_name ON mapping (name COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS quotes (
+    item_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    high INTEGER,
+    highTime INTEGER,
+    low INTEGER,
+    lowTime INTEGER,
+    PRIMARY KEY (item_id, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS quotes_ts ON quotes (ts);
+CREATE TABLE IF NOT EXISTS averages (
+    endpoint TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    avgHighPrice INTEGER,
+    highPriceVolume INTEGER,
+    avgLowPrice INTEGER,
+    lowPriceVolume INTEGER,
+    PRIMARY KEY (endpoint, item_id, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS averages_item_ts ON averages (item_id, ts);
+CREATE INDEX IF NOT EXISTS averages_endpoint_ts ON averages (endpoint, ts);
+CREATE TABLE IF NOT EXISTS history_snapshots (
+    name TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    PRIMARY KEY (name, ts)
+) WITHOUT ROWID;
+"""
+
+# columns added to the snapshots table after it was first released, added to older
+# databases on open
+SNAPSHOT_COLUMNS_ADDED = {"etag": "TEXT", "last_modified": "TEXT", "size": "INTEGER"}
+
+# validators a snapshot carries for conditional fetches, kept as they are
+VALIDATORS = ("etag", "last_modified", "size")
+
+QUOTE_COLUMNS = ("high", "highTime", "low", "lowTime")
+AVERAGE_COLUMNS = ("avgHighPrice", "highPriceVolume", "avgLowPrice", "lowPriceVolume")
+
+
+class SqliteSnapshotStore:
+
+    def __init__(self, dbPath):
+        self.dbPath = str(dbPath)
+        Path(self.dbPath).parent.mkdir(parents=True, exist_ok=True)
+
+        # sqlite connections can't be shared across threads, each thread gets its own
+        self.local = threading.local()
+
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(snapshots)")}
+            for column, kind in SNAPSHOT_COLUMNS_ADDED.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE snapshots ADD COLUMN {column} {kind}")
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.dbPath, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    @staticmethod
+    def nameOf(basePath):
+        return Path(basePath).stem
+
+    def _meta(self, name):
+        return self._connection().execute(
+            "SELECT retrieved_at, timestamp, retries, ts, version FROM snapshots WHERE name = ?", (name,)
+        ).fetchone()
+
+    # FileSnapshotStore interface
+
+    # write counter of the snapshot, None if there is none. a snapshot that only
+    # exists as a file (json / msgpack) next to basePath is imported first
+    def version(self, basePath):
+        meta = self._meta(self.nameOf(basePath))
+        if meta is None and self._migrate(basePath):
+            meta = self._meta(self.nameOf(basePath))
+        return None if meta is None else meta[4]
+
+    # freshness fields without reading the rows
+    def meta(self, basePath):
+        if self.version(basePath) is None:
+            return None
+
+        retrievedAt, timestamp, retries, _, _ = self._meta(self.nameOf(basePath))
+        meta = {"retrieved_at": retrievedAt, "retries": retries}
+        if timestamp is not None:
+            meta["timestamp"] = timestamp
+        return meta
+
+    def _migrate(self, basePath):
+        for serializerClass in SERIALIZERS.values():
+            path = Path(basePath).with_suffix(serializerClass.extension)
+            if not path.exists():
+                continue
+
+            try:
+                serializer = serializerClass()
+            except ImportError:
+                continue
+
+            self.write(basePath, serializer.loads(path.read_bytes()))
+            print(f"MIGRATED {path} TO {self.dbPath}")
+            return True
+        return False
+
+    def read(self, basePath):
+        name = self.nameOf(basePath)
+        meta = self._meta(name)
+        if meta is None:
+            raise FileNotFoundError(f"no {name} snapshot in {self.dbPath}")
+
+        retrievedAt, timestamp, retries, ts, _ = meta
+        conn = self._connection()
+
+        if name == "mapping":
+            snapshot = {
+                "retrieved_at": retrievedAt,
+                "items": [json.loads(item) for (item,) in conn.execute("SELECT item FROM mapping ORDER BY position")]
+            }
+        else:
+            columns, rows = self._rowsAt(name, ts)
+            snapshot = {
+                "retrieved_at": retrievedAt,
+                "data": {str(row[0]): dict(zip(columns, row[1:])) for row in rows}
+            }
+
+        if timestamp is not None:
+            snapshot["timestamp"] = timestamp
+        if retries:
+            snapshot["retries"] = retries
+        snapshot.update(self._validators(name))
+        return snapshot
+
+    def _validators(self, name):
+        row = self._connection().execute(
+            f"SELECT {', '.join(VALIDATORS)} FROM snapshots WHERE name = ?", (name,)
+        ).fetchone()
+        return {field: value for field, value in zip(VALIDATORS, row or ()) if value is not None}
+
+    def write(self, basePath, snapshot):
+        name = self.nameOf(basePath)
+        ts = snapshot.get("timestamp") or snapshot["retrieved_at"]
+        conn = self._connection()
+
+        with conn:
+            if name == "mapping":
+                conn.execute("DELETE FROM mapping")
+                conn.executemany(
+                    'INSERT INTO mapping (item_id, position, name, members, "limit", highalch, lowalch, value, item) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        (item["id"], position, item.get("name"), item.get("members"), item.get("limit"),
+                         item.get("highalch"), item.get("lowalch"), item.get("value"), json.dumps(item, ensure_ascii=False))
+                        for position, item in enumerate(snapshot["items"])
+                    )
+                )
+            else:
+                # a refetch of the same bucket (or /latest twice in a second) replaces
+                # the rows at ts, items missing from it must not linger
+                self._deleteRowsAt(conn, name, ts)
+                self._insertSnapshotRows(conn, name, ts, snapshot["data"])
+
+            conn.execute(
+                """
+                INSERT INTO snapshots (name, retrieved_at, timestamp, retries, ts, version, etag, last_modified, size)
+                VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET
+                    retrieved_at = excluded.retrieved_at, timestamp = excluded.timestamp,
+                    retries = excluded.retries, ts = excluded.ts, version = snapshots.version + 1,
+                    etag = excluded.etag, last_modified = excluded.last_modified, size = excluded.size
+                """,
+                (name, snapshot["retrieved_at"], snapshot.get("timestamp"), snapshot.get("retries", 0), ts,
+                 *(snapshot.get(field) for field in VALIDATORS))
+            )
+
+        return self.version(basePath)
+
+    # freshness fields and validators of a snapshot whose rows didn't change (upstream
+    # answered 304)
+    def touch(self, basePath, snapshot):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                """
+                UPDATE snapshots SET retrieved_at = ?, retries = ?, etag = ?, last_modified = ?, size = ?,
+                    version = version + 1
+                WHERE name = ?
+                """,
+                (snapshot["retrieved_at"], snapshot.get("retries", 0),
+                 *(snapshot.get(field) for field in VALIDATORS), self.nameOf(basePath))
+            )
+        return self.version(basePath)
+
+    def _insertRows(self, conn, name, rows):
+        if name == "latest":
+            conn.executemany(
+                "INSERT OR REPLACE INTO quotes (item_id, ts, high, highTime, low, lowTime) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        else:
+            conn.executemany(
+                "INSERT OR REPLACE INTO averages (endpoint, item_id, ts, avgHighPrice, highPriceVolume, avgLowPrice, lowPriceVolume) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((name, *row) for row in rows)
+            )
+
+    def _deleteRowsAt(self, conn, name, ts):
+        if name == "latest":
+            conn.execute("DELETE FROM quotes WHERE ts = ?", (ts,))
+        else:
+            conn.execute("DELETE FROM averages WHERE endpoint = ? AND ts = ?", (name, ts))
+
+    def _insertSnapshotRows(self, conn, name, ts, data):
+        columns = self._columnsOf(name)
+        self._insertRows(conn, name, (
+            (int(itemId), ts, *(entry.get(c) for c in columns))
+            for itemId, entry in data.items()
+        ))
+        conn.execute("INSERT OR IGNORE INTO history_snapshots (name, ts) VALUES (?, ?)", (name, ts))
+
+    # history, same shape as HistoryStore. write() already keeps every snapshot's rows,
+    # ingest() is for snapshots that shouldn't become the current one (backfill)
+
+    def ingest(self, name, snapshot, columns):
+        ts = snapshot.get("timestamp") or snapshot["retrieved_at"]
+        conn = self._connection()
+
+        if conn.execute("SELECT 1 FROM history_snapshots WHERE name = ? AND ts = ?", (name, ts)).fetchone():
+            return False
+
+        with conn:
+            self._insertSnapshotRows(conn, name, ts, snapshot["data"])
+        return True
+
+    # records: rows of (timestamp, item_id, *columns), NULL sentinels allowed
+    def appendRecords(self, name, records):
+        rows = (
+            (int(r[1]), int(r[0]), *(None if v == NULL else int(v) for v in r[2:]))
+            for r in records
+        )
+        conn = self._connection()
+        with conn:
+            self._insertRows(conn, name, rows)
+
+    def snapshotTimestampsBetween(self, name, start, end):
+        rows = self._connection().execute(
+            "SELECT ts FROM history_snapshots WHERE name = ? AND ts BETWEEN ? AND ? ORDER BY ts", (name, start, end)
+        ).fetchall()
+        return [ts for (ts,) in rows]
+
+    def itemHistory(self, name, itemId, start, end, columns):
+        if name == "latest":
+            sql = "SELECT ts, high, highTime, low, lowTime FROM quotes WHERE item_id = ? AND ts BETWEEN ? AND ? ORDER BY ts"
+            params = (int(itemId), start, end)
+        else:
+            sql = (
+                "SELECT ts, avgHighPrice, highPriceVolume, avgLowPrice, lowPriceVolume FROM averages "
+                "WHERE endpoint = ? AND item_id = ? AND ts BETWEEN ? AND ? ORDER BY ts"
+            )
+            params = (name, int(itemId), start, end)
+
+        rows = self._connection().execute(sql, params).fetchall()
+        frame = pd.DataFrame(rows, columns=["timestamp", *self._columnsOf(name)])
+        return frame.astype({column: "Int64" for column in self._columnsOf(name)})
+
+    # itemId -> sorted timestamps stored for it in [start, end]
+    def itemTimestamps(self, name, itemIds, start, end, columns):
+        itemIds = sorted({int(i) for i in itemIds})
+        found = {itemId: [] for itemId in itemIds}
+
+        if name == "latest":
+            sql = "SELECT item_id, ts FROM quotes WHERE ts BETWEEN ? AND ?"
+            params = [start, end]
+        else:
+            sql = "SELECT item_id, ts FROM averages WHERE endpoint = ? AND ts BETWEEN ? AND ?"
+            params = [name, start, end]
+
+        sql += f" AND item_id IN ({', '.join('?' * len(itemIds))}) ORDER BY item_id, ts"
+        for itemId, ts in self._connection().execute(sql, params + itemIds):
+            found[itemId].append(ts)
+
+        return {itemId: np.array(ts, dtype=np.int64) for itemId, ts in found.items()}
+
+    # indexed lookups
+
+    @staticmethod
+    def _columnsOf(name):
+        return QUOTE_COLUMNS if name == "latest" else AVERAGE_COLUMNS
+
+    def _rowsAt(self, name, ts, itemIds=None):
+        columns = self._columnsOf(name)
+        conn = self._connection()
+
+        if name == "latest":
+            sql = "SELECT item_id, high, highTime, low, lowTime FROM quotes WHERE ts = ?"
+            params = [ts]
+        else:
+            sql = "SELECT item_id, avgHighPrice, highPriceVolume, avgLowPrice, lowPriceVolume FROM averages WHERE endpoint = ? AND ts = ?"
+            params = [name, ts]
+
+        if itemIds is not None:
+            itemIds = [int(i) for i in itemIds]
+            sql += f" AND item_id IN ({', '.join('?' * len(itemIds))})"
+            params += itemIds
+
+        return columns, conn.execute(sql + " ORDER BY item_id", params).fetchall()
+
+    # {item_id: row dict} for the current snapshot, missing items left out
+    def lookupMany(self, name, itemIds):
+        meta = self._meta(name)
+        if meta is None or not itemIds:
+            return {}
+
+        columns, rows = self._rowsAt(name, meta[3], itemIds)
+        return {row[0]: dict(zip(columns, row[1:])) for row in rows}
+
+    def lookup(self, name, itemId):
+        return self.lookupMany(name, [itemId]).get(int(itemId))
+
+    # candidate rows for findWidestSpreads: current /latest joined to the current 5m
+    # averages and the mapping, with the scan's filters pushed into the query.
+    # columns: item_id, name, limit, high, low, highTime, lowTime, lowPriceVolume, highPriceVolume
+    def widestSpreadRows(self, taxRate):
+        latestMeta = self._meta("latest")
+        fiveMinMeta = self._meta("fiveMinAve")
+        if latestMeta is None or fiveMinMeta is None:
+            return []
+
+        return self._connection().execute(
+            """
+            SELECT q.item_id, m.name, m."limit", m.members, q.high, q.low, q.highTime, q.lowTime, a.lowPriceVolume, a.highPriceVolume
+            FROM quotes q
+            JOIN mapping m ON m.item_id = q.item_id
+            JOIN averages a ON a.endpoint = 'fiveMinAve' AND a.item_id = q.item_id AND a.ts = ?
+            WHERE q.ts = ?
+                AND q.high > 0 AND q.low > 0
+                AND (q.high - 1) - (q.low + 1) > 0
+                AND q.highTime IS NOT NULL AND q.lowTime IS NOT NULL
+                AND ((q.high - 1) - (q.low + 1)) - ? * (q.high - 1) > 0
+                AND a.lowPriceVolume != 0 AND a.highPriceVolume != 0
+                AND m."limit" != 0
+                AND (a.lowPriceVolume + a.highPriceVolume) * 1.0 / m."limit" >= 1
+            ORDER BY q.item_id
+            """,
+            (fiveMinMeta[3], latestMeta[3], taxRate)
+        ).fetchall()
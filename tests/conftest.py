@@ -0,0 +1,51 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# the modules live flat at the repo root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from ratelimit import sharedLimiter
+from standin import StandinServer
+
+
+@pytest.fixture
+def standin():
+    server = StandinServer().start()
+    yield server
+    server.stop()
+
+
+# the shared limit would space requests 5s apart, tests only care that they go through it
+@pytest.fixture(autouse=True)
+def fastLimiter():
+    limiter = sharedLimiter()
+    rate, burst = limiter.rate, limiter.burst
+    limiter.configure(1000, 20)
+    yield limiter
+    limiter.configure(rate, burst)
+
+
+# Geapi(**options) against the stand-in, with an empty data dir under tmp_path
+@pytest.fixture
+def makeGeapi(standin, tmp_path):
+    from api import Geapi
+
+    def make(**options):
+        options.setdefault("dataDir", str(tmp_path / "data"))
+        return Geapi(standin.url, **options)
+
+    return make
+
+
+# GeController(**options) against the stand-in, sharing makeGeapi's data dir
+@pytest.fixture
+def makeController(standin, tmp_path):
+    from controller import GeController
+
+    def make(**options):
+        options.setdefault("dataDir", str(tmp_path / "data"))
+        return GeController(endpoint=standin.url, **options)
+
+    return make
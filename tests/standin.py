@@ -0,0 +1,214 @@
+'''
+    local stand-in for the prices api, for tests and manual runs
+
+    serves the snapshots bundled in data/ the way the wiki does, plus what the
+    conditional / compressed fetch path needs to be exercised:
+
+        /latest /5m /1h /6h /24h /mapping    ETag + Last-Modified, 304 on a match,
+                                             gzip when the client accepts it
+        /latest?id=X                         just that item's quote
+        /5m /1h /6h /24h?timestamp=T         that bucket (same items, T as timestamp)
+        /timeseries?id=X&timestep=1h         the newest TIMESERIES_POINTS buckets of
+                                             one item, made up from its /1h entry
+
+    every request is logged (route, query, headers, status, bytes written) so tests
+    can check what a client sent. delay adds latency per request, failures makes
+    routes answer 500.
+
+        python tests/standin.py --port 8000 --delay 1
+        python scancli.py --endpoint http://127.0.0.1:8000
+'''
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+DATA_DIR = Path(__file__).resolve().parents[1] / "data"
+
+ROUTES = {
+    "/latest": "latest.json",
+    "/5m": "fiveMinAve.json",
+    "/1h": "oneHourAve.json",
+    "/6h": "sixHourAve.json",
+    "/24h": "oneDayAve.json",
+    "/mapping": "mapping.json",
+}
+
+BUCKETS = {"/5m": 5 * 60, "/1h": 60 * 60, "/6h": 6 * 60 * 60, "/24h": 24 * 60 * 60}
+TIMESTEPS = {"5m": "/5m", "1h": "/1h", "6h": "/6h", "24h": "/24h"}
+
+TIMESERIES_POINTS = 365
+
+
+# start of the newest bucket the server has finished averaging
+def newestBucket(step, now=None):
+    now = int(time.time()) if now is None else now
+    return (now // step - 1) * step
+
+
+class StandinServer:
+
+    def __init__(self, dataDir=DATA_DIR, host="127.0.0.1", port=0, delay=0.0):
+        self.payloads = {}
+        for route, fileName in ROUTES.items():
+            stored = json.loads(Path(dataDir, fileName).read_bytes())
+            self.payloads[route] = stored["items"] if route == "/mapping" else stored["data"]
+
+        self.delay = delay
+        self.gzip = True
+        self.failures = set()  # routes answering 500
+        self.failAfter = None  # requests served before every later one answers 500
+
+        self.lock = threading.Lock()
+        self.requests = []
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.lastModified = {}
+
+        handler = type("Handler", (StandinHandler,), {"standin": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="StandinServer", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    # changes one /latest quote, so the next /latest has a new ETag
+    def bump(self):
+        quote = next(iter(self.payloads["/latest"].values()))
+        quote["high"] += 1
+
+    def requestsTo(self, route):
+        with self.lock:
+            return [request for request in self.requests if request["route"] == route]
+
+    # body for a route, None when there is no such route
+    def body(self, route, query):
+        if route == "/timeseries":
+            return self._timeseries(query)
+        if route not in self.payloads:
+            return None
+        if route == "/mapping":
+            return json.dumps(self.payloads[route]).encode("utf-8")
+
+        data = self.payloads[route]
+        if route == "/latest" and "id" in query:
+            data = {query["id"]: data[query["id"]]} if query["id"] in data else {}
+
+        out = {"data": data}
+        if route in BUCKETS:
+            out["timestamp"] = int(query["timestamp"]) if "timestamp" in query else newestBucket(BUCKETS[route])
+        return json.dumps(out).encode("utf-8")
+
+    def _timeseries(self, query):
+        itemId = query.get("id")
+        step = BUCKETS[TIMESTEPS[query.get("timestep", "5m")]]
+        entry = self.payloads["/1h"].get(itemId) or {}
+
+        newest = newestBucket(step)
+        points = [{"timestamp": newest - i * step, **entry} for i in range(TIMESERIES_POINTS)]
+        return json.dumps({"data": points[::-1], "itemId": int(itemId)}).encode("utf-8")
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    standin = None  # set by StandinServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        standin = self.standin
+        url = urlparse(self.path)
+        route = url.path.replace("/api/v1/osrs", "")
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        request = {"route": route, "query": query, "headers": dict(self.headers), "status": None, "bytes": 0}
+        with standin.lock:
+            standin.requests.append(request)
+            served = len(standin.requests)
+            standin.inFlight += 1
+            standin.maxInFlight = max(standin.maxInFlight, standin.inFlight)
+
+        try:
+            if standin.delay:
+                time.sleep(standin.delay)
+            self._respond(request, route, query, served)
+        finally:
+            with standin.lock:
+                standin.inFlight -= 1
+
+    def _respond(self, request, route, query, served):
+        standin = self.standin
+
+        if route in standin.failures or (standin.failAfter is not None and served > standin.failAfter):
+            return self._send(request, 500, b"{}")
+
+        body = standin.body(route, query)
+        if body is None:
+            return self._send(request, 404, b"{}")
+
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        lastModified = standin.lastModified.setdefault(etag, formatdate(time.time(), usegmt=True))
+        headers = {"ETag": etag, "Last-Modified": lastModified}
+
+        ifNoneMatch = self.headers.get("If-None-Match")
+        if ifNoneMatch == etag or (ifNoneMatch is None and self.headers.get("If-Modified-Since") == lastModified):
+            return self._send(request, 304, None, headers)
+
+        if standin.gzip and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+
+        headers["Content-Type"] = "application/json"
+        self._send(request, 200, body, headers)
+
+    def _send(self, request, status, body, headers=None):
+        request["status"] = status
+        request["bytes"] = len(body) if body else 0
+
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(request["bytes"]))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="local stand-in for the prices api")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds of latency per request")
+    parser.add_argument("--no-gzip", action="store_true")
+    args = parser.parse_args()
+
+    standin = StandinServer(host=args.host, port=args.port, delay=args.delay)
+    standin.gzip = not args.no_gzip
+    print(f"STAND-IN SERVING ON {standin.url}")
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
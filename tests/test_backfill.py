@@ -0,0 +1,139 @@
+import random
+import sys
+
+import pytest
+import requests
+
+from backfill import TIMESERIES_POINTS, Backfiller, maximumMatching, minimumVertexCover
+from columnar import AVERAGE_COLUMNS
+
+ITEMS = [2, 561]
+
+# 400 daily buckets: the newest 365 inside the /timeseries window, 35 older than it
+DAYS = TIMESERIES_POINTS + 35
+
+
+# both history stores: HistoryStore segments and the sqlite tables
+@pytest.fixture(params=["files", "sqlite"])
+def storage(request):
+    return request.param
+
+
+@pytest.fixture
+def geapi(makeGeapi, storage):
+    return makeGeapi(recordHistory=True, storage=storage)
+
+
+def storedPoints(backfiller, plan):
+    stored = backfiller.geapi.historyStore.itemTimestamps(
+        backfiller.name, plan.items, int(plan.buckets[0]), int(plan.buckets[-1]), AVERAGE_COLUMNS
+    )
+    return {itemId: len(timestamps) for itemId, timestamps in stored.items()}
+
+
+def test_plan_covers_missing_points_with_fewest_requests(geapi):
+    backfiller = Backfiller(geapi, "24h")
+
+    # few items over many buckets: one timeseries request per item
+    plan = backfiller.plan(ITEMS, 10)
+    assert plan.missing == len(ITEMS) * 10
+    assert plan.timeseriesTasks == ITEMS
+    assert plan.bucketTasks == []
+
+    # many items over few buckets: one bucket request per bucket
+    plan = backfiller.plan(range(2, 40), 3)
+    assert plan.timeseriesTasks == []
+    assert plan.bucketTasks == sorted(plan.buckets.tolist(), reverse=True)
+
+    # buckets older than the timeseries window can only come from bucket requests
+    plan = backfiller.plan(ITEMS, DAYS)
+    assert plan.timeseriesTasks == ITEMS
+    assert len(plan.bucketTasks) == DAYS - TIMESERIES_POINTS
+    assert max(plan.bucketTasks) < int(plan.buckets[-1]) - (TIMESERIES_POINTS - 1) * backfiller.step
+
+
+def test_run_fills_every_missing_point(standin, geapi):
+    backfiller = Backfiller(geapi, "24h")
+    plan = backfiller.plan(ITEMS, DAYS)
+
+    assert backfiller.run(plan) == len(plan)
+    assert len(standin.requests) == len(plan)
+    assert storedPoints(backfiller, plan) == {itemId: DAYS for itemId in ITEMS}
+    assert len(backfiller.plan(ITEMS, DAYS)) == 0
+
+
+def test_interrupted_run_resumes_from_checkpoint(standin, geapi, makeGeapi, storage):
+    backfiller = Backfiller(geapi, "24h")
+    plan = backfiller.plan(ITEMS, DAYS)
+
+    standin.failAfter = 10
+    with pytest.raises(requests.HTTPError):
+        backfiller.run(plan)
+
+    # a new run (new process) only plans what the first didn't finish
+    standin.failAfter = None
+    resumed = Backfiller(makeGeapi(recordHistory=True, storage=storage), "24h")
+    rest = resumed.plan(ITEMS, DAYS)
+    assert len(rest) == len(plan) - 10
+
+    served = len(standin.requests)
+    resumed.run(rest)
+    assert len(standin.requests) - served == len(rest)
+
+    # no bucket was fetched twice
+    buckets = [r["query"]["timestamp"] for r in standin.requestsTo("/24h") if r["status"] == 200]
+    assert len(buckets) == len(set(buckets)) == len(plan.bucketTasks)
+
+    assert storedPoints(resumed, plan) == {itemId: DAYS for itemId in ITEMS}
+    assert len(resumed.plan(ITEMS, DAYS)) == 0
+
+
+def test_backfill_needs_a_history_store(makeGeapi):
+    with pytest.raises(ValueError):
+        Backfiller(makeGeapi(), "24h")
+
+
+def matchingSize(adjacency, rightCount):
+    matchLeft, matchRight = maximumMatching(adjacency, rightCount)
+    for left, right in enumerate(matchLeft):
+        if right != -1:
+            assert right in adjacency[left] and matchRight[right] == left
+    return sum(right != -1 for right in matchLeft)
+
+
+# plain augmenting path search, for small graphs
+def slowMatchingSize(adjacency, rightCount):
+    matchRight = [-1] * rightCount
+
+    def augment(left, seen):
+        for right in adjacency[left]:
+            if right not in seen:
+                seen.add(right)
+                if matchRight[right] == -1 or augment(matchRight[right], seen):
+                    matchRight[right] = left
+                    return True
+        return False
+
+    return sum(augment(left, set()) for left in range(len(adjacency)))
+
+
+def test_maximum_matching_on_random_graphs():
+    rng = random.Random(0)
+    for _ in range(200):
+        lefts, rights = rng.randint(0, 12), rng.randint(1, 12)
+        adjacency = [rng.sample(range(rights), rng.randint(0, rights)) for _ in range(lefts)]
+
+        assert matchingSize(adjacency, rights) == slowMatchingSize(adjacency, rights)
+
+        coverLeft, coverRight = minimumVertexCover(adjacency, rights)
+        assert len(coverLeft) + len(coverRight) == slowMatchingSize(adjacency, rights)
+        assert all(left in coverLeft or right in coverRight for left in range(lefts) for right in adjacency[left])
+
+
+def test_augmenting_paths_longer_than_the_recursion_limit():
+    # the first phase matches left i to right i + 1, leaving the last left vertex one
+    # augmenting path through every other vertex away from right 0
+    count = sys.getrecursionlimit() * 2
+    adjacency = [[i + 1, i] for i in range(count - 1)] + [[count - 1]]
+
+    assert matchingSize(adjacency, count) == count
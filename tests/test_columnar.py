@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+import api
+from columnar import LATEST_COLUMNS, NULL, ColumnarSnapshot, openColumnar, writeColumnar
+
+SNAPSHOT = {
+    "retrieved_at": 1_700_000_123,
+    "data": {
+        "561": {"high": 200, "highTime": 1_700_000_000, "low": 190, "lowTime": None},
+        "2": {"high": 220, "highTime": 1_700_000_001, "low": 210, "lowTime": 1_700_000_002},
+        "4151": {"low": 1_500_000},
+    },
+}
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "latest.col"
+    writeColumnar(path, SNAPSHOT, LATEST_COLUMNS)
+
+    columnar = ColumnarSnapshot(path)
+
+    assert len(columnar) == 3
+    assert columnar.ids.tolist() == [2, 561, 4151]
+    assert columnar.columnNames == list(LATEST_COLUMNS)
+    assert columnar.meta() == {"retrieved_at": SNAPSHOT["retrieved_at"], "retries": 0}
+    for itemId, quote in SNAPSHOT["data"].items():
+        assert columnar.lookup(itemId) == {column: quote.get(column) for column in LATEST_COLUMNS}
+    assert columnar.lookup(3) is None
+    assert columnar.column("highTime")[2] == NULL
+
+
+def test_bucket_fields_round_trip(tmp_path):
+    path = tmp_path / "fiveMinAve.col"
+    writeColumnar(path, {**SNAPSHOT, "timestamp": 1_700_000_100, "retries": 2}, LATEST_COLUMNS)
+
+    assert ColumnarSnapshot(path).meta() == {"retrieved_at": SNAPSHOT["retrieved_at"], "retries": 2, "timestamp": 1_700_000_100}
+
+
+def test_not_a_columnar_file(tmp_path):
+    path = tmp_path / "latest.col"
+    path.write_bytes(b"\0" * 64)
+
+    with pytest.raises(ValueError):
+        ColumnarSnapshot(path)
+
+
+def test_open_columnar_reopens_a_replaced_file(tmp_path):
+    path = tmp_path / "latest.col"
+    assert openColumnar(path) is None
+
+    writeColumnar(path, SNAPSHOT, LATEST_COLUMNS)
+    first = openColumnar(path)
+    assert openColumnar(path) is first
+
+    changed = {**SNAPSHOT, "retrieved_at": SNAPSHOT["retrieved_at"] + 60}
+    writeColumnar(path, changed, LATEST_COLUMNS)
+    os.utime(path, ns=(first.version + 1, first.version + 1))
+    second = openColumnar(path)
+
+    assert second is not first
+    assert second.retrievedAt == changed["retrieved_at"]
+    # the old mapping keeps serving the old contents
+    assert first.retrievedAt == SNAPSHOT["retrieved_at"]
+
+
+def test_lookups_come_from_the_columnar_copy(standin, makeGeapi):
+    geapi = makeGeapi()
+    geapi._saveSnapshot("latest")
+
+    # a second process: nothing in memory, the fresh columnar copy answers alone
+    reader = makeGeapi()
+    assert reader.lookupItem("latest", 2) == standin.payloads["/latest"]["2"]
+    assert reader.lookupItem("latest", 999999999) is None
+    assert reader.snapshotCache == {}
+    assert len(standin.requests) == 1
+
+
+def test_fetch_is_kept_when_the_columnar_copy_cant_be_written(standin, makeGeapi, monkeypatch):
+    def fail(*args, **kwargs):
+        raise PermissionError("still mapped")
+
+    geapi = makeGeapi()
+    monkeypatch.setattr(api, "writeColumnar", fail)
+    geapi._saveSnapshot("latest")
+
+    assert geapi.getLatestSnapshot()["data"] == standin.payloads["/latest"]
+    assert geapi.getSnapshotArrays("latest").ids.tolist() == [int(itemId) for itemId in standin.payloads["/latest"]]
+    assert len(standin.requests) == 1
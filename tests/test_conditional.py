@@ -0,0 +1,124 @@
+import json
+import time
+
+import pytest
+
+
+def test_refetch_is_conditional(standin, makeGeapi):
+    geapi = makeGeapi()
+    geapi._saveSnapshot("latest")
+    etag = geapi.getLatestSnapshot()["etag"]
+
+    geapi._saveSnapshot("latest")
+
+    first, second = standin.requestsTo("/latest")
+    assert "If-None-Match" not in first["headers"]
+    assert second["headers"]["If-None-Match"] == etag
+    assert second["status"] == 304
+    assert geapi.getTransferStats()["latest"]["notModified"] == 1
+
+
+def test_changed_payload_is_refetched(standin, makeGeapi):
+    geapi = makeGeapi()
+    geapi._saveSnapshot("latest")
+    etag = geapi.getLatestSnapshot()["etag"]
+
+    standin.bump()
+    geapi._saveSnapshot("latest")
+
+    assert standin.requestsTo("/latest")[-1]["status"] == 200
+    assert geapi.getLatestSnapshot()["etag"] != etag
+    assert geapi.getLatestSnapshot()["data"] == standin.payloads["/latest"]
+
+
+def test_not_modified_only_moves_retrieved_at(standin, makeGeapi):
+    geapi = makeGeapi(recordHistory=True)
+    geapi._saveSnapshot("latest")
+
+    # as if it had been fetched ten minutes ago
+    snapshot = geapi.snapshotCache["latest"]["snapshot"]
+    snapshot["retrieved_at"] -= 600
+    before = dict(snapshot)
+    now = int(time.time())
+    recorded = geapi.historyStore.snapshotTimestampsBetween("latest", now - 3600, now + 3600)
+    assert len(recorded) == 1
+
+    geapi._saveSnapshot("latest")
+    after = geapi.getLatestSnapshot()
+
+    assert standin.requestsTo("/latest")[-1]["status"] == 304
+    assert after["retrieved_at"] >= int(time.time()) - 1
+    assert after["data"] is before["data"]
+    assert {k: v for k, v in after.items() if k != "retrieved_at"} == {k: v for k, v in before.items() if k != "retrieved_at"}
+
+    # nothing new was published, so no history point
+    assert geapi.historyStore.snapshotTimestampsBetween("latest", now - 3600, now + 3600) == recorded
+
+    # and the file on disk carries the new retrieved_at
+    reread = makeGeapi()
+    assert reread.getLatestSnapshot()["retrieved_at"] == after["retrieved_at"]
+
+
+def test_gzip_transfer_accounting(standin, makeGeapi):
+    geapi = makeGeapi()
+    geapi._saveSnapshot("latest")
+
+    request = standin.requestsTo("/latest")[0]
+    size = len(standin.body("/latest", {}))
+    stats = geapi.getTransferStats()["latest"]
+
+    assert "gzip" in request["headers"]["Accept-Encoding"]
+    assert stats["wireBytes"] == request["bytes"]
+    assert stats["wireBytes"] < size
+    assert stats["savedBytes"] == size - request["bytes"]
+    assert geapi.getLatestSnapshot()["size"] == size
+
+    # a 304 saves the whole body
+    geapi._saveSnapshot("latest")
+    stats = geapi.getTransferStats()["latest"]
+    assert stats["wireBytes"] == request["bytes"]
+    assert stats["savedBytes"] == (size - request["bytes"]) + size
+
+
+def test_uncompressed_transfer_saves_nothing(standin, makeGeapi):
+    standin.gzip = False
+    geapi = makeGeapi()
+    geapi._saveSnapshot("mapping")
+
+    stats = geapi.getTransferStats()["mapping"]
+    assert stats["wireBytes"] == standin.requestsTo("/mapping")[0]["bytes"]
+    assert stats["savedBytes"] == 0
+    assert geapi.getItemMapping()["items"] == json.loads(standin.body("/mapping", {}))
+
+
+@pytest.mark.parametrize("storage", ["files", "sqlite"])
+def test_validators_survive_restart(standin, makeGeapi, storage):
+    first = makeGeapi(storage=storage)
+    first._saveSnapshot("latest")
+    etag = first.getLatestSnapshot()["etag"]
+
+    # a new process reads the snapshot (and its validators) from disk, then revalidates it
+    geapi = makeGeapi(storage=storage)
+    geapi.getLatestSnapshot()
+    geapi.snapshotCache["latest"]["snapshot"]["retrieved_at"] -= 600
+    geapi.getLatestSnapshot()
+
+    requests = standin.requestsTo("/latest")
+    assert len(requests) == 2
+    assert requests[-1]["headers"]["If-None-Match"] == etag
+    assert requests[-1]["status"] == 304
+    assert geapi.getTransferStats()["latest"]["savedBytes"] == len(standin.body("/latest", {}))
+
+
+def test_sqlite_not_modified_keeps_the_validators(standin, makeGeapi):
+    geapi = makeGeapi(storage="sqlite")
+    geapi._saveSnapshot("latest")
+    before = geapi.getLatestSnapshot()
+
+    geapi._saveSnapshot("latest")
+    geapi.clearSnapshotCache()
+    after = geapi.getLatestSnapshot()
+
+    assert standin.requestsTo("/latest")[-1]["status"] == 304
+    assert {k: after[k] for k in ("etag", "last_modified", "size")} == {k: before[k] for k in ("etag", "last_modified", "size")}
+    assert after["retrieved_at"] >= before["retrieved_at"]
@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+
+from columnar import AVERAGE_COLUMNS, LATEST_COLUMNS, NULL
+from history import DAY_SECONDS, HistoryStore
+
+DAY = 1_700_006_400 // DAY_SECONDS * DAY_SECONDS
+
+
+def snapshot(ts, data, **fields):
+    return {"retrieved_at": ts, "data": data, **fields}
+
+
+def test_ingest_and_item_history_round_trip(tmp_path):
+    store = HistoryStore(tmp_path)
+    times = [DAY + 60, DAY + 120, DAY + DAY_SECONDS + 60]
+    for i, ts in enumerate(times):
+        assert store.ingest("latest", snapshot(ts, {
+            "2": {"high": 100 + i, "highTime": ts, "low": 90, "lowTime": None},
+            "66": {"high": 5, "highTime": ts, "low": 4, "lowTime": ts},
+        }), LATEST_COLUMNS)
+
+    history = store.itemHistory("latest", 2, DAY, DAY + 2 * DAY_SECONDS, LATEST_COLUMNS)
+
+    assert history["timestamp"].tolist() == times
+    assert history["high"].tolist() == [100, 101, 102]
+    assert history["lowTime"].isna().all()
+    assert store.itemHistory("latest", 2, DAY + 100, DAY + 200, LATEST_COLUMNS)["timestamp"].tolist() == [DAY + 120]
+    assert store.itemHistory("latest", 3, DAY, DAY + 2 * DAY_SECONDS, LATEST_COLUMNS).empty
+
+
+def test_a_snapshot_is_only_stored_once(tmp_path):
+    store = HistoryStore(tmp_path)
+    bucket = snapshot(DAY + 600, {"2": {"avgHighPrice": 1}}, timestamp=DAY + 300)
+
+    assert store.ingest("fiveMinAve", bucket, AVERAGE_COLUMNS)
+    # a refetch of the same bucket, keyed on the server timestamp not the fetch time
+    assert not store.ingest("fiveMinAve", {**bucket, "retrieved_at": DAY + 900}, AVERAGE_COLUMNS)
+
+    assert store.snapshotTimestampsBetween("fiveMinAve", DAY, DAY + DAY_SECONDS) == [DAY + 300]
+    assert len(store.itemHistory("fiveMinAve", 2, DAY, DAY + DAY_SECONDS, AVERAGE_COLUMNS)) == 1
+
+
+def test_the_last_write_of_a_timestamp_wins(tmp_path):
+    store = HistoryStore(tmp_path)
+    store.appendRecords("oneHourAve", [[DAY, 2, 10, 1, 9, 1], [DAY + 3600, 2, 11, 1, 9, 1]])
+    store.appendRecords("oneHourAve", [[DAY, 2, 12, 1, 9, NULL]])
+
+    history = store.itemHistory("oneHourAve", 2, DAY, DAY + DAY_SECONDS, AVERAGE_COLUMNS)
+
+    assert history["avgHighPrice"].tolist() == [12, 11]
+    assert history["lowPriceVolume"].isna().tolist() == [True, False]
+
+
+def test_item_timestamps_per_item(tmp_path):
+    store = HistoryStore(tmp_path)
+    # 2 and 66 share an item bucket
+    store.appendRecords("oneHourAve", [[DAY + i * 3600, 2, 1, 1, 1, 1] for i in range(3)])
+    store.appendRecords("oneHourAve", [[DAY + 3600, 66, 1, 1, 1, 1], [DAY + 3600, 3, 1, 1, 1, 1]])
+
+    found = store.itemTimestamps("oneHourAve", [2, 66, 7], DAY, DAY + DAY_SECONDS, AVERAGE_COLUMNS)
+
+    assert {itemId: ts.tolist() for itemId, ts in found.items()} == {
+        2: [DAY, DAY + 3600, DAY + 7200],
+        66: [DAY + 3600],
+        7: [],
+    }
+
+
+def test_history_is_recorded_only_when_asked_for(standin, makeGeapi, tmp_path):
+    now = int(time.time())
+
+    makeGeapi()._saveSnapshot("latest")
+    assert not (tmp_path / "data" / "history").exists()
+
+    geapi = makeGeapi(recordHistory=True)
+    geapi._saveSnapshot("latest")
+    geapi._saveSnapshot("fiveMinAve")
+
+    assert len(geapi.historyStore.snapshotTimestampsBetween("latest", now - 60, now + 60)) == 1
+    history = geapi.getItemHistory("latest", 2, now - 60, now + 60)
+    assert history["high"].tolist() == [standin.payloads["/latest"]["2"]["high"]]
+
+    fiveMin = geapi.getItemHistory("fiveMinAve", 2, 0, now + 60)
+    assert np.array_equal(fiveMin["lowPriceVolume"], [standin.payloads["/5m"]["2"]["lowPriceVolume"]])
@@ -0,0 +1,66 @@
+import json
+import logging
+from pathlib import Path
+
+import pytest
+
+import namesearch
+from namesearch import EXACT, FUZZY, PREFIX, WORD_PREFIX, NameIndex, nameIndexForMapping, readNameIndex
+
+MAPPING = Path(__file__).resolve().parents[1] / "data" / "mapping.json"
+
+
+@pytest.fixture(scope="module")
+def items():
+    return json.loads(MAPPING.read_bytes())["items"]
+
+
+@pytest.fixture(scope="module")
+def index(items):
+    return NameIndex.build(items)
+
+
+@pytest.fixture(autouse=True)
+def freshIndexCache():
+    namesearch._indexCache.update({"retrievedAt": None, "index": None})
+
+
+def test_ranking_tiers(index):
+    assert index.search("abyssal whip", 1) == [(4151, "Abyssal whip")]
+    assert [tier for _, tier in index.rank("abyssal whip", 3)][0] == EXACT
+    tiers = [tier for _, tier in index.rank("abyssal", 30)]
+    assert PREFIX in tiers and tiers == sorted(tiers)
+    assert (4151, "Abyssal whip") in index.search("whip")
+    assert WORD_PREFIX in {tier for _, tier in index.rank("whip")}
+
+
+def test_misspellings_fall_back_to_trigrams(index):
+    ranked = index.rank("abysal whip", 5)
+
+    assert index.names[ranked[0][0]] == "Abyssal whip"
+    assert {tier for _, tier in ranked} == {FUZZY}
+    assert index.search("qqqq") == []
+
+
+def test_cache_round_trip(items, index, tmp_path):
+    path = tmp_path / "nameindex.npz"
+    mapping = {"retrieved_at": 1, "items": items}
+
+    assert nameIndexForMapping(mapping, path).signature == index.signature
+    assert path.exists()
+
+    loaded = readNameIndex(path, index.signature)
+    assert loaded.search("rune plat") == index.search("rune plat")
+    assert readNameIndex(path, "another signature") is None
+
+
+def test_cache_write_failure_is_logged(items, tmp_path, caplog):
+    # the cache file's directory is a file, so the write fails
+    (tmp_path / "data").write_bytes(b"")
+    mapping = {"retrieved_at": 1, "items": items}
+
+    with caplog.at_level(logging.WARNING, logger="namesearch"):
+        index = nameIndexForMapping(mapping, tmp_path / "data" / "nameindex.npz")
+
+    assert index.search("abyssal whip", 1) == [(4151, "Abyssal whip")]
+    assert "couldn't cache the name index" in caplog.text
@@ -0,0 +1,76 @@
+import pytest
+
+from api import SNAPSHOTS, RefreshPlanner
+
+NOW = 1_700_000_000
+
+
+@pytest.fixture
+def planner():
+    return RefreshPlanner()
+
+
+def test_continuous_snapshots_refresh_on_their_ttl(planner):
+    snapshot = {"retrieved_at": NOW}
+
+    assert planner.nextRefreshAt("latest", snapshot) == NOW + SNAPSHOTS["latest"]["ttl"]
+    assert not planner.isStale("latest", snapshot, NOW + SNAPSHOTS["latest"]["ttl"] - 1)
+    assert planner.isStale("latest", snapshot, NOW + SNAPSHOTS["latest"]["ttl"])
+
+
+def test_bucketed_snapshots_refresh_after_the_next_bucket_is_published(planner):
+    bucket = SNAPSHOTS["oneHourAve"]["bucket"]
+    timestamp = (NOW // bucket - 1) * bucket
+    snapshot = {"retrieved_at": NOW, "timestamp": timestamp}
+
+    due = planner.nextRefreshAt("oneHourAve", snapshot)
+    assert due == timestamp + 2 * bucket + RefreshPlanner.PUBLISH_DELAY
+    assert due < NOW + SNAPSHOTS["oneHourAve"]["ttl"] + RefreshPlanner.PUBLISH_DELAY
+
+
+def test_old_server_timestamp_is_capped_at_two_ttls(planner):
+    ttl = SNAPSHOTS["oneDayAve"]["ttl"]
+    snapshot = {"retrieved_at": NOW, "timestamp": NOW + 10 * ttl}
+
+    assert planner.nextRefreshAt("oneDayAve", snapshot) == NOW + 2 * ttl
+
+
+def test_snapshots_without_a_server_timestamp_use_the_ttl(planner):
+    snapshot = {"retrieved_at": NOW, "timestamp": None}
+
+    assert planner.nextRefreshAt("fiveMinAve", snapshot) == NOW + SNAPSHOTS["fiveMinAve"]["ttl"]
+
+
+def test_late_buckets_retry_on_a_growing_window(planner):
+    bucket = SNAPSHOTS["oneHourAve"]["bucket"]
+    windows = [
+        planner.nextRefreshAt("oneHourAve", {"retrieved_at": NOW, "timestamp": NOW - bucket, "retries": retries}) - NOW
+        for retries in range(1, 12)
+    ]
+
+    assert windows[:4] == [15, 30, 60, 120]
+    assert windows[-1] == bucket
+    assert windows == sorted(windows)
+
+
+def test_refetching_the_same_bucket_schedules_a_retry(standin, makeGeapi):
+    # /1h, so the newest bucket doesn't roll over mid test
+    geapi = makeGeapi()
+    geapi._saveSnapshot("oneHourAve")
+    assert "retries" not in geapi.getOneHourAveSnapshot()
+
+    # unchanged payload, answered with a 304
+    geapi._saveSnapshot("oneHourAve")
+    snapshot = geapi.getOneHourAveSnapshot()
+    assert standin.requestsTo("/1h")[-1]["status"] == 304
+    assert snapshot["retries"] == 1
+    assert geapi.nextRefreshAt("oneHourAve") == snapshot["retrieved_at"] + RefreshPlanner.RETRY_SECONDS
+
+    # new payload, but still the same bucket
+    next(iter(standin.payloads["/1h"].values()))["lowPriceVolume"] += 1
+    geapi._saveSnapshot("oneHourAve")
+    snapshot = geapi.getOneHourAveSnapshot()
+    assert standin.requestsTo("/1h")[-1]["status"] == 200
+    assert snapshot["retries"] == 2
+    assert geapi.nextRefreshAt("oneHourAve") == snapshot["retrieved_at"] + 2 * RefreshPlanner.RETRY_SECONDS
+    assert geapi.getCacheStats()["oneHourAve"]["unchanged"] == 2
@@ -0,0 +1,54 @@
+from api import SNAPSHOTS
+
+
+def age(geapi, seconds):
+    geapi.snapshotCache["latest"]["snapshot"]["retrieved_at"] -= seconds
+
+
+def test_quotes_inside_the_ttl_come_from_the_snapshot(standin, makeGeapi):
+    geapi = makeGeapi()
+    geapi._saveSnapshot("latest")
+    age(geapi, SNAPSHOTS["latest"]["ttl"] - 30)
+
+    quotes = geapi.getQuotes(["2", 6, 999999999])
+
+    assert len(standin.requests) == 1
+    assert quotes == {2: standin.payloads["/latest"]["2"], 6: standin.payloads["/latest"]["6"], 999999999: None}
+    assert geapi.getQuotes([2]) == {2: standin.payloads["/latest"]["2"]}
+    assert len(standin.requests) == 1
+
+
+def test_one_stale_quote_is_fetched_on_its_own(standin, makeGeapi):
+    geapi = makeGeapi()
+    geapi._saveSnapshot("latest")
+    age(geapi, SNAPSHOTS["latest"]["ttl"] + 30)
+    retrievedAt = geapi.snapshotCache["latest"]["snapshot"]["retrieved_at"]
+
+    standin.payloads["/latest"]["2"]["high"] += 5
+    quotes = geapi.getQuotes([2])
+
+    request = standin.requests[-1]
+    assert request["route"] == "/latest" and request["query"] == {"id": "2"}
+    assert request["bytes"] < 500
+    assert quotes == {2: standin.payloads["/latest"]["2"]}
+    # the all-items snapshot is left alone
+    assert geapi.snapshotCache["latest"]["snapshot"]["retrieved_at"] == retrievedAt
+
+
+def test_several_stale_quotes_refresh_the_snapshot_once(standin, makeGeapi):
+    geapi = makeGeapi()
+    quotes = geapi.getQuotes([2, 6, 8])
+
+    assert [r["query"] for r in standin.requestsTo("/latest")] == [{}]
+    assert quotes == {itemId: standin.payloads["/latest"][str(itemId)] for itemId in (2, 6, 8)}
+    assert geapi.getSnapshotAge("latest") <= 1
+
+
+def test_max_age_overrides_the_ttl(standin, makeGeapi):
+    geapi = makeGeapi()
+    geapi._saveSnapshot("latest")
+    age(geapi, 120)
+
+    geapi.getQuotes([2, 6], maxAge=60)
+
+    assert len(standin.requestsTo("/latest")) == 2
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+import requests
+
+from api import SNAPSHOTS
+
+DELAY = 1.0
+
+
+def test_refresh_all_fetches_concurrently(standin, makeGeapi):
+    standin.delay = DELAY
+    geapi = makeGeapi()
+
+    started = time.monotonic()
+    snapshots = geapi.refreshAll()
+    elapsed = time.monotonic() - started
+
+    assert set(snapshots) == set(SNAPSHOTS)
+    assert all(geapi.getCacheStats()[name]["fetches"] == 1 for name in SNAPSHOTS)
+    assert standin.maxInFlight > 1
+    # one after another would take len(SNAPSHOTS) * DELAY
+    assert elapsed < len(SNAPSHOTS) * DELAY / 2
+
+
+def test_refresh_all_skips_fresh_snapshots(standin, makeGeapi):
+    geapi = makeGeapi()
+    geapi.refreshAll(["latest", "fiveMinAve"])
+    served = len(standin.requests)
+
+    snapshots = geapi.refreshAll(["latest", "fiveMinAve"])
+
+    assert len(standin.requests) == served
+    assert snapshots["latest"] is geapi.getLatestSnapshot()
+
+
+def test_refresh_all_goes_through_the_rate_limit(standin, makeGeapi, fastLimiter):
+    fastLimiter.configure(10, 1)
+    waited = fastLimiter.getMetrics()["waited"]
+    geapi = makeGeapi()
+
+    started = time.monotonic()
+    geapi.refreshAll(["latest", "fiveMinAve", "oneHourAve"])
+
+    # one request right away, then one per 0.1s
+    assert time.monotonic() - started >= 0.2 - 0.02
+    assert fastLimiter.getMetrics()["waited"] - waited == 2
+
+
+def test_refresh_all_finishes_every_fetch_before_raising(standin, makeGeapi):
+    standin.delay = 0.1
+    standin.failures.add("/1h")
+    geapi = makeGeapi()
+
+    with pytest.raises(requests.HTTPError):
+        geapi.refreshAll(["latest", "oneHourAve", "sixHourAve"])
+
+    assert geapi.getCacheStats()["latest"]["fetches"] == 1
+    assert geapi.getCacheStats()["sixHourAve"]["fetches"] == 1
+    assert geapi.getSnapshotAge("oneHourAve") is None
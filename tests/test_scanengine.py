@@ -0,0 +1,137 @@
+import random
+
+import numpy as np
+import pytest
+
+from columnar import LATEST_COLUMNS, NULL, SnapshotArrays, intOrNull
+
+
+# moves prices, volumes and timestamps around and drops some fields / items, the way
+# successive /latest and /5m payloads differ
+def shuffleQuotes(standin, seed):
+    rng = random.Random(seed)
+
+    for quote in standin.payloads["/latest"].values():
+        if rng.random() < 0.3:
+            quote["high"] = max(1, int(quote["high"] * rng.uniform(0.9, 1.2))) if quote.get("high") else None
+            quote["highTime"] = (quote.get("highTime") or 0) + rng.randint(1, 300)
+        if rng.random() < 0.02:
+            quote.pop("lowTime", None)
+
+    fiveMin = standin.payloads["/5m"]
+    for itemId in rng.sample(sorted(fiveMin), 50):
+        del fiveMin[itemId]
+    for volumes in fiveMin.values():
+        if rng.random() < 0.3:
+            volumes["lowPriceVolume"] = rng.randint(0, 50000)
+
+
+def refetch(controller):
+    controller.geapi._saveSnapshot("latest")
+    controller.geapi._saveSnapshot("fiveMinAve")
+
+
+def test_numpy_engine_matches_python_loop(standin, makeController):
+    controller = makeController()
+
+    for seed in range(5):
+        numpyResult = controller.findWidestSpreads("numpy")
+        pythonResult = controller.findWidestSpreads("python")
+
+        assert not numpyResult.empty
+        assert numpyResult.equals(pythonResult)
+        assert list(numpyResult.dtypes) == list(pythonResult.dtypes)
+
+        shuffleQuotes(standin, seed)
+        refetch(controller)
+
+
+def test_every_engine_gives_the_same_result(standin, makeController):
+    controller = makeController(storage="sqlite")
+
+    for seed in range(3):
+        pythonResult = controller.findWidestSpreads("python")
+
+        assert not pythonResult.empty
+        assert controller.findWidestSpreads("numpy").equals(pythonResult)
+        # the stand-in serves ids ascending like the api, so item id order (sqlite) is
+        # the payload order
+        assert controller.findWidestSpreads("sqlite").equals(pythonResult)
+
+        shuffleQuotes(standin, seed)
+        refetch(controller)
+
+
+def test_sqlite_engine_needs_sqlite_storage(makeController):
+    with pytest.raises(ValueError):
+        makeController().findWidestSpreads("sqlite")
+
+
+def test_rescan_of_an_unchanged_snapshot_gives_the_same_result(makeController):
+    controller = makeController()
+    first = controller.findWidestSpreads("numpy")
+    second = controller.findWidestSpreads("numpy")
+
+    assert first.equals(second)
+    assert first is not second
+
+
+def test_snapshot_arrays_keep_payload_order_and_nulls():
+    snapshot = {"data": {
+        "5": {"high": 10, "low": None},
+        "2": {"high": 2.9, "low": True},
+        "9": {"low": 3},
+    }}
+
+    arrays = SnapshotArrays(snapshot, LATEST_COLUMNS)
+
+    assert arrays.ids.tolist() == [5, 2, 9]
+    assert arrays.keys == ["5", "2", "9"]
+    assert arrays.columns["high"].dtype == np.int64
+    for column in LATEST_COLUMNS:
+        assert arrays.columns[column].tolist() == [intOrNull(q.get(column)) for q in snapshot["data"].values()]
+    assert arrays.columns["high"].tolist() == [10, 2, NULL]
+
+
+def test_incremental_scan_matches_a_full_scan(standin, makeController):
+    controller = makeController()
+    previous = {}
+
+    for seed in range(5):
+        delta = controller.findWidestSpreadsIncremental()
+        full = controller.findWidestSpreads("python")
+
+        assert not full.empty
+        assert delta.result.equals(full)
+
+        # the deltas are exactly what moved between the two results
+        rows = {row["item_id"]: row for row in delta.result.to_dict("records")}
+        inserted = set(delta.inserted["item_id"]) if not delta.inserted.empty else set()
+        updated = set(delta.updated["item_id"]) if not delta.updated.empty else set()
+        assert inserted == rows.keys() - previous.keys()
+        assert set(delta.removed) == previous.keys() - rows.keys()
+        assert updated == {itemId for itemId in rows.keys() & previous.keys() if rows[itemId] != previous[itemId]}
+
+        previous = rows
+        shuffleQuotes(standin, seed)
+        refetch(controller)
+
+
+def test_incremental_scan_only_recomputes_changed_items(standin, makeController):
+    controller = makeController()
+    first = controller.findWidestSpreadsIncremental()
+    assert first.recomputed == len(standin.payloads["/latest"])
+
+    again = controller.findWidestSpreadsIncremental()
+    assert again.recomputed == 0
+    assert again.isEmpty()
+    assert again.result.equals(first.result)
+
+    # one item gets a new trade
+    itemId = str(first.result["item_id"].iloc[0])
+    standin.payloads["/latest"][itemId]["highTime"] += 60
+    refetch(controller)
+
+    delta = controller.findWidestSpreadsIncremental()
+    assert delta.recomputed == 1
+    assert delta.result.equals(controller.findWidestSpreads("python"))
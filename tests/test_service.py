@@ -0,0 +1,127 @@
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from service import ResultCache, ScanService, makeServer
+
+
+@pytest.fixture
+def service(makeController):
+    server = makeServer(makeController())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    host, port = server.server_address[:2]
+    server.url = f"http://{host}:{port}"
+    server.service = server.RequestHandlerClass.service
+    yield server
+
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def get(service, path, etag=None):
+    request = urllib.request.Request(service.url + path, headers={"If-None-Match": etag} if etag else {})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.headers.get("ETag"), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get("ETag"), e.read()
+
+
+def test_matching_etag_is_a_304_without_a_rebuild(service):
+    status, etag, body = get(service, "/scan?min_profit=100")
+    assert status == 200 and etag and body
+    builds = service.service.cache.builds
+
+    status, again, body = get(service, "/scan?min_profit=100", etag)
+
+    assert (status, again, body) == (304, etag, b"")
+    assert service.service.cache.builds == builds
+
+
+def test_new_snapshot_changes_the_etag(standin, service):
+    _, etag, _ = get(service, "/item/2")
+
+    standin.bump()
+    service.service.geapi._saveSnapshot("latest")
+    status, newEtag, _ = get(service, "/item/2", etag)
+
+    assert status == 200
+    assert newEtag != etag
+
+
+def test_star_only_matches_existing_resources(service):
+    assert get(service, "/item/2", "*")[0] == 304
+    assert get(service, "/item/999999999", "*")[0] == 404
+
+
+def test_bad_requests(service):
+    assert get(service, "/scan?min_profit=x")[0] == 400
+    assert get(service, "/item/abc")[0] == 400
+    assert get(service, "/watchlist")[0] == 400
+    assert get(service, "/nope")[0] == 404
+
+
+def test_revalidation_doesnt_wait_on_a_build(makeController):
+    service = ScanService(makeController())
+    etag, _ = service.handle("/item/2", {}, set())
+
+    started = threading.Event()
+    release = threading.Event()
+    scanBody = service._scanBody
+
+    def slowScanBody(versions, filters):
+        started.set()
+        release.wait(10)
+        return scanBody(versions, filters)
+
+    service._scanBody = slowScanBody
+    scan = threading.Thread(target=service.handle, args=("/scan", {}, set()))
+    scan.start()
+    try:
+        assert started.wait(10)
+
+        began = time.monotonic()
+        assert service.handle("/item/2", {}, {etag}) == (etag, None)
+        assert service.handle("/item/6", {}, set())[1]
+        assert time.monotonic() - began < 1
+    finally:
+        release.set()
+        scan.join()
+
+
+def test_one_build_per_key_under_concurrent_requests():
+    cache = ResultCache()
+    calls = []
+
+    def build():
+        calls.append(1)
+        time.sleep(0.05)
+        return b"body"
+
+    threads = [threading.Thread(target=cache.get, args=("key", build)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert cache.builds == 1 and cache.hits == 7
+    assert cache.building == {}
+
+
+def test_failed_build_is_retried():
+    cache = ResultCache()
+
+    def fail():
+        raise LookupError()
+
+    with pytest.raises(LookupError):
+        cache.get("key", fail)
+    assert cache.get("key", lambda: b"body") == b"body"
+    assert cache.building == {}
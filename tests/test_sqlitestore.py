@@ -0,0 +1,41 @@
+import sqlite3
+
+from sqlitestore import SqliteSnapshotStore
+
+OLD_SNAPSHOTS = """
+CREATE TABLE snapshots (
+    name TEXT PRIMARY KEY,
+    retrieved_at INTEGER NOT NULL,
+    timestamp INTEGER,
+    retries INTEGER NOT NULL DEFAULT 0,
+    ts INTEGER NOT NULL,
+    version INTEGER NOT NULL
+);
+INSERT INTO snapshots VALUES ('latest', 100, NULL, 0, 100, 1);
+"""
+
+
+def test_older_databases_get_the_validator_columns(tmp_path):
+    dbPath = tmp_path / "osrsgep.sqlite3"
+    with sqlite3.connect(dbPath) as conn:
+        conn.executescript(OLD_SNAPSHOTS)
+
+    store = SqliteSnapshotStore(dbPath)
+    store.write(tmp_path / "latest.json", {"retrieved_at": 200, "data": {}, "etag": '"abc"', "size": 10})
+
+    snapshot = store.read(tmp_path / "latest.json")
+    assert snapshot["etag"] == '"abc"'
+    assert snapshot["size"] == 10
+    assert "last_modified" not in snapshot
+
+
+def test_rewriting_a_bucket_replaces_its_rows(tmp_path):
+    store = SqliteSnapshotStore(tmp_path / "osrsgep.sqlite3")
+    basePath = tmp_path / "fiveMinAve.json"
+    quote = {"avgHighPrice": 5, "highPriceVolume": 1, "avgLowPrice": 4, "lowPriceVolume": 2}
+
+    store.write(basePath, {"retrieved_at": 200, "timestamp": 100, "data": {"2": quote, "6": quote}})
+    store.write(basePath, {"retrieved_at": 230, "timestamp": 100, "retries": 1, "data": {"2": quote}})
+
+    assert set(store.read(basePath)["data"]) == {"2"}
+    assert store.lookup("fiveMinAve", 6) is None